@@ -0,0 +1,101 @@
+"""
+Benchmark de búsqueda en memoria
+Compara memoria, latencia y recall@k de los formatos compactos (float16/int8)
+y del índice aproximado IVF contra la búsqueda exacta float32
+
+Uso:
+    python benchmark_busqueda.py                 # usa data/indice si existe
+    python benchmark_busqueda.py --sintetico 100000
+"""
+import sys
+import time
+import argparse
+sys.path.append('src')
+
+import numpy as np
+from similitud import SimilaritySearch, DEFAULT_INDEX_DIR
+from indice_ivf import IVFIndex
+
+
+def synthetic_corpus(n_docs: int, dim: int = 384, n_topics: int = 200, seed: int = 0) -> np.ndarray:
+    """Genera embeddings normalizados agrupados por temas (similar a un corpus real)"""
+    rng = np.random.default_rng(seed)
+    topics = rng.standard_normal((n_topics, dim)).astype(np.float32)
+    labels = rng.integers(0, n_topics, n_docs)
+    embeddings = topics[labels] + 0.8 * rng.standard_normal((n_docs, dim)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings
+
+
+def make_queries(embeddings: np.ndarray, n_queries: int, seed: int = 1) -> np.ndarray:
+    """Consultas = documentos del corpus con ruido (paráfrasis aproximadas)"""
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(embeddings), n_queries)
+    queries = np.asarray(embeddings[picks], dtype=np.float32)
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return queries
+
+
+def recall_at_k(reference: list, results: list, k: int) -> float:
+    """Fracción de los top-k exactos que aparecen en los top-k aproximados"""
+    hits = 0
+    total = 0
+    for (ref_idx, _), (res_idx, _) in zip(reference, results):
+        ref_set = set(ref_idx[:k].tolist())
+        hits += len(ref_set & set(res_idx[:k].tolist()))
+        total += len(ref_set)
+    return hits / total if total else 1.0
+
+
+def run_benchmark(embeddings: np.ndarray, n_queries: int = 200, top_k: int = 5):
+    documents = [{'chunk_id': str(i)} for i in range(len(embeddings))]
+    queries = make_queries(embeddings, n_queries)
+
+    configs = [
+        ('float32 (exacto)', lambda: SimilaritySearch()),
+        ('float16', lambda: SimilaritySearch(storage='float16')),
+        ('int8', lambda: SimilaritySearch(storage='int8')),
+        ('int8 + rerank x4', lambda: SimilaritySearch(storage='int8', rerank_factor=4)),
+        ('IVF nprobe=4', lambda: IVFIndex(nprobe=4)),
+        ('IVF nprobe=16', lambda: IVFIndex(nprobe=16)),
+    ]
+
+    print(f"\nCorpus: {embeddings.shape[0]} chunks x {embeddings.shape[1]} dims | "
+          f"{n_queries} consultas | top_k={top_k}\n")
+    print(f"{'Modo':<20} {'Memoria (MB)':>13} {'ms/consulta':>12} {'recall@k':>9}")
+    print("-" * 58)
+
+    reference = None
+    for name, build in configs:
+        search = build()
+        search.add_documents(embeddings, documents)
+
+        start = time.perf_counter()
+        # threshold=-1: se mide solo la calidad del ranking
+        results = [search.search_top_k(q, top_k=top_k, threshold=-1.0) for q in queries]
+        elapsed_ms = (time.perf_counter() - start) * 1000 / n_queries
+
+        if reference is None:
+            reference = results
+        recall = recall_at_k(reference, results, top_k)
+        print(f"{name:<20} {search.memory_bytes() / 1e6:>13.1f} {elapsed_ms:>12.3f} {recall:>9.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de búsqueda en memoria")
+    parser.add_argument('--sintetico', type=int, default=0,
+                        help="Número de chunks sintéticos (0 = usar el índice local)")
+    parser.add_argument('--consultas', type=int, default=200)
+    parser.add_argument('--top-k', type=int, default=5)
+    args = parser.parse_args()
+
+    embeddings = None
+    if not args.sintetico:
+        index = SimilaritySearch()
+        if index.load(DEFAULT_INDEX_DIR):
+            embeddings = np.asarray(index.embeddings, dtype=np.float32)
+    if embeddings is None:
+        embeddings = synthetic_corpus(args.sintetico or 50000)
+
+    run_benchmark(embeddings, n_queries=args.consultas, top_k=args.top_k)
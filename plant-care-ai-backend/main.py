@@ -4,13 +4,14 @@ API REST para análisis de plantas usando arquitectura multi-agente
 """
 import os
 import sys
+import json
+import time
+from typing import List
 from fastapi import FastAPI, File, UploadFile, Form, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import uvicorn
-from pathlib import Path
-import shutil
 from dotenv import load_dotenv
 
 # Agregar src al path
@@ -18,6 +19,8 @@ sys.path.append('src')
 sys.path.append('src/agentes')
 
 from agentes.agente_respuesta import ResponseAgent
+from concurrencia import concurrency_stats, shutdown as shutdown_concurrency
+from flujo_chat import ChatPipeline
 # Importar versión con LangChain para cumplir requisitos académicos
 try:
     from agentes.agente_respuesta_langchain import ResponseAgentLangChain
@@ -44,9 +47,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Directorio para uploads temporales
-UPLOAD_DIR = Path("uploads")
-UPLOAD_DIR.mkdir(exist_ok=True)
+# Bytes máximos por imagen subida (más grande = 413)
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(10 * 1024 * 1024)))
+
+# Máximo de imágenes y de bytes en total por petición a /api/analyze-plants-batch
+BATCH_MAX_IMAGES = int(os.getenv("BATCH_MAX_IMAGES", "50"))
+BATCH_MAX_BYTES = int(os.getenv("BATCH_MAX_BYTES", str(100 * 1024 * 1024)))
 
 # Inicializar sistema multi-agente (global)
 response_agent = None
@@ -54,11 +60,39 @@ response_agent_langchain = None
 gemini_available = False
 gemini_vision_available = False
 local_llm = None
+chat_pipeline = None
+
+
+def upload_size(image: UploadFile) -> int:
+    """
+    Tamaño de una imagen subida; 413 si supera UPLOAD_MAX_BYTES
+    
+    Se mide antes de decodificarla o leerla entera en memoria.
+    """
+    size = image.size
+    if size is None:
+        image.file.seek(0, os.SEEK_END)
+        size = image.file.tell()
+        image.file.seek(0)
+    if size > UPLOAD_MAX_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"La imagen {image.filename} supera el máximo de {UPLOAD_MAX_BYTES} bytes"
+        )
+    return size
+
+
+def disable_gemini_llm():
+    """Quota de Gemini agotada: deshabilitar el LLM para esta sesión"""
+    global gemini_available
+    response_agent.llm = None
+    gemini_available = False
+
 
 @app.on_event("startup")  # Deprecated pero funcional - mantener para compatibilidad
 async def startup_event():
     """Inicializa el sistema al arrancar"""
-    global response_agent, response_agent_langchain, gemini_available, gemini_vision_available, local_llm
+    global response_agent, response_agent_langchain, gemini_available, gemini_vision_available, local_llm, chat_pipeline
     print("\n🚀 Iniciando PlantCare AI Backend...")
     
     # Inicializar agente tradicional
@@ -90,6 +124,8 @@ async def startup_event():
     if not gemini_vision_available:
         print("⚠️ Gemini Vision no disponible - análisis de imágenes deshabilitado")
     
+    chat_pipeline = ChatPipeline(response_agent, local_llm, on_gemini_quota=disable_gemini_llm)
+    
     # Inicializar agente con LangChain (para cumplir requisitos académicos)
     if LANGCHAIN_AVAILABLE:
         try:
@@ -102,6 +138,12 @@ async def startup_event():
     print("✅ Backend listo para recibir peticiones\n")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Cierra el cliente HTTP compartido y el pool de hilos"""
+    await shutdown_concurrency()
+
+
 # Modelos Pydantic
 class HealthResponse(BaseModel):
     status: str
@@ -190,34 +232,17 @@ async def analyze_plant(
                 detail="El archivo debe ser una imagen"
             )
         
-        # Guardar imagen temporalmente con nombre único
-        import time
-        import uuid
-        file_extension = Path(image.filename).suffix or '.jpg'
-        unique_id = f"{int(time.time())}_{uuid.uuid4().hex[:8]}"
-        temp_file_path = UPLOAD_DIR / f"temp_plant_{unique_id}{file_extension}"
-        
-        with open(temp_file_path, "wb") as buffer:
-            shutil.copyfileobj(image.file, buffer)
-        
-        print(f"\n📸 Imagen recibida: {image.filename} (guardada como {temp_file_path.name})")
+        size = upload_size(image)
+        print(f"\n📸 Imagen recibida: {image.filename} ({size} bytes, sin copia a disco)")
         print(f"📝 Acciones del usuario: {user_actions if user_actions else '(ninguna)'}")
         
-        # Ejecutar sistema multi-agente
-        result = response_agent.execute(
-            image_path=str(temp_file_path),
+        # El archivo de la subida (SpooledTemporaryFile) va directo al agente de visión,
+        # que lo decodifica una vez en memoria; FastAPI lo cierra al terminar la petición
+        result = await response_agent.aexecute(
+            image=image.file,
             user_actions=user_actions
         )
         
-        # Limpiar archivo temporal (Windows fix: asegurar que está cerrado)
-        try:
-            if temp_file_path.exists():
-                import time
-                time.sleep(0.1)  # Pequeña pausa para Windows
-                temp_file_path.unlink()
-        except Exception as e:
-            print(f"⚠ No se pudo eliminar archivo temporal: {e}")
-        
         if result.get('success'):
             return JSONResponse(
                 status_code=200,
@@ -262,6 +287,70 @@ async def analyze_plant(
         )
 
 
+@app.post("/api/analyze-plants-batch")
+async def analyze_plants_batch(
+    images: List[UploadFile] = File(..., description="Imágenes de las plantas"),
+    user_actions: str = Form("", description="Contexto común a todas las plantas del lote")
+):
+    """
+    Analiza muchas imágenes en una sola petición (viveros, invernaderos)
+    
+    Parámetros:
+    - images: Archivos de imagen (JPEG, PNG), hasta BATCH_MAX_IMAGES
+    - user_actions: Texto describiendo qué se ha hecho con las plantas
+    
+    Retorna (application/x-ndjson, una línea JSON por imagen en cuanto termina):
+    - {"index", "filename", ...mismo formato que /api/analyze-plant}
+    - Una última línea {"done": true, "total", "succeeded", "seconds"}
+    """
+    if not gemini_vision_available:
+        raise HTTPException(
+            status_code=503,
+            detail={
+                "error": "image_analysis_unavailable",
+                "message": "El análisis de imágenes no está disponible en este momento. Por favor, usa el chat de texto para hacer preguntas sobre cuidado de plantas."
+            }
+        )
+    if len(images) > BATCH_MAX_IMAGES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Máximo {BATCH_MAX_IMAGES} imágenes por lote"
+        )
+    for image in images:
+        if not image.content_type or not image.content_type.startswith('image/'):
+            raise HTTPException(
+                status_code=400,
+                detail=f"El archivo {image.filename} debe ser una imagen"
+            )
+    total_bytes = sum(upload_size(image) for image in images)
+    if total_bytes > BATCH_MAX_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"El lote supera el máximo de {BATCH_MAX_BYTES} bytes"
+        )
+    
+    # Leer los bytes antes de responder: FastAPI cierra las subidas al salir del
+    # handler, antes de que StreamingResponse termine de enviar el cuerpo
+    filenames = [image.filename for image in images]
+    contents = [await image.read() for image in images]
+    
+    print(f"\n📸 Lote recibido: {len(contents)} imágenes ({total_bytes} bytes)")
+    print(f"📝 Acciones del usuario: {user_actions if user_actions else '(ninguna)'}")
+    
+    async def results():
+        start = time.perf_counter()
+        succeeded = 0
+        async for index, result in response_agent.aexecute_batch(contents, user_actions):
+            succeeded += bool(result.get('success'))
+            yield json.dumps({'index': index, 'filename': filenames[index], **result}, ensure_ascii=False) + "\n"
+        elapsed = time.perf_counter() - start
+        print(f"✅ Lote completado: {succeeded}/{len(contents)} en {elapsed:.1f}s")
+        yield json.dumps({'done': True, 'total': len(contents), 'succeeded': succeeded,
+                          'seconds': round(elapsed, 2)}) + "\n"
+    
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
 @app.post("/api/chat")
 async def chat(request: ChatRequest):
     """
@@ -274,843 +363,22 @@ async def chat(request: ChatRequest):
     Retorna:
     - Respuesta del agente basada en la base de conocimiento
     """
-    global local_llm
     try:
         print(f"\n💬 Chat request recibido")
         print(f"📝 Mensaje: {request.message}")
         print(f"📚 Historial: {len(request.history)} mensajes")
         
-        # Usar el knowledge agent para buscar información relevante
-        knowledge_agent = response_agent.knowledge_agent
-        
-        # Verificar si la pregunta es sobre plantas ANTES de buscar
-        message_lower = request.message.lower().strip()
-        
-        # Detectar preguntas conceptuales generales que no son sobre cuidado de plantas
-        conceptual_questions = [
-            'que es una', 'que es un', 'que es el', 'que es la', 'que son las', 'que son los',
-            'que significa', 'definicion', 'definición', 'concepto de', 'que quiere decir'
-        ]
-        
-        is_conceptual_general = any(pattern in message_lower for pattern in conceptual_questions)
-        
-        # Palabras clave específicas de cuidado de plantas (no solo palabras relacionadas)
-        plant_care_keywords = ['riego', 'cuidado', 'cuidar', 'mantener', 'regar', 'suelo', 'tierra',
-                               'luz', 'sol', 'sombra', 'maceta', 'trasplante', 'poda', 'fertilizante',
-                               'enfermedad', 'plaga', 'problema', 'hoja amarilla', 'hoja marron',
-                               'como cuidar', 'como mantener', 'como regar', 'cuando regar',
-                               'suculenta', 'cactus', 'bonsai', 'orquidea', 'helecho']
-        
-        # Verificar si es una pregunta sobre cuidado de plantas específicamente
-        is_plant_care_question = any(keyword in message_lower for keyword in plant_care_keywords)
-        
-        # Si es una pregunta conceptual general sin contexto de cuidado, responder directamente
-        if is_conceptual_general and not is_plant_care_question:
-            return JSONResponse(
-                status_code=200,
-                content={
-                    "success": True,
-                    "response": "Soy un asistente especializado en el cuidado práctico de plantas. Puedo ayudarte con:\n\n• Cómo cuidar diferentes tipos de plantas\n• Problemas comunes y sus soluciones\n• Recomendaciones de riego, luz y suelo\n• Identificación de problemas de salud\n• Propagación y trasplante\n\nSi tienes una pregunta específica sobre cómo cuidar una planta, estaré encantado de ayudarte. Por ejemplo: '¿Cómo cuido una suculenta?' o '¿Cuándo debo regar mi planta?'"
-                }
-            )
-        
-        # Verificar si tiene palabras relacionadas con plantas (para búsqueda)
-        plant_keywords = ['planta', 'flor', 'hoja', 'jardín', 'verde', 'semilla', 'raíz', 'tallo']
-        has_plant_keyword = any(keyword in message_lower for keyword in plant_keywords)
-        
-        # Si no tiene ninguna relación con plantas, responder directamente
-        if not has_plant_keyword and not is_plant_care_question:
-            return JSONResponse(
-                status_code=200,
-                content={
-                    "success": True,
-                    "response": "Lo siento, pero esa pregunta no está relacionada con plantas. Soy un asistente especializado en cuidado de plantas. Puedo ayudarte con:\n\n• Identificación de plantas\n• Cuidado y mantenimiento\n• Problemas de salud de plantas\n• Recomendaciones de riego, luz y suelo\n• Tratamiento de plagas\n\n¿Tienes alguna pregunta sobre plantas que pueda ayudarte a resolver?"
-                }
-            )
-        
-        # Buscar en la base de conocimiento
-        documents = knowledge_agent.search_direct(request.message, top_k=5)
-        
-        # Debug: mostrar documentos encontrados
-        if documents:
-            print(f"📊 Documentos encontrados: {len(documents)}")
-            for i, doc in enumerate(documents[:3]):
-                print(f"  Doc {i+1}: relevancia={doc['relevance_score']:.3f}, fuente={doc.get('source', 'N/A')[:50]}")
-                print(f"    Texto preview: {doc.get('text', '')[:100]}...")
-        else:
-            print("⚠️ No se encontraron documentos")
+        # Recuperación, contexto y relevancia se calculan una vez y se reutilizan
+        # en toda la cascada Gemini → LLM local → documentos → demo
+        response_text = await chat_pipeline.run(request.message, request.history)
         
-        # Verificar relevancia de los documentos encontrados
-        if documents:
-            max_relevance = max([d['relevance_score'] for d in documents])
-            print(f"📈 Relevancia máxima: {max_relevance:.3f}")
-            # Si la relevancia es muy baja (< 0.3), los documentos probablemente no son relevantes
-            if max_relevance < 0.3:
-                print(f"⚠️ Relevancia máxima muy baja: {max_relevance:.3f}")
-                # Aún así, intentar usar los documentos si hay alguno con relevancia > 0.25
-                if max_relevance >= 0.25:
-                    print(f"📝 Usando documentos con relevancia baja pero aceptable")
-                else:
-                    return JSONResponse(
-                        status_code=200,
-                        content={
-                            "success": True,
-                            "response": f"Lo siento, no encontré información específica sobre '{request.message}' en mi base de conocimiento sobre cuidado de plantas. Puedo ayudarte con:\n\n• Cuidado de suculentas, cactus, plantas de interior\n• Problemas comunes de plantas\n• Riego, luz y suelo\n• Propagación y trasplante\n\n¿Te gustaría hacer una pregunta más específica sobre cuidado de plantas? Por ejemplo: '¿Cómo cuido una suculenta?'"
-                        }
-                    )
-        
-        # Construir contexto del historial
-        history_context = ""
-        if request.history:
-            history_context = "\n".join([
-                f"{'Usuario' if msg.role == 'user' else 'Asistente'}: {msg.content}"
-                for msg in request.history[-6:]  # Últimos 6 mensajes
-            ])
-        
-        # Construir contexto de conocimiento (texto completo de documentos más relevantes)
-        knowledge_context = ""
-        if documents:
-            # Limpiar el texto de los documentos antes de pasarlo al LLM
-            import re
-            cleaned_docs = []
-            for doc in documents[:3]:  # Top 3 documentos
-                doc_text = doc['text']
-                # Limpiar markdown de los documentos también
-                doc_text = re.sub(r'^#{1,6}\s+', '', doc_text, flags=re.MULTILINE)
-                doc_text = re.sub(r'#{1,6}\s+', '', doc_text)
-                # Limpiar puntos suspensivos
-                doc_text = re.sub(r'\.\.\.+', '', doc_text)
-                cleaned_docs.append({
-                    'text': doc_text,
-                    'score': doc['relevance_score']
-                })
-            
-            # Usar texto limpio pero organizado
-            knowledge_context = "\n\n--- INFORMACIÓN DE REFERENCIA ---\n\n".join([
-                f"Fuente {i+1} (Relevancia: {doc['score']:.2f}):\n{doc['text']}"
-                for i, doc in enumerate(cleaned_docs)
-            ])
-        else:
-            # No se encontraron documentos relevantes
-            knowledge_context = "No se encontró información relevante en la base de conocimiento sobre esta pregunta."
-        
-        # Usar LLM para generar respuesta
-        if response_agent.llm:
-            print("🤖 Usando LLM para generar respuesta")
-            prompt = f"""Eres un experto en cuidado de plantas hablando directamente con un amigo que te pregunta sobre plantas. Responde de forma completamente natural y conversacional.
-
-⚠️ REGLAS ABSOLUTAS - NO PUEDES ROMPER ESTAS:
-1. NUNCA uses símbolos # ## ### #### ##### ###### en tu respuesta - está completamente prohibido
-2. NUNCA copies texto directamente - SIEMPRE explica con tus propias palabras de forma natural
-3. NUNCA uses frases como "Basándome en", "Según", "De acuerdo a" - responde directamente
-4. NUNCA dejes respuestas incompletas o truncadas - completa TODO lo que vas a explicar
-5. NUNCA uses formato técnico o de documento - solo lenguaje conversacional normal
-
-FORMATO DE RESPUESTA CORRECTO:
-- Comienza respondiendo directamente la pregunta
-- Usa párrafos normales y fluidos (no títulos, no secciones)
-- Si hay pasos o listas, usa viñetas (•) o números (1. 2. 3.) de forma natural dentro del texto
-- Explica todo completamente antes de terminar
-- Puedes usar emojis ocasionalmente (🌱💧☀️🌿)
-- Termina con una pregunta amigable opcional
-
-EJEMPLO INCORRECTO (NO HAGAS ESTO):
-"# Cuidado de Suculentas
-## Descripción General
-Las suculentas son plantas que almacenan agua...
-## Propagación
-1. Usar tierra..."
-
-EJEMPLO CORRECTO (HAZ ESTO):
-"Las suculentas son plantas increíbles que almacenan agua en sus hojas y tallos, lo que las hace muy resistentes. Son perfectas para principiantes porque requieren muy poco mantenimiento.
-
-Para cuidarlas correctamente, aquí tienes lo más importante:
-
-• Riego: Solo riega cuando la tierra esté completamente seca. En invierno puede ser cada 2-4 semanas.
-
-• Luz: Necesitan al menos 6 horas de luz solar directa al día.
-
-• Suelo: Usa una mezcla especial para cactus con buen drenaje.
-
-Si quieres propagarlas, puedes cortar una hoja, dejarla secar unos días, y luego plantarla. En 4-12 semanas deberías ver raíces nuevas.
-
-¿Te gustaría saber más sobre algún aspecto específico?"
-
-HISTORIAL DE CONVERSACIÓN:
-{history_context if history_context else "Primera pregunta del usuario."}
-
-INFORMACIÓN DE REFERENCIA DE SUPABASE (usa esto SOLO para entender el tema, luego explica TODO con tus propias palabras de forma natural):
-{knowledge_context}
-
-⚠️ IMPORTANTE: NO copies texto directamente de la información de referencia. NO uses títulos como "Descripción General", "Propagación por Semillas", "Ventajas", "Desventajas", etc. Explica TODO con tus propias palabras de forma conversacional y natural.
-
-PREGUNTA DEL USUARIO: {request.message}
-
-IMPORTANTE: Responde SOLO con texto normal, sin símbolos #, sin copiar texto, explicando todo con tus propias palabras de forma natural y completa. Responde ahora:"""
-
-            try:
-                # Configurar parámetros para respuestas más completas y naturales
-                import google.generativeai as genai
-                try:
-                    generation_config = genai.types.GenerationConfig(
-                        temperature=0.9,  # Más creatividad para respuestas naturales y parafraseadas
-                        top_p=0.95,
-                        top_k=40,
-                        max_output_tokens=2048,  # Respuestas más largas y completas
-                    )
-                except:
-                    # Fallback si GenerationConfig no está disponible
-                    generation_config = {
-                        "temperature": 0.9,
-                        "top_p": 0.95,
-                        "top_k": 40,
-                        "max_output_tokens": 2048,
-                    }
-                
-                # Intentar generar respuesta hasta 2 veces si contiene markdown
-                max_attempts = 2
-                response_text = None
-                
-                for attempt in range(max_attempts):
-                    response = response_agent.llm.generate_content(
-                        prompt,
-                        generation_config=generation_config
-                    )
-                    response_text = response.text.strip()
-                    
-                    # Verificar si tiene markdown
-                    if not re.search(r'#{1,6}\s+', response_text):
-                        break  # Respuesta limpia, salir del loop
-                    elif attempt < max_attempts - 1:
-                        print(f"⚠️ Intento {attempt + 1}: Respuesta contiene markdown, regenerando...")
-                        # Agregar instrucción adicional al prompt
-                        prompt += "\n\nRECUERDA: NO uses símbolos # en tu respuesta. Responde solo con texto normal."
-                    else:
-                        print("⚠️ Respuesta aún contiene markdown después de múltiples intentos")
-                
-                if not response_text:
-                    response_text = response.text.strip()
-                
-                # Validar si la respuesta contiene markdown - si es así, limpiar agresivamente
-                import re
-                has_markdown = bool(re.search(r'#{1,6}\s+', response_text))
-                
-                if has_markdown:
-                    print("⚠️ Respuesta contiene markdown, aplicando limpieza agresiva...")
-                
-                # Limpieza MUY agresiva de markdown y texto truncado
-                
-                # PRIMERO: Detectar y eliminar fragmentos que parecen venir directamente de documentos
-                # Patrones que indican texto copiado de documentos
-                document_patterns = [
-                    r'Cuidado de [A-ZÁÉÍÓÚÑ][a-záéíóúñ\s]+ Descripción General',
-                    r'Descripción General[:\s]*',
-                    r'Propagación por Semillas[:\s]*',
-                    r'Ventajas[:\s]*-',
-                    r'Desventajas[:\s]*-',
-                    r'Método Básico[:\s]*\d+\.',
-                    r'Problemas Comunes[:\s]*-',
-                    r'Trasplante Frecuencia[:\s]*-',
-                    r'Procedimiento[:\s]*\d+\.',
-                ]
-                for pattern in document_patterns:
-                    response_text = re.sub(pattern, '', response_text, flags=re.IGNORECASE | re.MULTILINE)
-                
-                # Eliminar líneas que son claramente títulos de documentos
-                lines = response_text.split('\n')
-                cleaned_lines = []
-                skip_until_content = False
-                for line in lines:
-                    stripped = line.strip()
-                    # Detectar títulos de documentos comunes
-                    if any(title in stripped for title in ['Descripción General', 'Propagación por Semillas', 
-                                                           'Ventajas', 'Desventajas', 'Método Básico', 
-                                                           'Problemas Comunes', 'Trasplante Frecuencia', 'Procedimiento']):
-                        skip_until_content = True
-                        continue
-                    # Si encontramos contenido real después de un título, dejar de saltar
-                    if skip_until_content and len(stripped) > 20 and not re.match(r'^[\d\.\-\•\*]+', stripped):
-                        skip_until_content = False
-                    if not skip_until_content:
-                        cleaned_lines.append(line)
-                response_text = '\n'.join(cleaned_lines)
-                
-                # Eliminar TODOS los headers de markdown (# ## ### #### ##### ######) - múltiples pasos
-                response_text = re.sub(r'^#{1,6}\s+', '', response_text, flags=re.MULTILINE)
-                response_text = re.sub(r'#{1,6}\s+', '', response_text)  # En cualquier lugar
-                response_text = re.sub(r'#+', '', response_text)  # Cualquier secuencia de #
-                
-                # Eliminar puntos suspensivos (truncados)
-                response_text = re.sub(r'\.\.\.+', '', response_text)
-                response_text = re.sub(r'\.\.\.\s*$', '', response_text, flags=re.MULTILINE)
-                
-                # Eliminar frases genéricas comunes
-                phrases_to_remove = [
-                    r'Basándome en la información disponible[:\s]*',
-                    r'Según los documentos[:\s]*',
-                    r'Según la información[:\s]*',
-                    r'De acuerdo a[:\s]*',
-                    r'Basándome en[:\s]*',
-                    r'De acuerdo con[:\s]*',
-                    r'Con base en[:\s]*',
-                    r'Propagación por Semillas',
-                    r'Ventajas',
-                    r'Desventajas',
-                    r'Método Básico'
-                ]
-                for phrase in phrases_to_remove:
-                    response_text = re.sub(phrase, '', response_text, flags=re.IGNORECASE)
-                
-                # Procesar líneas para eliminar formato técnico y fragmentos de documentos
-                lines = response_text.split('\n')
-                cleaned_lines = []
-                skip_next = False
-                
-                # Lista de frases que indican texto copiado de documentos
-                document_indicators = [
-                    'Descripción General', 'Propagación por Semillas', 'Ventajas', 'Desventajas',
-                    'Método Básico', 'Problemas Comunes', 'Trasplante Frecuencia', 'Procedimiento',
-                    'Cuidado de Suculentas', 'Cuidado de Cactus', 'Plantas de Interior Comunes'
-                ]
-                
-                for i, line in enumerate(lines):
-                    stripped = line.strip()
-                    
-                    # Saltar líneas vacías
-                    if not stripped:
-                        if cleaned_lines and cleaned_lines[-1].strip():  # Solo agregar si la anterior no estaba vacía
-                            cleaned_lines.append('')
-                        continue
-                    
-                    # Eliminar líneas que contienen indicadores de documentos
-                    if any(indicator in stripped for indicator in document_indicators):
-                        # Si es solo el título sin contenido adicional, saltarlo
-                        if len(stripped) < 50 or stripped in document_indicators:
-                            continue
-                        # Si tiene contenido adicional, intentar limpiarlo
-                        for indicator in document_indicators:
-                            stripped = stripped.replace(indicator, '').strip()
-                    
-                    # Eliminar líneas que son solo números, viñetas o muy cortas
-                    if re.match(r'^[\d\.\-\•\*]+$', stripped) or len(stripped) < 4:
-                        continue
-                    
-                    # Eliminar líneas que parecen títulos técnicos (todo en mayúsculas y cortas)
-                    if stripped.isupper() and len(stripped) < 50 and len(stripped.split()) < 5:
-                        continue
-                    
-                    # Si la línea anterior era un número/viñeta y esta parece ser continuación, unirlas
-                    if cleaned_lines and re.match(r'^\d+\.', cleaned_lines[-1].strip()):
-                        cleaned_lines[-1] += ' ' + stripped
-                    else:
-                        cleaned_lines.append(stripped if stripped else line)
-                
-                response_text = '\n'.join(cleaned_lines)
-                
-                # Limpiar espacios múltiples y saltos de línea
-                response_text = re.sub(r'\n{3,}', '\n\n', response_text)
-                response_text = re.sub(r' {2,}', ' ', response_text)
-                response_text = response_text.strip()
-                
-                # Si la respuesta todavía contiene markdown después de la limpieza, eliminarlo completamente
-                if '#' in response_text:
-                    # Dividir por líneas y eliminar las que tienen # o que parecen títulos
-                    final_lines = []
-                    for line in response_text.split('\n'):
-                        stripped = line.strip()
-                        # Eliminar líneas con # o que parecen títulos técnicos
-                        if '#' not in stripped and not re.match(r'^[A-ZÁÉÍÓÚÑ\s]{3,50}$', stripped):
-                            # También eliminar líneas que son solo palabras en mayúsculas (títulos)
-                            if not (stripped.isupper() and len(stripped.split()) < 5):
-                                final_lines.append(line)
-                    response_text = '\n'.join(final_lines).strip()
-                
-                # Eliminar frases específicas que aparecen en las respuestas problemáticas
-                problematic_phrases = [
-                    'Propagación por Semillas',
-                    'Ventajas',
-                    'Desventajas',
-                    'Método Básico',
-                    'Descripción General',
-                    'Cuidado de Suculentas',
-                    'Cuidado de Cactus',
-                    'Plantas de Interior Comunes',
-                ]
-                for phrase in problematic_phrases:
-                    # Eliminar la frase completa y su contexto
-                    response_text = re.sub(rf'^{re.escape(phrase)}[:\s]*\n?', '', response_text, flags=re.MULTILINE | re.IGNORECASE)
-                    response_text = re.sub(rf'\n{re.escape(phrase)}[:\s]*\n?', '\n', response_text, flags=re.IGNORECASE)
-                    # Eliminar también cuando aparece en medio de una línea
-                    response_text = re.sub(rf'{re.escape(phrase)}[:\s]*', '', response_text, flags=re.IGNORECASE)
-                
-                # LIMPIEZA AGRESIVA: Detectar y eliminar fragmentos copiados de documentos
-                # Primero, detectar patrones específicos de texto copiado
-                
-                # Patrón 1: "Cuidado de X Descripción General" seguido de texto técnico
-                response_text = re.sub(
-                    r'Cuidado de [A-ZÁÉÍÓÚÑ][a-záéíóúñ\s]+ Descripción General[^\n]*\n?',
-                    '',
-                    response_text,
-                    flags=re.IGNORECASE | re.MULTILINE
-                )
-                
-                # Patrón 2: Líneas que empiezan con títulos técnicos conocidos
-                technical_titles = [
-                    r'^Descripción General[:\s]*',
-                    r'^Propagación por Semillas[:\s]*',
-                    r'^Ventajas[:\s]*-',
-                    r'^Desventajas[:\s]*-',
-                    r'^Método Básico[:\s]*',
-                    r'^Problemas Comunes[:\s]*-',
-                    r'^Trasplante Frecuencia[:\s]*-',
-                    r'^Procedimiento[:\s]*\d+\.',
-                    r'^Cuidado de Suculentas[:\s]*',
-                    r'^Cuidado de Cactus[:\s]*',
-                ]
-                for pattern in technical_titles:
-                    response_text = re.sub(pattern, '', response_text, flags=re.MULTILINE | re.IGNORECASE)
-                
-                # Patrón 3: Fragmentos que parecen listas técnicas copiadas
-                # Detectar líneas que son solo "número. texto corto" o "guion texto corto"
-                lines = response_text.split('\n')
-                cleaned_final = []
-                skip_technical_block = False
-                
-                for i, line in enumerate(lines):
-                    stripped = line.strip()
-                    if not stripped:
-                        if cleaned_final and cleaned_final[-1].strip():
-                            cleaned_final.append('')
-                        skip_technical_block = False
-                        continue
-                    
-                    # Detectar inicio de bloque técnico (títulos conocidos)
-                    if any(title in stripped for title in ['Descripción General', 'Propagación por Semillas', 
-                                                           'Ventajas', 'Desventajas', 'Método Básico', 
-                                                           'Problemas Comunes', 'Trasplante Frecuencia', 'Procedimiento']):
-                        skip_technical_block = True
-                        continue
-                    
-                    # Si estamos en un bloque técnico, saltar líneas que parecen técnicas
-                    if skip_technical_block:
-                        # Detectar si la línea es parte de una lista técnica
-                        is_technical_line = (
-                            re.match(r'^[\d\.\-\•\*]+\s+[A-Z]', stripped) or  # Empieza con número/guion y mayúscula
-                            re.match(r'^[A-ZÁÉÍÓÚÑ][a-záéíóúñ\s]+:\s*[A-Z]', stripped) or  # "Título: Texto"
-                            (stripped.count('- ') > 0 and len(stripped) < 80) or  # Lista con guiones corta
-                            (re.match(r'^\d+\.\s+', stripped) and len(stripped) < 50)  # Pasos numerados cortos
-                        )
-                        if is_technical_line:
-                            continue
-                        else:
-                            # Si encontramos texto normal, salir del bloque técnico
-                            skip_technical_block = False
-                    
-                    # Si la línea empieza con un número y punto, verificar que tenga suficiente contenido
-                    if re.match(r'^\d+\.\s+', stripped):
-                        content = re.sub(r'^\d+\.\s+', '', stripped)
-                        # Solo mantener si tiene contenido sustancial Y no parece copiado
-                        if len(content) > 15 and not any(indicator in content for indicator in 
-                                                         ['Corte limpio', 'horizontal ambos', 'Sacar de maceta']):
-                            cleaned_final.append(line)
-                    elif stripped and not re.match(r'^[\d\.\-\•\*]+$', stripped):
-                        # Verificar que no sea un fragmento técnico aislado
-                        if not (len(stripped) < 30 and any(indicator in stripped for indicator in 
-                                                          ['Corte limpio', 'horizontal ambos', 'Quemaduras solares',
-                                                           'Cochinillas y áfidos', 'Hojas blandas'])):
-                            cleaned_final.append(line)
-                
-                response_text = '\n'.join(cleaned_final).strip()
-                
-                # Eliminar fragmentos específicos problemáticos que se detectaron
-                problematic_fragments = [
-                    r'Corte limpio horizontal ambos \d+',
-                    r'Cuidado de Suculentas Descripción General',
-                    r'Hojas blandas y amarillas desde la base',
-                    r'Quemaduras solares: Manchas marrones',
-                ]
-                for fragment in problematic_fragments:
-                    response_text = re.sub(fragment, '', response_text, flags=re.IGNORECASE)
-                
-                # Detectar y eliminar bloques de texto que parecen venir directamente de documentos
-                # Dividir en párrafos y analizar cada uno
-                paragraphs = response_text.split('\n\n')
-                cleaned_paragraphs = []
-                for para in paragraphs:
-                    para_stripped = para.strip()
-                    if not para_stripped:
-                        continue
-                    
-                    # Detectar párrafos que son claramente copiados de documentos
-                    # Si contiene múltiples indicadores de documentos o estructura técnica
-                    document_indicators_count = sum(1 for indicator in [
-                        'Descripción General', 'Propagación por Semillas', 'Ventajas', 'Desventajas',
-                        'Método Básico', 'Problemas Comunes', 'Trasplante Frecuencia', 'Procedimiento',
-                        'Cuidado de Suculentas', 'Cuidado de Cactus', 'Plantas de Interior Comunes',
-                        'Hojas blandas y amarillas', 'Quemaduras solares', 'Cochinillas y áfidos'
-                    ] if indicator in para_stripped)
-                    
-                    # Si tiene más de 1 indicador, probablemente es texto copiado
-                    if document_indicators_count > 1:
-                        print(f"⚠️ Detectado párrafo copiado de documento (indicadores: {document_indicators_count})")
-                        continue
-                    
-                    # Si el párrafo empieza con un título técnico conocido, saltarlo
-                    first_line = para_stripped.split('\n')[0].strip()
-                    if first_line in ['Descripción General', 'Propagación por Semillas', 'Ventajas', 
-                                     'Desventajas', 'Método Básico', 'Problemas Comunes', 
-                                     'Trasplante Frecuencia', 'Procedimiento']:
-                        continue
-                    
-                    # Si el párrafo es muy técnico y estructurado (muchos guiones o números), puede ser copiado
-                    if para_stripped.count('- ') > 3 and len(para_stripped.split('\n')) > 2:
-                        # Verificar si parece una lista técnica copiada
-                        lines_in_para = para_stripped.split('\n')
-                        technical_lines = sum(1 for line in lines_in_para if re.match(r'^[\s]*[-•]\s+[A-Z]', line))
-                        if technical_lines > 2:
-                            print(f"⚠️ Detectado párrafo con estructura técnica copiada")
-                            continue
-                    
-                    cleaned_paragraphs.append(para)
-                
-                response_text = '\n\n'.join(cleaned_paragraphs).strip()
-                
-                # Limpiar espacios múltiples y saltos de línea
-                response_text = re.sub(r'\n{3,}', '\n\n', response_text)
-                response_text = re.sub(r' {2,}', ' ', response_text)
-                response_text = response_text.strip()
-                
-                # LIMPIEZA FINAL: Eliminar cualquier fragmento restante que parezca copiado
-                # Dividir en oraciones y filtrar las que parecen fragmentos técnicos
-                sentences = re.split(r'[.!?]\s+', response_text)
-                cleaned_sentences = []
-                for sent in sentences:
-                    sent_stripped = sent.strip()
-                    if not sent_stripped or len(sent_stripped) < 10:
-                        continue
-                    
-                    # Detectar oraciones que son fragmentos técnicos
-                    is_fragment = (
-                        sent_stripped.startswith('Corte limpio') or
-                        sent_stripped.startswith('horizontal ambos') or
-                        sent_stripped.startswith('Sacar de maceta') or
-                        'Cuidado de Suculentas' in sent_stripped or
-                        'Cuidado de Cactus' in sent_stripped or
-                        'Descripción General' in sent_stripped or
-                        (len(sent_stripped) < 30 and any(indicator in sent_stripped for indicator in 
-                                                         ['Quemaduras solares', 'Cochinillas', 'Hojas blandas']))
-                    )
-                    
-                    if not is_fragment:
-                        cleaned_sentences.append(sent_stripped)
-                
-                if cleaned_sentences:
-                    response_text = '. '.join(cleaned_sentences)
-                    if response_text[-1] not in '.!?':
-                        response_text += '.'
-                else:
-                    # Si se eliminó todo, usar el texto original pero con limpieza básica
-                    response_text = re.sub(r'Cuidado de [A-ZÁÉÍÓÚÑ][a-záéíóúñ\s]+ Descripción General[^\n]*', '', response_text, flags=re.IGNORECASE)
-                    response_text = re.sub(r'Corte limpio horizontal ambos \d+', '', response_text, flags=re.IGNORECASE)
-                
-                # Si la respuesta termina abruptamente, agregar punto final
-                if response_text and response_text[-1] not in '.!?':
-                    response_text += '.'
-                
-                # Validación final - si todavía tiene problemas, intentar una limpieza más agresiva
-                if re.search(r'#{1,6}', response_text) or len(response_text) < 50:
-                    print("⚠️ Respuesta aún tiene problemas después de limpieza")
-                    # Eliminar completamente cualquier línea con #
-                    final_clean = []
-                    for line in response_text.split('\n'):
-                        if '#' not in line and len(line.strip()) > 5:
-                            final_clean.append(line)
-                    if final_clean:
-                        response_text = '\n'.join(final_clean).strip()
-                
-                print(f"✅ Respuesta del LLM generada ({len(response_text)} caracteres)")
-                
-                # Verificar si la respuesta indica que está fuera del conocimiento
-                if not documents or (documents and max([d['relevance_score'] for d in documents]) < 0.4):
-                    # Baja relevancia, verificar si la pregunta es sobre plantas
-                    if not any(word in request.message.lower() for word in ['planta', 'planta', 'flor', 'hoja', 'riego', 'cuidado', 'suelo', 'luz', 'agua', 'maceta', 'jardín', 'verde', 'semilla', 'raíz', 'tallo', 'bonsai', 'suculenta', 'cactus', 'tropical']):
-                        response_text = f"Lo siento, pero esa pregunta no está relacionada con plantas. Soy un asistente especializado en cuidado de plantas. Puedo ayudarte con:\n\n• Identificación de plantas\n• Cuidado y mantenimiento\n• Problemas de salud de plantas\n• Recomendaciones de riego, luz y suelo\n• Tratamiento de plagas\n\n¿Tienes alguna pregunta sobre plantas que pueda ayudarte a resolver?"
-                
-                return JSONResponse(
-                    status_code=200,
-                    content={
-                        "success": True,
-                        "response": response_text
-                    }
-                )
-            except Exception as e:
-                error_str = str(e)
-                print(f"❌ Error generando respuesta con LLM: {e}")
-                
-                # Detectar si es error de quota (429) o ResourceExhausted
-                is_quota_error = (
-                    "429" in error_str or 
-                    "ResourceExhausted" in error_str or 
-                    "quota" in error_str.lower() or
-                    "exceeded" in error_str.lower()
-                )
-                
-                if is_quota_error:
-                    print("⚠️ Quota de Gemini agotada - deshabilitando LLM para esta sesión")
-                    # Deshabilitar LLM para evitar más intentos
-                    response_agent.llm = None
-                    global gemini_available
-                    gemini_available = False
-                
-                import traceback
-                traceback.print_exc()
-                
-                # Fallback: Intentar LLM local primero, luego documentos
-                print("⚠️ Gemini LLM no disponible o falló")
-                
-                # Intentar usar LLM local si está disponible (ya declarado como global al inicio de la función)
-                if local_llm and local_llm.available:
-                    print(f"🤖 Intentando generar respuesta con LLM local ({local_llm.model})...")
-                    try:
-                        # Construir prompt similar al de Gemini pero más simple
-                        local_prompt = f"""Eres un experto en cuidado de plantas. Responde de forma natural y conversacional.
-
-HISTORIAL:
-{history_context if history_context else "Primera pregunta."}
-
-INFORMACIÓN DE REFERENCIA:
-{knowledge_context[:1500] if knowledge_context else "No hay información específica disponible."}
-
-PREGUNTA: {request.message}
-
-Responde de forma natural, sin usar símbolos #, sin copiar texto directamente. Explica con tus propias palabras:"""
-                        
-                        local_response = local_llm.generate(
-                            prompt=local_prompt,
-                            max_tokens=800,
-                            temperature=0.8
-                        )
-                        
-                        if local_response:
-                            # Aplicar limpieza básica
-                            local_response = re.sub(r'#{1,6}\s+', '', local_response)
-                            local_response = re.sub(r'\.\.\.+', '', local_response)
-                            local_response = re.sub(r'\s+', ' ', local_response).strip()
-                            
-                            if len(local_response) > 50:
-                                print(f"✅ Respuesta generada con LLM local ({len(local_response)} caracteres)")
-                                return JSONResponse(
-                                    status_code=200,
-                                    content={
-                                        "success": True,
-                                        "response": local_response
-                                    }
-                                )
-                    except Exception as e:
-                        print(f"⚠️ Error con LLM local: {e}")
-                
-                # Si LLM local falló o no está disponible, usar documentos o modo demo
-                print("📝 LLM local no disponible - usando procesador de documentos o modo demo")
-                if documents and max([d['relevance_score'] for d in documents]) >= 0.25:
-                    print(f"📝 Usando procesador inteligente de documentos con {len(documents)} documentos")
-                    
-                    try:
-                        from src.document_processor import DocumentProcessor
-                        processor = DocumentProcessor()
-                        response_text = processor.extract_relevant_info(request.message, documents)
-                        
-                        if response_text:
-                            # Limpiar respuesta final
-                            response_text = re.sub(r'\s+', ' ', response_text)
-                            if not response_text.endswith('.'):
-                                response_text += '.'
-                            response_text += '\n\n¿Te gustaría saber más sobre algún aspecto específico?'
-                            
-                            return JSONResponse(
-                                status_code=200,
-                                content={
-                                    "success": True,
-                                    "response": response_text
-                                }
-                            )
-                    except ImportError:
-                        print("⚠️ DocumentProcessor no disponible, usando método simple")
-                        # Fallback a método simple
-                        pass
-                    
-                    # Método simple si el procesador no está disponible
-                    import re
-                    relevant_docs = [d for d in documents if d['relevance_score'] >= 0.25]
-                    all_text = []
-                    for doc in relevant_docs[:3]:
-                        doc_text = doc['text']
-                        doc_text = re.sub(r'^#{1,6}\s+', '', doc_text, flags=re.MULTILINE)
-                        doc_text = re.sub(r'#{1,6}\s+', '', doc_text)
-                        doc_text = re.sub(r'\.\.\.+', '', doc_text)
-                        lines = [l.strip() for l in doc_text.split('\n') if l.strip() and len(l.strip()) > 10]
-                        doc_text = ' '.join(lines)
-                        if doc_text:
-                            all_text.append(doc_text[:500])
-                    
-                    if all_text:
-                        combined = ' '.join(all_text[:2])
-                        combined = re.sub(r'\s+', ' ', combined)
-                        response_text = combined[:800]
-                        if len(combined) > 800:
-                            response_text += '...'
-                        response_text += '\n\n¿Te gustaría saber más sobre algún aspecto específico?'
-                        
-                        return JSONResponse(
-                            status_code=200,
-                            content={
-                                "success": True,
-                                "response": response_text
-                            }
-                        )
-                
-                # Si no hay documentos relevantes, usar modo demo
-                print("📝 No se encontraron documentos relevantes - usando modo demo")
-                try:
-                    from demo_mode import get_demo_response
-                    response_text = get_demo_response(request.message)
-                    print("✅ Respuesta generada con modo demo")
-                    return JSONResponse(
-                        status_code=200,
-                        content={
-                            "success": True,
-                            "response": response_text
-                        }
-                    )
-                except ImportError:
-                    print("⚠️ Modo demo no disponible")
-                    return JSONResponse(
-                        status_code=200,
-                        content={
-                            "success": True,
-                            "response": "Lo siento, no encontré información específica sobre esa pregunta en mi base de conocimiento. Por favor, intenta reformular tu pregunta o pregunta sobre otro aspecto del cuidado de plantas."
-                        }
-                    )
-        else:
-            # Sin LLM, usar procesador inteligente de documentos
-            if documents and max([d['relevance_score'] for d in documents]) >= 0.25:
-                try:
-                    from src.document_processor import DocumentProcessor
-                    processor = DocumentProcessor()
-                    response_text = processor.extract_relevant_info(request.message, documents)
-                    
-                    if response_text:
-                        import re
-                        response_text = re.sub(r'\s+', ' ', response_text)
-                        if not response_text.endswith('.'):
-                            response_text += '.'
-                        response_text += '\n\n¿Te gustaría saber más sobre algún aspecto específico?'
-                        
-                        return JSONResponse(
-                            status_code=200,
-                            content={
-                                "success": True,
-                                "response": response_text
-                            }
-                        )
-                except ImportError:
-                    print("⚠️ DocumentProcessor no disponible, usando método simple")
-                    pass
-            
-            # Método simple o modo demo
-            if documents:
-                import re
-                # Combinar información de múltiples documentos
-                combined_info = []
-                for doc in documents[:3]:
-                    doc_text = doc['text']
-                    # Limpiar markdown
-                    doc_text = re.sub(r'^#{1,6}\s+', '', doc_text, flags=re.MULTILINE)
-                    doc_text = re.sub(r'#{1,6}\s+', '', doc_text)
-                    doc_text = re.sub(r'\.\.\.+', '', doc_text)
-                    # Eliminar líneas vacías o muy cortas
-                    lines = [l.strip() for l in doc_text.split('\n') if l.strip() and len(l.strip()) > 15]
-                    doc_text = ' '.join(lines)
-                    combined_info.append(doc_text)
-                
-                # Crear respuesta estructurada
-                full_text = ' '.join(combined_info)
-                
-                # Extraer información relevante según la pregunta
-                response_parts = []
-                
-                # Información general sobre suculentas
-                if 'suculent' in request.message.lower():
-                    response_parts.append("Las suculentas son plantas que almacenan agua en sus hojas y tallos, lo que las hace muy resistentes y perfectas para principiantes.")
-                
-                # Extraer información específica
-                topics = {
-                    'riego': ['riego', 'agua', 'regar', 'humedad'],
-                    'luz': ['luz', 'sol', 'iluminación', 'sombra'],
-                    'suelo': ['suelo', 'tierra', 'drenaje', 'maceta'],
-                    'temperatura': ['temperatura', 'frío', 'calor', 'clima'],
-                    'propagación': ['propagación', 'reproducir', 'semilla', 'esqueje']
-                }
-                
-                for topic, keywords in topics.items():
-                    relevant_sentences = []
-                    for sentence in full_text.split('.'):
-                        sentence = sentence.strip()
-                        if any(kw in sentence.lower() for kw in keywords) and 20 < len(sentence) < 200:
-                            relevant_sentences.append(sentence)
-                    
-                    if relevant_sentences:
-                        # Tomar las 2 más relevantes
-                        topic_info = '. '.join(relevant_sentences[:2])
-                        # Limpiar markdown residual
-                        topic_info = re.sub(r'#{1,6}\s+', '', topic_info)
-                        if topic_info:
-                            response_parts.append(topic_info + '.')
-                
-                # Si no encontramos información específica, usar las primeras oraciones útiles
-                if len(response_parts) < 2:
-                    sentences = [s.strip() for s in full_text.split('.') if 30 < len(s.strip()) < 250][:4]
-                    if sentences:
-                        response_parts.extend(sentences[:2])
-                
-                if response_parts:
-                    response_text = ' '.join(response_parts)
-                    # Limpieza final
-                    response_text = re.sub(r'#{1,6}\s+', '', response_text)
-                    response_text = re.sub(r'\.\.\.+', '', response_text)
-                    response_text = re.sub(r'\s+', ' ', response_text)
-                    if not response_text.endswith('.'):
-                        response_text += '.'
-                    response_text += '\n\n¿Te gustaría saber más sobre algún aspecto específico?'
-                else:
-                    # Fallback a modo demo
-                    try:
-                        from demo_mode import get_demo_response
-                        response_text = get_demo_response(request.message)
-                    except ImportError:
-                        response_text = "Encontré información sobre suculentas en mi base de conocimiento. Las suculentas requieren poco mantenimiento y son muy resistentes. ¿Te gustaría que te explique algún aspecto específico del cuidado de suculentas?"
-                
-                return JSONResponse(
-                    status_code=200,
-                    content={
-                        "success": True,
-                        "response": response_text
-                    }
-                )
-            else:
-                # Sin documentos, usar modo demo
-                try:
-                    from demo_mode import get_demo_response
-                    response_text = get_demo_response(request.message)
-                except ImportError:
-                    response_text = "No encontré información específica sobre esa pregunta. Por favor, intenta hacer preguntas sobre cuidado de plantas, identificación de especies, problemas comunes, o recomendaciones de mantenimiento."
-                
-                return JSONResponse(
-                    status_code=200,
-                    content={
-                        "success": True,
-                        "response": response_text
-                    }
-                )
+        return JSONResponse(
+            status_code=200,
+            content={
+                "success": True,
+                "response": response_text
+            }
+        )
     
     except Exception as e:
         print(f"❌ Error en chat: {e}")
@@ -1122,9 +390,54 @@ Responde de forma natural, sin usar símbolos #, sin copiar texto directamente.
         )
 
 
+def _sse(event: str, data: dict) -> str:
+    """Un evento server-sent events con datos JSON"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Chat con RAG en streaming: la respuesta se envía según la genera el LLM
+    
+    Parámetros: los mismos que /api/chat
+    
+    Retorna (text/event-stream):
+    - event: token, data {"text"} con cada trozo de la respuesta (ya sanitizado)
+    - event: done, data {"success": true, "response"} con la respuesta completa
+    - event: error, data {"message"} si algo falla
+    """
+    print(f"\n💬 Chat request recibido (streaming)")
+    print(f"📝 Mensaje: {request.message}")
+    print(f"📚 Historial: {len(request.history)} mensajes")
+    
+    async def events():
+        parts = []
+        try:
+            async for piece in chat_pipeline.stream(request.message, request.history):
+                parts.append(piece)
+                yield _sse("token", {"text": piece})
+            yield _sse("done", {"success": True, "response": "".join(parts)})
+        except Exception as e:
+            print(f"❌ Error en chat: {e}")
+            import traceback
+            traceback.print_exc()
+            yield _sse("error", {"message": f"Error procesando mensaje: {str(e)}"})
+    
+    # X-Accel-Buffering: que un proxy nginx no acumule los eventos
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 @app.get("/api/stats")
 async def get_stats():
     """Estadísticas del sistema"""
+    embedding_cache = None
+    vision_cache = None
+    if response_agent:
+        embedding_cache = response_agent.knowledge_agent.embedding_generator.cache_stats()
+        vision_cache = response_agent.vision_agent.cache.stats()
+    
     return {
         "total_agents": 4,
         "agents": [
@@ -1134,6 +447,11 @@ async def get_stats():
             "ResponseAgent (Orquestador LangChain)"
         ],
         "embedding_model": "sentence-transformers/all-MiniLM-L6-v2",
+        "embedding_cache": embedding_cache,
+        "vision_cache": vision_cache,
+        "chat": chat_pipeline.stats() if chat_pipeline else None,
+        "chat_cache": chat_pipeline.answer_cache.stats() if chat_pipeline else None,
+        "concurrency": concurrency_stats(),
         "llm": "Google Gemini Pro"
     }
 
@@ -1155,7 +473,9 @@ if __name__ == "__main__":
     print(f"  - GET  http://{host}:{port}/")
     print(f"  - GET  http://{host}:{port}/api/health")
     print(f"  - POST http://{host}:{port}/api/analyze-plant")
+    print(f"  - POST http://{host}:{port}/api/analyze-plants-batch")
     print(f"  - POST http://{host}:{port}/api/chat")
+    print(f"  - POST http://{host}:{port}/api/chat/stream")
     print(f"  - GET  http://{host}:{port}/api/stats")
     print(f"  - GET  http://{host}:{port}/docs (Swagger UI)")
     print("\n")
@@ -1,68 +1,207 @@
 """
 Script para procesar documentos e indexarlos en Supabase
+y en el índice local (usado por la búsqueda en memoria sin Supabase)
+
+Los documentos se procesan en flujo: extracción → chunking → embeddings → subida
+por lotes acotados, así la memoria no crece con el tamaño del corpus.
+
+Con --workers N la extracción y el chunking corren en N procesos y la subida en
+un pool de hilos, solapadas con los embeddings (ver src/ingesta_paralela.py).
+
+Al terminar guarda el manifiesto de indexación, así la primera ejecución de
+reindex_all.py --incremental ya puede trabajar por diferencias.
 """
+import os
 import sys
+import argparse
+from pathlib import Path
 sys.path.append('src')
 
 from extraccion import DataExtractor
-from chunking import TextChunker
-from embeddings import EmbeddingGenerator
+from chunking import TextChunker, embedding_text
+from embeddings import EmbeddingGenerator, DEFAULT_DISK_CACHE_DIR
 from vector_db import SupabaseVectorDB
+from similitud import IndexWriter, DEFAULT_INDEX_DIR
+from ingesta_paralela import ParallelIngestionPipeline
+from manifiesto import IndexManifest, DEFAULT_MANIFEST_FILE
+
+# Chunks por lote de embeddings/subida
+DEFAULT_BATCH_SIZE = 256
+# Documentos leídos por adelantado mientras se vectoriza el lote actual
+DEFAULT_PREFETCH = 8
+MANIFEST_PATH = os.path.join(DEFAULT_INDEX_DIR, DEFAULT_MANIFEST_FILE)
+
+
+def connect_supabase():
+    """Conecta a Supabase; retorna None si no está configurado"""
+    try:
+        return SupabaseVectorDB()
+    except Exception as e:
+        print(f"⚠ Error conectando a Supabase: {e}")
+        print(f"\n📝 NOTA: Si no has configurado Supabase:")
+        print(f"  1. Crea un proyecto en supabase.com")
+        print(f"  2. Ejecuta el SQL de creación de tablas (ver vector_db.py)")
+        print(f"  3. Agrega SUPABASE_URL y SUPABASE_KEY al .env")
+        print(f"\n  Por ahora, la búsqueda funcionará en memoria sin Supabase\n")
+        return None
+
+
+def new_manifest() -> IndexManifest:
+    """Manifiesto vacío: la ingesta completa lo vuelve a llenar archivo por archivo"""
+    manifest = IndexManifest(MANIFEST_PATH)
+    manifest.files = {}
+    return manifest
+
+
+def publish_manifest(manifest: IndexManifest, generator: EmbeddingGenerator, chunker: TextChunker,
+                     uploaded: bool):
+    """
+    Guarda el manifiesto si Supabase recibió todos los chunks
+    
+    Si la subida falló, el manifiesto anterior ya no describe la tabla: se borra
+    para que la siguiente reindexación incremental haga una pasada completa.
+    """
+    if uploaded:
+        manifest.save({'model_name': generator.model_name, **chunker.config()})
+    else:
+        Path(MANIFEST_PATH).unlink(missing_ok=True)
 
 
-def process_and_index_documents():
-    """Procesa todos los documentos y los indexa en Supabase"""
+def process_and_index_documents(batch_size: int = DEFAULT_BATCH_SIZE, prefetch: int = DEFAULT_PREFETCH):
+    """
+    Procesa todos los documentos y los indexa en Supabase y en el índice local
+    
+    Args:
+        batch_size: Chunks vectorizados y subidos por lote
+        prefetch: Documentos leídos por adelantado en un hilo de fondo
+    """
     print("\n" + "="*60)
     print("📚 PROCESANDO DOCUMENTOS DE CONOCIMIENTO")
     print("="*60 + "\n")
     
-    # 1. Extraer documentos
     extractor = DataExtractor(data_dir="data/plantas")
-    documents = extractor.extract_all_documents()
+    generator = EmbeddingGenerator(disk_cache_dir=DEFAULT_DISK_CACHE_DIR, track_truncation=True)
+    chunker = TextChunker.from_config(400, 50, generator.token_counter)
+    db = connect_supabase()
+    writer = IndexWriter(DEFAULT_INDEX_DIR, dimension=generator.embedding_dim)
+    manifest = new_manifest()
+    
+    stats = {'documents': 0, 'chunks': 0}
+    
+    def flush(batch):
+        """Vectoriza un lote y lo escribe en el índice local y en Supabase"""
+        nonlocal db
+        embeddings = generator.generate_embeddings_batch([embedding_text(chunk) for chunk in batch],
+                                                         show_progress_bar=False)
+        writer.append(embeddings, batch)
+        if db is not None:
+            try:
+                db.insert_chunks(batch, embeddings)
+            except Exception as e:
+                print(f"⚠ Error indexando en Supabase: {e}")
+                print(f"  Se continúa solo con el índice local")
+                db = None
+        stats['chunks'] += len(batch)
+        print(f"  🧮 {stats['chunks']} chunks vectorizados")
     
-    if not documents:
+    # Extracción → chunking → embeddings → subida, en lotes de batch_size chunks
+    pending = []
+    try:
+        for doc in extractor.iter_documents(prefetch=prefetch):
+            chunks = chunker.chunk_document(doc)
+            print(f"  ✓ {doc['filename']}: {len(chunks)} chunks")
+            manifest.update_file(doc, chunks)
+            stats['documents'] += 1
+            pending.extend(chunks)
+            while len(pending) >= batch_size:
+                flush(pending[:batch_size])
+                pending = pending[batch_size:]
+        if pending:
+            flush(pending)
+    except BaseException:
+        writer.abort()
+        raise
+    
+    if not stats['documents']:
+        writer.abort()
         print("⚠ No se encontraron documentos en data/plantas/")
         return
     
-    # 2. Dividir en chunks
-    print(f"\n📝 Dividiendo documentos en chunks...")
-    chunker = TextChunker(chunk_size=400, overlap=50)
-    
-    all_chunks = []
-    for doc in documents:
-        chunks = chunker.chunk_document(doc)
-        all_chunks.extend(chunks)
-        print(f"  ✓ {doc['filename']}: {len(chunks)} chunks")
+    # El índice local solo se publica al final (el anterior sigue válido hasta entonces)
+    writer.close()
+    publish_manifest(manifest, generator, chunker, uploaded=db is not None)
     
-    print(f"\n✅ Total chunks creados: {len(all_chunks)}")
+    print(f"\n✅ Documentos: {stats['documents']} | Chunks indexados: {stats['chunks']}")
+    generator.report_truncation()
+    generator.report_disk_cache(compact=True)
+    if db is not None:
+        print(f"✅ Indexación en Supabase completada")
     
-    # 3. Generar embeddings
-    print(f"\n🧮 Generando embeddings...")
-    generator = EmbeddingGenerator()
+    print("\n" + "="*60)
+    print("✅ PROCESAMIENTO COMPLETADO")
+    print("="*60 + "\n")
+
+
+def process_and_index_parallel(workers: int, batch_size: int = DEFAULT_BATCH_SIZE,
+                               upload_workers: int = 4):
+    """
+    Igual que process_and_index_documents pero con las etapas en paralelo
     
-    texts = [chunk['text'] for chunk in all_chunks]
-    embeddings = generator.generate_embeddings_batch(texts)
+    Args:
+        workers: Procesos de extracción + chunking
+        batch_size: Chunks por lote de embeddings/subida
+        upload_workers: Hilos de subida a Supabase
+    """
+    print("\n" + "="*60)
+    print("📚 PROCESANDO DOCUMENTOS DE CONOCIMIENTO (PARALELO)")
+    print("="*60 + "\n")
     
-    print(f"✅ Embeddings generados: {embeddings.shape}")
+    generator = EmbeddingGenerator(disk_cache_dir=DEFAULT_DISK_CACHE_DIR, track_truncation=True)
+    writer = IndexWriter(DEFAULT_INDEX_DIR, dimension=generator.embedding_dim)
+    chunker = TextChunker.from_config(400, 50, generator.token_counter)
+    manifest = new_manifest()
+    pipeline = ParallelIngestionPipeline(
+        data_dir="data/plantas", chunker=chunker,
+        extract_workers=workers, embed_batch_size=batch_size, upload_workers=upload_workers,
+        generator=generator, index_writer=writer, vector_db=connect_supabase(), manifest=manifest
+    )
     
-    # 4. Indexar en Supabase
-    print(f"\n💾 Indexando en Supabase...")
     try:
-        db = SupabaseVectorDB()
-        db.insert_chunks(all_chunks, embeddings)
-        print(f"✅ Indexación completada")
-    except Exception as e:
-        print(f"⚠ Error indexando en Supabase: {e}")
-        print(f"\n📝 NOTA: Si no has configurado Supabase:")
-        print(f"  1. Crea un proyecto en supabase.com")
-        print(f"  2. Ejecuta el SQL de creación de tablas (ver vector_db.py)")
-        print(f"  3. Agrega SUPABASE_URL y SUPABASE_KEY al .env")
-        print(f"\n  Por ahora, la búsqueda funcionará en memoria sin Supabase")
+        stats = pipeline.run()
+    except BaseException:
+        writer.abort()
+        raise
     
+    if not stats['files']:
+        writer.abort()
+        print("⚠ No se encontraron documentos en data/plantas/")
+        return
+    
+    writer.close()
+    publish_manifest(manifest, generator, chunker, uploaded=stats['uploaded'])
+    
+    print(f"\n✅ Documentos: {stats['files']} | Chunks indexados: {stats['chunks']}")
+    generator.report_truncation()
+    generator.report_disk_cache(compact=True)
     print("\n" + "="*60)
     print("✅ PROCESAMIENTO COMPLETADO")
     print("="*60 + "\n")
 
 
 if __name__ == "__main__":
-    process_and_index_documents()
+    parser = argparse.ArgumentParser(description="Procesa e indexa la base de conocimiento")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Chunks por lote de embeddings/subida")
+    parser.add_argument('--prefetch', type=int, default=DEFAULT_PREFETCH,
+                        help="Documentos leídos por adelantado (0 = sin hilo de lectura)")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="Procesos de extracción + chunking (0 = pipeline secuencial)")
+    parser.add_argument('--upload-workers', type=int, default=4,
+                        help="Hilos de subida a Supabase en modo paralelo")
+    args = parser.parse_args()
+    
+    if args.workers > 0:
+        process_and_index_parallel(args.workers, batch_size=args.batch_size,
+                                   upload_workers=args.upload_workers)
+    else:
+        process_and_index_documents(batch_size=args.batch_size, prefetch=args.prefetch)
@@ -1,88 +1,213 @@
 """
-Script para RE-INDEXAR toda la base de conocimiento
-1. Limpia la tabla plant_documents
-2. Procesa todos los documentos de nuevo
+Script para RE-INDEXAR la base de conocimiento
+
+Modo completo (por defecto):
+1. Procesa todos los documentos de nuevo
+2. Hace upsert de todos los chunks y después borra los chunk_id que ya no existen
+   (la tabla no se vacía en ningún momento)
+
+Modo incremental (--incremental):
+1. Compara el hash de cada archivo con el manifiesto de la última indexación
+2. Re-segmenta y re-vectoriza solo los archivos nuevos o modificados
+3. Hace upsert de los chunks nuevos/cambiados y borra los chunk_id huérfanos
+   (la tabla nunca queda vacía, el chat sigue respondiendo durante la reindexación)
 """
 import os
+import argparse
 from dotenv import load_dotenv
 from supabase import create_client, Client
 import sys
 sys.path.append('src')
 
-from data_extractor import DataExtractor
-from text_chunker import TextChunker
-from embeddings import EmbeddingGenerator
+import numpy as np
+from extraccion import DataExtractor
+from chunking import TextChunker, embedding_text
+from embeddings import EmbeddingGenerator, DEFAULT_DISK_CACHE_DIR
 from vector_db import SupabaseVectorDB
+from similitud import SimilaritySearch, save_index, DEFAULT_INDEX_DIR
+from manifiesto import IndexManifest, chunk_hash, DEFAULT_MANIFEST_FILE
 
 load_dotenv()
 
-print("\n" + "=" * 60)
-print("🔄 RE-INDEXACIÓN COMPLETA DE DOCUMENTOS")
-print("=" * 60 + "\n")
-
-# Conectar a Supabase
-supabase_url = os.getenv("SUPABASE_URL")
-supabase_key = os.getenv("SUPABASE_KEY")
-
-if not supabase_url or not supabase_key:
-    print("❌ Error: SUPABASE_URL o SUPABASE_KEY no configurados")
-    exit(1)
-
-supabase = create_client(supabase_url, supabase_key)
-
-# 1. LIMPIAR TABLA
-print("🗑️  Limpiando tabla plant_documents...")
-try:
-    # Eliminar TODOS los registros
-    result = supabase.table('plant_documents').delete().neq('id', 0).execute()
-    print(f"✅ Tabla limpiada\n")
-except Exception as e:
-    print(f"⚠️  Error limpiando tabla: {e}\n")
-
-# 2. PROCESAR DOCUMENTOS
-print("📚 PROCESANDO DOCUMENTOS DE CONOCIMIENTO\n")
-
-# Extraer documentos
-extractor = DataExtractor(data_dir="data/plantas")
-documents = extractor.extract_all_documents()
-
-print(f"📄 Documentos encontrados: {len(documents)}\n")
-
-# Chunking
-chunker = TextChunker(chunk_size=400, overlap=50)
-all_chunks = []
-chunk_metadata = []
-
-for doc in documents:
-    chunks = chunker.chunk_document(doc)
-    for chunk in chunks:
-        all_chunks.append(chunk['text'])
-        chunk_metadata.append({
-            'chunk_id': chunk['chunk_id'],
-            'source_file': chunk['source_file'],
-            'chunk_index': chunk['chunk_index']
-        })
-    
-    print(f"  ✓ {doc['filename']}: {len(chunks)} chunks")
-
-print(f"\n✅ Total chunks creados: {len(all_chunks)}\n")
-
-# Generar embeddings
-print("🧮 Generando embeddings...")
-generator = EmbeddingGenerator()
-embeddings = generator.generate_embeddings(all_chunks)
-print(f"✅ Embeddings generados: {embeddings.shape}\n")
-
-# Indexar en Supabase
-print("💾 Indexando en Supabase...")
-try:
+CHUNK_SIZE = 400
+CHUNK_OVERLAP = 50
+MANIFEST_PATH = os.path.join(DEFAULT_INDEX_DIR, DEFAULT_MANIFEST_FILE)
+
+
+def make_chunker(generator: EmbeddingGenerator) -> TextChunker:
+    """Chunker de la indexación (CHUNKING_UNIT=tokens usa el tokenizer del modelo)"""
+    return TextChunker.from_config(CHUNK_SIZE, CHUNK_OVERLAP, generator.token_counter)
+
+
+def chunk_documents(chunker: TextChunker, documents: list) -> list:
+    """Segmenta documentos y retorna (documento, chunks) por archivo"""
+    results = []
+    for doc in documents:
+        chunks = chunker.chunk_document(doc)
+        results.append((doc, chunks))
+        print(f"  ✓ {doc['filename']}: {len(chunks)} chunks")
+    return results
+
+
+def reindex_full(supabase: Client, documents: list, generator: EmbeddingGenerator, config: dict):
+    """Reindexación completa: upsert de todos los chunks y borrado de los huérfanos, sin vaciar la tabla"""
+    # 1. PROCESAR DOCUMENTOS
+    print("📚 PROCESANDO DOCUMENTOS DE CONOCIMIENTO\n")
+    
+    # Chunking
+    chunker = make_chunker(generator)
+    per_file = chunk_documents(chunker, documents)
+    all_chunks = [chunk for _, chunks in per_file for chunk in chunks]
+    
+    print(f"\n✅ Total chunks creados: {len(all_chunks)}\n")
+    
+    # Generar embeddings (los chunks sin cambios se leen de la caché en disco)
+    print("🧮 Generando embeddings...")
+    embeddings = generator.generate_embeddings_batch([embedding_text(chunk) for chunk in all_chunks])
+    print(f"✅ Embeddings generados: {embeddings.shape}\n")
+    
+    # Guardar índice local
+    save_index(DEFAULT_INDEX_DIR, embeddings, all_chunks)
+    
+    # 2. UPSERT Y LUEGO BORRAR HUÉRFANOS: el chat sigue respondiendo durante la reindexación
+    print("💾 Indexando en Supabase...")
+    try:
+        db = SupabaseVectorDB()
+        existing_ids = set(db.list_chunk_ids())
+        db.upsert_chunks(all_chunks, embeddings)
+        current_ids = {chunk['chunk_id'] for chunk in all_chunks}
+        db.delete_chunks(sorted(existing_ids - current_ids))
+        print(f"✅ Indexación completada: {len(all_chunks)} chunks\n")
+    except Exception as e:
+        print(f"❌ Error indexando: {e}\n")
+        raise
+    
+    manifest = IndexManifest(MANIFEST_PATH)
+    manifest.files = {}
+    for doc, chunks in per_file:
+        manifest.update_file(doc, chunks)
+    manifest.save(config)
+
+
+def reindex_incremental(supabase: Client, documents: list, generator: EmbeddingGenerator, config: dict):
+    """Reindexación incremental: solo archivos modificados, sin vaciar la tabla"""
+    manifest = IndexManifest(MANIFEST_PATH)
+    if not manifest.is_compatible(config):
+        print("⚠️  No hay manifiesto compatible (primera ejecución o cambió el modelo/chunking)")
+        print("   Ejecutando reindexación completa\n")
+        return reindex_full(supabase, documents, generator, config)
+    
+    changed = manifest.changed_files(documents)
+    removed = manifest.removed_files(documents)
+    print(f"📄 Archivos modificados o nuevos: {len(changed)}")
+    print(f"🗑️  Archivos eliminados: {len(removed)}\n")
+    
+    if not changed and not removed:
+        print("✅ El índice ya está al día\n")
+        return
+    
+    # 1. Re-segmentar solo los archivos modificados y comparar con el manifiesto
+    chunker = make_chunker(generator)
+    changed_chunks = []
+    to_upsert = []
+    orphan_ids = []
+    for doc, chunks in chunk_documents(chunker, changed):
+        previous = manifest.chunk_hashes(doc['filepath'])
+        current_ids = set()
+        for chunk in chunks:
+            current_ids.add(chunk['chunk_id'])
+            if previous.get(chunk['chunk_id']) != chunk_hash(chunk):
+                to_upsert.append(len(changed_chunks))
+            changed_chunks.append(chunk)
+        orphan_ids.extend(chunk_id for chunk_id in previous if chunk_id not in current_ids)
+        manifest.update_file(doc, chunks)
+    
+    for filepath in removed:
+        orphan_ids.extend(manifest.chunk_hashes(filepath))
+        manifest.remove_file(filepath)
+    
+    print(f"\n🔁 Chunks nuevos o modificados: {len(to_upsert)} | huérfanos: {len(orphan_ids)}\n")
+    
+    # 2. Embeddings de los chunks de archivos modificados (los que no cambiaron salen de caché)
+    print("🧮 Generando embeddings...")
+    if changed_chunks:
+        changed_embeddings = generator.generate_embeddings_batch([embedding_text(chunk) for chunk in changed_chunks])
+    else:
+        changed_embeddings = np.empty((0, generator.embedding_dim), dtype=np.float32)
+    
+    # 3. Upsert primero y luego borrar huérfanos: nunca hay un momento sin datos
+    print("💾 Actualizando Supabase...")
     db = SupabaseVectorDB()
-    db.insert_chunks(all_chunks, embeddings, chunk_metadata)
-    print(f"✅ Indexación completada: {len(all_chunks)} chunks\n")
-except Exception as e:
-    print(f"❌ Error indexando: {e}\n")
-    raise
-
-print("=" * 60)
-print("✅ RE-INDEXACIÓN COMPLETADA")
-print("=" * 60 + "\n")
+    db.upsert_chunks([changed_chunks[i] for i in to_upsert], changed_embeddings[to_upsert])
+    db.delete_chunks(orphan_ids)
+    
+    # 4. Actualizar el índice local reemplazando solo las filas de los archivos afectados
+    update_local_index(changed, removed, changed_chunks, changed_embeddings, documents, generator)
+    
+    manifest.save(config)
+    print(f"✅ Reindexación incremental completada\n")
+
+
+def update_local_index(changed: list, removed: list, changed_chunks: list, changed_embeddings: np.ndarray,
+                       documents: list, generator: EmbeddingGenerator):
+    """Reemplaza en el índice local las filas de los archivos modificados o eliminados"""
+    # Por ruta, no por nombre: dos archivos con el mismo nombre en carpetas distintas
+    affected = {doc['filepath'] for doc in changed} | set(removed)
+    
+    index = SimilaritySearch()
+    # Un índice de antes de source_path no permite saber de qué archivo es cada fila
+    if index.load(DEFAULT_INDEX_DIR, mmap=False) and all('source_path' in doc for doc in index.documents):
+        keep = [i for i, doc in enumerate(index.documents) if doc['source_path'] not in affected]
+        chunks = [index.documents[i] for i in keep] + changed_chunks
+        embeddings = np.concatenate([np.asarray(index.embeddings)[keep], changed_embeddings])
+    else:
+        # Sin índice previo: reconstruir completo (los embeddings salen de la caché en disco)
+        chunker = make_chunker(generator)
+        chunks = [chunk for doc in documents for chunk in chunker.chunk_document(doc)]
+        embeddings = generator.generate_embeddings_batch([embedding_text(chunk) for chunk in chunks])
+    
+    save_index(DEFAULT_INDEX_DIR, embeddings, chunks)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-indexa la base de conocimiento en Supabase")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Solo procesa archivos modificados (sin vaciar la tabla)")
+    args = parser.parse_args()
+    
+    print("\n" + "=" * 60)
+    if args.incremental:
+        print("🔄 RE-INDEXACIÓN INCREMENTAL DE DOCUMENTOS")
+    else:
+        print("🔄 RE-INDEXACIÓN COMPLETA DE DOCUMENTOS")
+    print("=" * 60 + "\n")
+    
+    # Conectar a Supabase
+    supabase_url = os.getenv("SUPABASE_URL")
+    supabase_key = os.getenv("SUPABASE_KEY")
+    
+    if not supabase_url or not supabase_key:
+        print("❌ Error: SUPABASE_URL o SUPABASE_KEY no configurados")
+        exit(1)
+    
+    supabase = create_client(supabase_url, supabase_key)
+    
+    # Extraer documentos
+    extractor = DataExtractor(data_dir="data/plantas")
+    documents = extractor.extract_all_documents()
+    
+    print(f"📄 Documentos encontrados: {len(documents)}\n")
+    
+    generator = EmbeddingGenerator(disk_cache_dir=DEFAULT_DISK_CACHE_DIR, track_truncation=True)
+    config = {'model_name': generator.model_name, **make_chunker(generator).config()}
+    
+    if args.incremental:
+        reindex_incremental(supabase, documents, generator, config)
+    else:
+        reindex_full(supabase, documents, generator, config)
+    generator.report_truncation()
+    generator.report_disk_cache(compact=not args.incremental)
+    
+    print("=" * 60)
+    print("✅ RE-INDEXACIÓN COMPLETADA")
+    print("=" * 60 + "\n")
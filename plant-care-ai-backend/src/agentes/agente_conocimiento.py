@@ -15,6 +15,10 @@ if str(src_dir) not in sys.path:
 from typing import List, Dict
 from embeddings import EmbeddingGenerator
 from vector_db import SupabaseVectorDB
+from concurrencia import run_blocking
+
+# Umbral mínimo de similitud (reducido de 0.3 a 0.25 para encontrar más documentos relevantes)
+SEARCH_THRESHOLD = 0.25
 
 
 class KnowledgeAgent:
@@ -40,11 +44,70 @@ class KnowledgeAgent:
                 self.use_supabase = False
         
         if not self.use_supabase:
-            # Fallback: búsqueda en memoria
-            from similitud import SimilaritySearch
-            self.similarity_search = SimilaritySearch()
+            # Fallback: búsqueda en memoria sobre el índice persistido por process_documents.py
+            self.similarity_search = self._load_local_index()
+            if self.similarity_search.dimension and self.similarity_search.dimension != self.embedding_generator.embedding_dim:
+                print(f"⚠ El índice local tiene dimensión {self.similarity_search.dimension} pero el modelo "
+                      f"genera {self.embedding_generator.embedding_dim}; regenera con process_documents.py")
+                from similitud import SimilaritySearch
+                self.similarity_search = SimilaritySearch()
             print("✓ Usando búsqueda en memoria")
     
+    def _load_local_index(self):
+        """
+        Carga el índice local según LOCAL_INDEX_BACKEND
+        
+        - 'exacto' (por defecto): SimilaritySearch, fuerza bruta (opcionalmente cuantizada)
+        - 'ivf': IVFIndex aproximado; si no existe se construye desde el índice plano y se guarda
+        
+        Returns:
+            Objeto con la interfaz search()/search_batch() de SimilaritySearch
+        """
+        from similitud import SimilaritySearch, DEFAULT_INDEX_DIR
+        
+        if os.getenv("LOCAL_INDEX_BACKEND", "exacto") == "ivf":
+            from indice_ivf import IVFIndex
+            ivf = IVFIndex(nprobe=int(os.getenv("LOCAL_INDEX_NPROBE", "8")))
+            if ivf.load(DEFAULT_INDEX_DIR):
+                return ivf
+            flat = SimilaritySearch()
+            if flat.load(DEFAULT_INDEX_DIR):
+                ivf.add_documents(flat.embeddings, flat.documents)
+                ivf.save(DEFAULT_INDEX_DIR)
+                return ivf
+            print("  Ejecuta 'python process_documents.py' para generar el índice local")
+            return flat
+        
+        # LOCAL_INDEX_STORAGE=int8|float16 reduce la memoria del índice por proceso
+        search = SimilaritySearch(
+            storage=os.getenv("LOCAL_INDEX_STORAGE", "float32"),
+            rerank_factor=int(os.getenv("LOCAL_INDEX_RERANK", "0"))
+        )
+        if not search.load(DEFAULT_INDEX_DIR):
+            print("  Ejecuta 'python process_documents.py' para generar el índice local")
+        return search
+    
+    def _build_query(self, query: str, species: str = "", problems: List[str] = None) -> str:
+        """Construye la consulta mejorada con especie y problemas detectados"""
+        enhanced_query = query
+        if species:
+            enhanced_query = f"{species} {query}"
+        if problems:
+            enhanced_query += f" problemas: {', '.join(problems)}"
+        return enhanced_query
+    
+    def _format_results(self, results: List) -> List[Dict]:
+        """Convierte tuplas (documento, score) al formato de documentos del agente"""
+        documents = []
+        for doc, score in results:
+            documents.append({
+                'text': doc.get('text', ''),
+                'source': doc.get('source_file', 'desconocido'),
+                'section': doc.get('section', ''),
+                'relevance_score': score
+            })
+        return documents
+    
     def search_knowledge(self, query: str, species: str = "", problems: List[str] = None, top_k: int = 5) -> List[Dict]:
         if problems is None:
             problems = []
@@ -61,11 +124,7 @@ class KnowledgeAgent:
             Lista de documentos relevantes
         """
         # Construir consulta mejorada
-        enhanced_query = query
-        if species:
-            enhanced_query = f"{species} {query}"
-        if problems:
-            enhanced_query += f" problemas: {', '.join(problems)}"
+        enhanced_query = self._build_query(query, species, problems)
         
         print(f"\n  Consulta: {enhanced_query}")
         
@@ -73,22 +132,43 @@ class KnowledgeAgent:
         query_embedding = self.embedding_generator.generate_embedding(enhanced_query)
         
         # Buscar en base de datos vectorial
-        # Reducido threshold de 0.3 a 0.25 para encontrar más documentos relevantes
         if self.use_supabase:
-            results = self.vector_db.search_similar(query_embedding, top_k=top_k, threshold=0.25)
+            results = self.vector_db.search_similar(query_embedding, top_k=top_k, threshold=SEARCH_THRESHOLD)
         else:
-            results = self.similarity_search.search(query_embedding, top_k=top_k, threshold=0.25)
+            results = self.similarity_search.search(query_embedding, top_k=top_k, threshold=SEARCH_THRESHOLD)
         
         # Formatear resultados
-        documents = []
-        for doc, score in results:
-            documents.append({
-                'text': doc.get('text', ''),
-                'source': doc.get('source_file', 'desconocido'),
-                'relevance_score': score
-            })
+        return self._format_results(results)
+    
+    def search_batch(self, queries: List[str], top_k: int = 5) -> List[List[Dict]]:
+        """
+        Búsqueda directa de muchas consultas a la vez (pruebas de carga, evaluación offline)
         
-        return documents
+        Todas las consultas se codifican en una sola llamada al modelo de embeddings;
+        en memoria se puntúan con un producto matriz-matriz contra el corpus.
+        
+        Args:
+            queries: Lista de consultas del usuario
+            top_k: Número de resultados por consulta
+            
+        Returns:
+            Lista (una entrada por consulta) de listas de documentos relevantes
+        """
+        if not queries:
+            return []
+        
+        query_embeddings = self.embedding_generator.generate_embeddings_batch(queries, show_progress_bar=False)
+        
+        if self.use_supabase:
+            # pgvector no admite varias consultas por RPC: una llamada por embedding
+            batch_results = [
+                self.vector_db.search_similar(query_embedding, top_k=top_k, threshold=SEARCH_THRESHOLD)
+                for query_embedding in query_embeddings
+            ]
+        else:
+            batch_results = self.similarity_search.search_batch(query_embeddings, top_k=top_k, threshold=SEARCH_THRESHOLD)
+        
+        return [self._format_results(results) for results in batch_results]
     
     def search_direct(self, query: str, top_k: int = 5) -> List[Dict]:
         """
@@ -103,6 +183,17 @@ class KnowledgeAgent:
         """
         return self.search_knowledge(query, species="", problems=[], top_k=top_k)
     
+    async def asearch_direct(self, query: str, top_k: int = 5) -> List[Dict]:
+        """
+        Versión asíncrona de search_direct: el embedding y la consulta a Supabase
+        (cliente síncrono) corren en el pool acotado, fuera del event loop
+        """
+        return await run_blocking(self.search_direct, query, top_k)
+    
+    async def aexecute(self, vision_result: Dict, user_actions: str = "") -> Dict:
+        """Versión asíncrona de execute"""
+        return await run_blocking(self.execute, vision_result, user_actions)
+    
     def execute(self, vision_result: Dict, user_actions: str = "") -> Dict:
         """
         Ejecuta el agente de conocimiento
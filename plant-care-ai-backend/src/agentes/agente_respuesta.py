@@ -6,16 +6,21 @@ import sys
 sys.path.append('..')
 
 import os
-from typing import Dict
+import asyncio
+from typing import Dict, List, AsyncIterator, Tuple, Callable, Awaitable
 from dotenv import load_dotenv
 import google.generativeai as genai
 
 from agente_vision import VisionAgent
 from agente_conocimiento import KnowledgeAgent
 from agente_analisis import AnalysisAgent
+from concurrencia import upstream
 
 load_dotenv()
 
+# Imágenes de un lote analizadas a la vez (además de los límites por servicio externo)
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "4"))
+
 
 class ResponseAgent:
     """Agente orquestador que coordina el flujo y genera respuesta final"""
@@ -91,27 +96,11 @@ class ResponseAgent:
         
         print("✓ Sistema Multi-Agente listo\n")
     
-    def generate_recommendations(self, analysis_result: Dict, context: str, user_question: str = "") -> list:
-        """
-        Genera recomendaciones usando el LLM
+    def _recommendations_prompt(self, analysis_result: Dict, context: str, user_question: str = "") -> str:
+        """Prompt de recomendaciones para el LLM"""
+        user_context = f"\n\nPREGUNTA/PRECUPACIÓN DEL USUARIO:\n{user_question}" if user_question else ""
         
-        Args:
-            analysis_result: Resultado del análisis
-            context: Contexto del knowledge agent
-            user_question: Pregunta o preocupación específica del usuario
-            
-        Returns:
-            Lista de recomendaciones
-        """
-        if not self.llm:
-            # Recomendaciones predeterminadas sin LLM
-            return self._get_default_recommendations(analysis_result, user_question)
-        
-        try:
-            # Construir prompt para recomendaciones
-            user_context = f"\n\nPREGUNTA/PRECUPACIÓN DEL USUARIO:\n{user_question}" if user_question else ""
-            
-            prompt = f"""Eres un experto en cuidado de plantas. Basándote en el siguiente análisis, 
+        return f"""Eres un experto en cuidado de plantas. Basándote en el siguiente análisis, 
 genera 3-5 recomendaciones específicas y accionables para mejorar la salud de la planta.
 
 ANÁLISIS:
@@ -136,21 +125,54 @@ Genera recomendaciones en el siguiente formato:
 
 Sé conciso, práctico, específico y empático."""
 
-            response = self.llm.generate_content(prompt)
-            recommendations_text = response.text
-            
-            # Parsear recomendaciones
-            recommendations = []
-            for line in recommendations_text.split('\n'):
-                line = line.strip()
-                if line and (line[0].isdigit() or line.startswith('-')):
-                    # Limpiar numeración
-                    rec = line.lstrip('0123456789.-) ').strip()
-                    if rec:
-                        recommendations.append(rec)
-            
-            return recommendations[:5]  # Máximo 5
+    def _parse_recommendations(self, recommendations_text: str) -> list:
+        """Extrae la lista numerada de recomendaciones de la respuesta del LLM"""
+        recommendations = []
+        for line in recommendations_text.split('\n'):
+            line = line.strip()
+            if line and (line[0].isdigit() or line.startswith('-')):
+                # Limpiar numeración
+                rec = line.lstrip('0123456789.-) ').strip()
+                if rec:
+                    recommendations.append(rec)
+        
+        return recommendations[:5]  # Máximo 5
+    
+    def generate_recommendations(self, analysis_result: Dict, context: str, user_question: str = "") -> list:
+        """
+        Genera recomendaciones usando el LLM
+        
+        Args:
+            analysis_result: Resultado del análisis
+            context: Contexto del knowledge agent
+            user_question: Pregunta o preocupación específica del usuario
             
+        Returns:
+            Lista de recomendaciones
+        """
+        if not self.llm:
+            # Recomendaciones predeterminadas sin LLM
+            return self._get_default_recommendations(analysis_result, user_question)
+        
+        try:
+            prompt = self._recommendations_prompt(analysis_result, context, user_question)
+            response = self.llm.generate_content(prompt)
+            return self._parse_recommendations(response.text)
+        
+        except Exception as e:
+            print(f"Error generando recomendaciones con LLM: {e}")
+            return self._get_default_recommendations(analysis_result, user_question)
+    
+    async def agenerate_recommendations(self, analysis_result: Dict, context: str, user_question: str = "") -> list:
+        """Versión asíncrona de generate_recommendations (generate_content_async)"""
+        if not self.llm:
+            return self._get_default_recommendations(analysis_result, user_question)
+        
+        try:
+            prompt = self._recommendations_prompt(analysis_result, context, user_question)
+            async with upstream('gemini'):
+                response = await self.llm.generate_content_async(prompt)
+            return self._parse_recommendations(response.text)
         except Exception as e:
             print(f"Error generando recomendaciones con LLM: {e}")
             return self._get_default_recommendations(analysis_result, user_question)
@@ -194,12 +216,52 @@ Sé conciso, práctico, específico y empático."""
         
         return recommendations
     
-    def execute(self, image_path: str, user_actions: str = "") -> Dict:
+    def _build_response(self, vision_result: Dict, knowledge_result: Dict, analysis_result: Dict,
+                        recommendations: list) -> Dict:
+        """Arma la respuesta final a partir de los resultados de cada agente"""
+        # Construir respuesta final
+        final_response = {
+            'success': True,
+            'plant_info': {
+                'species': vision_result.get('species'),
+                'common_names': vision_result.get('common_names', []),
+                'confidence': vision_result.get('species_probability', 0)
+            },
+            'health_assessment': {
+                'score': analysis_result.get('health_score'),
+                'status': analysis_result.get('overall_status'),
+                'visual_health': vision_result.get('health_status')
+            },
+            'diagnosis': {
+                'summary': analysis_result.get('diagnosis'),
+                'visual_problems': analysis_result.get('visual_problems', []),
+                'identified_issues': analysis_result.get('identified_issues', [])
+            },
+            'recommendations': recommendations,
+            'agent_flow': {
+                'vision_agent': 'completed',
+                'knowledge_agent': f"{knowledge_result.get('num_results', 0)} documents retrieved",
+                'analysis_agent': 'completed',
+                'response_agent': 'completed'
+            }
+        }
+        
+        print("\n" + "=" * 60)
+        print("✅ ANÁLISIS COMPLETADO")
+        print("=" * 60)
+        print(f"   Especie: {final_response['plant_info']['species']}")
+        print(f"   Salud: {final_response['health_assessment']['score']}/10")
+        print(f"   Recomendaciones: {len(recommendations)}")
+        print("=" * 60 + "\n")
+        
+        return final_response
+    
+    def execute(self, image, user_actions: str = "") -> Dict:
         """
         Ejecuta el flujo completo de agentes (orquestación)
         
         Args:
-            image_path: Ruta a la imagen de la planta
+            image: Imagen de la planta (ruta, bytes u objeto tipo archivo)
             user_actions: Descripción de acciones del usuario
             
         Returns:
@@ -211,7 +273,7 @@ Sé conciso, práctico, específico y empático."""
         
         try:
             # 1. AGENTE DE VISIÓN
-            vision_result = self.vision_agent.execute(image_path, user_actions)
+            vision_result = self.vision_agent.execute(image, user_actions)
             
             # 2. AGENTE DE CONOCIMIENTO
             knowledge_result = self.knowledge_agent.execute(vision_result, user_actions)
@@ -231,49 +293,106 @@ Sé conciso, práctico, específico y empático."""
                 user_actions  # Pasar la pregunta/preocupación del usuario
             )
             
-            # Construir respuesta final
-            final_response = {
-                'success': True,
-                'plant_info': {
-                    'species': vision_result.get('species'),
-                    'common_names': vision_result.get('common_names', []),
-                    'confidence': vision_result.get('species_probability', 0)
-                },
-                'health_assessment': {
-                    'score': analysis_result.get('health_score'),
-                    'status': analysis_result.get('overall_status'),
-                    'visual_health': vision_result.get('health_status')
-                },
-                'diagnosis': {
-                    'summary': analysis_result.get('diagnosis'),
-                    'visual_problems': analysis_result.get('visual_problems', []),
-                    'identified_issues': analysis_result.get('identified_issues', [])
-                },
-                'recommendations': recommendations,
-                'agent_flow': {
-                    'vision_agent': 'completed',
-                    'knowledge_agent': f"{knowledge_result.get('num_results', 0)} documents retrieved",
-                    'analysis_agent': 'completed',
-                    'response_agent': 'completed'
-                }
+            return self._build_response(vision_result, knowledge_result, analysis_result, recommendations)
+        
+        except Exception as e:
+            print(f"\n❌ Error en flujo de agentes: {e}")
+            return {
+                'success': False,
+                'error': str(e)
             }
+    
+    async def aexecute(self, image, user_actions: str = "") -> Dict:
+        """
+        Versión asíncrona de execute para los endpoints de FastAPI
+        
+        Las llamadas a Gemini/Plant.id usan clientes asíncronos y la búsqueda de
+        conocimiento (embeddings + Supabase) corre en el pool de hilos acotado.
+        """
+        print("=" * 60)
+        print("🌱 INICIANDO ANÁLISIS DE PLANTA")
+        print("=" * 60)
+        
+        return await self._arun(image, user_actions, self.knowledge_agent.aexecute)
+    
+    async def _arun(self, image, user_actions: str,
+                    knowledge_for: Callable[[Dict, str], Awaitable[Dict]], near_match: bool = True) -> Dict:
+        """Flujo asíncrono de una imagen; knowledge_for resuelve el conocimiento a partir de la visión"""
+        try:
+            vision_result = await self.vision_agent.aexecute(image, user_actions, near_match)
+            knowledge_result = await knowledge_for(vision_result, user_actions)
+            analysis_result = self.analysis_agent.execute(vision_result, knowledge_result, user_actions)
             
-            print("\n" + "=" * 60)
-            print("✅ ANÁLISIS COMPLETADO")
-            print("=" * 60)
-            print(f"   Especie: {final_response['plant_info']['species']}")
-            print(f"   Salud: {final_response['health_assessment']['score']}/10")
-            print(f"   Recomendaciones: {len(recommendations)}")
-            print("=" * 60 + "\n")
-            
-            return final_response
+            print(f"\n💡 Generando recomendaciones...")
+            recommendations = await self.agenerate_recommendations(
+                analysis_result,
+                knowledge_result.get('context', ''),
+                user_actions
+            )
             
+            return self._build_response(vision_result, knowledge_result, analysis_result, recommendations)
+        
         except Exception as e:
             print(f"\n❌ Error en flujo de agentes: {e}")
             return {
                 'success': False,
                 'error': str(e)
             }
+    
+    async def aexecute_batch(self, images: List, user_actions: str = "",
+                             max_concurrency: int = None) -> AsyncIterator[Tuple[int, Dict]]:
+        """
+        Analiza muchas imágenes y entrega cada resultado en cuanto termina
+        
+        Como mucho max_concurrency imágenes avanzan a la vez; Plant.id y Gemini siguen
+        acotados además por sus semáforos globales. La búsqueda de conocimiento se hace
+        una sola vez por especie y conjunto de problemas visuales (normalizados) y la
+        comparten todas las imágenes con esa misma consulta; cada imagen conserva así
+        los documentos de sus propios problemas.
+        
+        Args:
+            images: Imágenes (rutas, bytes u objetos tipo archivo)
+            user_actions: Contexto del usuario, común a todo el lote
+            max_concurrency: Imágenes simultáneas (None = BATCH_MAX_CONCURRENCY)
+            
+        Yields:
+            (índice de la imagen en el lote, respuesta como la de aexecute)
+        """
+        semaphore = asyncio.Semaphore(max_concurrency or BATCH_MAX_CONCURRENCY)
+        knowledge_by_query: Dict[Tuple[str, Tuple[str, ...]], asyncio.Future] = {}
+        
+        def shared_knowledge(vision_result: Dict, actions: str) -> Awaitable[Dict]:
+            species = vision_result.get('species') or 'Desconocida'
+            # Misma especie y mismos problemas (sin importar orden ni mayúsculas) = misma consulta
+            problems = tuple(sorted({
+                ' '.join(problem.split()).lower()
+                for problem in vision_result.get('visual_problems') or []
+                if problem.strip()
+            }))
+            key = (species.lower(), problems)
+            if key not in knowledge_by_query:
+                query = {'species': species, 'visual_problems': list(problems)}
+                knowledge_by_query[key] = asyncio.ensure_future(self.knowledge_agent.aexecute(query, actions))
+            else:
+                print(f"  ✓ Conocimiento de {species} compartido con otra imagen del lote")
+            # Una tarea puede esperarse desde varias corrutinas: todas reciben el mismo resultado
+            return knowledge_by_query[key]
+        
+        async def analyze(index: int, image) -> Tuple[int, Dict]:
+            async with semaphore:
+                # Fotos parecidas de un mismo lote suelen ser plantas distintas en el mismo
+                # sitio: de la caché solo se reutiliza una foto con los mismos bytes
+                return index, await self._arun(image, user_actions, shared_knowledge, near_match=False)
+        
+        tasks = [asyncio.ensure_future(analyze(i, image)) for i, image in enumerate(images)]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                yield await next_result
+        finally:
+            # Cliente desconectado o lote abandonado: no seguir gastando cuota
+            for task in tasks + list(knowledge_by_query.values()):
+                if not task.done():
+                    task.cancel()
 
 
 if __name__ == "__main__":
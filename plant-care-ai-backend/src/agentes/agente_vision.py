@@ -3,14 +3,40 @@ Agente de Visión
 Analiza imágenes de plantas usando Google Gemini Vision y Plant.id API
 """
 import os
-import base64
-import requests
-from typing import Dict, Optional
+import asyncio
+import httpx
+from typing import Dict, Optional, Union
 from dotenv import load_dotenv
 import google.generativeai as genai
 
+from concurrencia import run_blocking, run_sync, upstream, get_http_client
+from imagen import ImageSource, PreparedImage, prepare_image
+from cache_vision import VisionResultCache
+
 load_dotenv()
 
+# Plazo común (segundos) para identificación + análisis de salud, que corren a la vez
+VISION_DEADLINE = float(os.getenv("VISION_DEADLINE", "25"))
+
+# Estados de los resultados por defecto (sin análisis real; no se guardan en caché)
+HEALTH_NO_MODEL = 'No se pudo analizar (falta API key)'
+HEALTH_ERROR = 'Error en análisis'
+HEALTH_TIMEOUT = 'No se pudo analizar (tiempo agotado)'
+DEGRADED_HEALTH_STATUSES = (HEALTH_NO_MODEL, HEALTH_ERROR, HEALTH_TIMEOUT)
+
+# Plant.id y prompt de identificación con Gemini Vision (respaldo)
+PLANT_ID_URL = "https://api.plant.id/v2/identify"
+
+SPECIES_PROMPT = """Identifica la especie de esta planta. Responde SOLO con el nombre científico (género y especie) o el nombre común más conocido si no conoces el científico.
+
+Formato de respuesta:
+ESPECIE: [nombre científico o común]
+CONFIANZA: [alto/medio/bajo]
+
+Si no puedes identificar la planta, responde:
+ESPECIE: Desconocida
+CONFIANZA: bajo"""
+
 
 class VisionAgent:
     """Agente responsable de analizar imágenes de plantas"""
@@ -70,165 +96,196 @@ class VisionAgent:
         self.plant_id_key = os.getenv("PLANT_ID_API_KEY")
         if not self.plant_id_key:
             print("⚠ PLANT_ID_API_KEY no encontrada")
+        
+        # Resultados por hash perceptual: una foto repetida no vuelve a llamar a las APIs
+        self.cache = VisionResultCache()
+    
+    def _plant_id_request(self, image_data: str) -> Dict:
+        """Headers y cuerpo de la petición a Plant.id (imagen ya en base64)"""
+        headers = {
+            "Content-Type": "application/json",
+            "Api-Key": self.plant_id_key
+        }
+        data = {
+            "images": [f"data:image/jpeg;base64,{image_data}"],
+            "modifiers": ["similar_images"],
+            "plant_details": ["common_names", "taxonomy", "url"]
+        }
+        return {'headers': headers, 'json': data}
+    
+    def _parse_plant_id_result(self, result: Dict) -> Optional[Dict]:
+        """Extrae la mejor sugerencia de la respuesta de Plant.id"""
+        if 'suggestions' in result and len(result['suggestions']) > 0:
+            top_match = result['suggestions'][0]
+            species_name = top_match.get('plant_name', 'Desconocida')
+            probability = top_match.get('probability', 0)
+            common_names = top_match.get('plant_details', {}).get('common_names', [])
+            
+            print(f"  ✓ Plant.id identificó: {species_name} (confianza: {probability:.0%})")
+            
+            return {
+                'species': species_name,
+                'probability': probability,
+                'common_names': common_names
+            }
+        print("  ⚠ Plant.id no encontró sugerencias")
+        return None
+    
+    def _parse_species_response(self, analysis_text: str) -> Optional[Dict]:
+        """Parsea la identificación de especie hecha con Gemini Vision"""
+        species = "Desconocida"
+        confidence = 0.3  # Baja confianza para identificación con Gemini Vision
+        
+        for line in analysis_text.split('\n'):
+            if line.startswith('ESPECIE:'):
+                species = line.replace('ESPECIE:', '').strip()
+            elif line.startswith('CONFIANZA:'):
+                conf_text = line.replace('CONFIANZA:', '').strip().lower()
+                if 'alto' in conf_text:
+                    confidence = 0.6
+                elif 'medio' in conf_text:
+                    confidence = 0.4
+                else:
+                    confidence = 0.3
+        
+        if species and species != "Desconocida":
+            print(f"  ✓ Gemini Vision identificó: {species} (confianza estimada: {confidence:.0%})")
+            return {
+                'species': species,
+                'probability': confidence,
+                'common_names': []
+            }
+        return None
+    
+    def _health_prompt(self, user_actions: str) -> str:
+        """Prompt de análisis de salud para Gemini Vision"""
+        return f"""Eres un experto botánico. Analiza esta imagen de planta y proporciona:
+1. Estado visual de salud (excelente/bueno/regular/malo/crítico)
+2. Problemas visuales detectados (manchas, hojas amarillas, plagas, etc.)
+3. Puntuación de salud del 1-10
+4. Observaciones sobre color de hojas, tallo, tierra
+
+Contexto del usuario: {user_actions if user_actions else "Sin información adicional"}
+
+Responde en formato:
+ESTADO: [estado]
+PROBLEMAS: [lista de problemas separados por comas, o "ninguno"]
+PUNTUACIÓN: [número del 1-10]
+OBSERVACIONES: [detalles visuales]"""
+
+    @staticmethod
+    def _prepare(image: Union[ImageSource, PreparedImage]) -> PreparedImage:
+        """Acepta la imagen original (ruta, bytes o archivo) o una ya preparada en aexecute()"""
+        if isinstance(image, PreparedImage):
+            return image
+        return prepare_image(image)
+    
+    def _no_model_health(self) -> Dict:
+        return {
+            'health_status': HEALTH_NO_MODEL,
+            'visual_problems': [],
+            'health_score': 5
+        }
+    
+    def _species_timeout(self) -> None:
+        print(f"  ⚠ Identificación de especie sin respuesta tras {VISION_DEADLINE:g}s")
+        return None
+    
+    def _health_timeout(self) -> Dict:
+        print(f"  ⚠ Análisis de salud sin respuesta tras {VISION_DEADLINE:g}s")
+        return {
+            'health_status': HEALTH_TIMEOUT,
+            'visual_problems': [],
+            'health_score': 5
+        }
+    
+    def _health_error(self, e: Exception) -> Dict:
+        print(f"Error en Gemini Vision: {e}")
+        return {
+            'health_status': HEALTH_ERROR,
+            'visual_problems': [],
+            'health_score': 5,
+            'observations': str(e)
+        }
     
-    def identify_plant_species(self, image_path: str) -> Optional[Dict]:
+    def identify_plant_species(self, image: Union[ImageSource, PreparedImage]) -> Optional[Dict]:
+        """Versión síncrona de aidentify_plant_species (scripts y agente LangChain)"""
+        return run_sync(self.aidentify_plant_species, image)
+    
+    async def aidentify_plant_species(self, image: Union[ImageSource, PreparedImage]) -> Optional[Dict]:
         """
         Identifica la especie de planta usando Plant.id API o Gemini Vision como fallback
         
         Args:
-            image_path: Ruta a la imagen
+            image: Imagen original (ruta, bytes o archivo) o PreparedImage
             
         Returns:
             Diccionario con especie y probabilidad
         """
-        # Intentar primero con Plant.id API si está disponible
+        try:
+            image = await run_blocking(self._prepare, image)
+        except Exception as e:
+            print(f"  ⚠ No se pudo leer la imagen: {e}")
+            return None
+        
         if self.plant_id_key:
             try:
                 print("  🔍 Identificando especie con Plant.id API...")
-                # Leer y codificar imagen
-                with open(image_path, 'rb') as f:
-                    image_data = base64.b64encode(f.read()).decode('utf-8')
-                
-                # Llamada a Plant.id API
-                url = "https://api.plant.id/v2/identify"
-                headers = {
-                    "Content-Type": "application/json",
-                    "Api-Key": self.plant_id_key
-                }
-                data = {
-                    "images": [f"data:image/jpeg;base64,{image_data}"],
-                    "modifiers": ["similar_images"],
-                    "plant_details": ["common_names", "taxonomy", "url"]
-                }
-                
-                response = requests.post(url, json=data, headers=headers, timeout=10)
+                async with upstream('plant_id'):
+                    response = await get_http_client().post(PLANT_ID_URL, **self._plant_id_request(image.base64()),
+                                                            timeout=10)
                 response.raise_for_status()
-                result = response.json()
-                
-                if 'suggestions' in result and len(result['suggestions']) > 0:
-                    top_match = result['suggestions'][0]
-                    species_name = top_match.get('plant_name', 'Desconocida')
-                    probability = top_match.get('probability', 0)
-                    common_names = top_match.get('plant_details', {}).get('common_names', [])
-                    
-                    print(f"  ✓ Plant.id identificó: {species_name} (confianza: {probability:.0%})")
-                    
-                    return {
-                        'species': species_name,
-                        'probability': probability,
-                        'common_names': common_names
-                    }
-                else:
-                    print("  ⚠ Plant.id no encontró sugerencias")
-            except requests.exceptions.RequestException as e:
+                species_info = self._parse_plant_id_result(response.json())
+                if species_info:
+                    return species_info
+            except httpx.HTTPError as e:
                 print(f"  ⚠ Error en Plant.id API (HTTP): {e}")
             except Exception as e:
                 print(f"  ⚠ Error en Plant.id API: {e}")
         else:
             print("  ⚠ PLANT_ID_API_KEY no configurada")
         
-        # Fallback: usar Gemini Vision para identificar la planta
         if self.gemini_model:
             try:
                 print("  🔍 Intentando identificación con Gemini Vision...")
-                from PIL import Image
-                img = Image.open(image_path)
-                
-                prompt = """Identifica la especie de esta planta. Responde SOLO con el nombre científico (género y especie) o el nombre común más conocido si no conoces el científico.
-
-Formato de respuesta:
-ESPECIE: [nombre científico o común]
-CONFIANZA: [alto/medio/bajo]
-
-Si no puedes identificar la planta, responde:
-ESPECIE: Desconocida
-CONFIANZA: bajo"""
-                
-                response = self.gemini_model.generate_content([prompt, img])
-                analysis_text = response.text
-                
-                # Parsear respuesta
-                species = "Desconocida"
-                confidence = 0.3  # Baja confianza para identificación con Gemini Vision
-                
-                for line in analysis_text.split('\n'):
-                    if line.startswith('ESPECIE:'):
-                        species = line.replace('ESPECIE:', '').strip()
-                    elif line.startswith('CONFIANZA:'):
-                        conf_text = line.replace('CONFIANZA:', '').strip().lower()
-                        if 'alto' in conf_text:
-                            confidence = 0.6
-                        elif 'medio' in conf_text:
-                            confidence = 0.4
-                        else:
-                            confidence = 0.3
-                
-                if species and species != "Desconocida":
-                    print(f"  ✓ Gemini Vision identificó: {species} (confianza estimada: {confidence:.0%})")
-                    return {
-                        'species': species,
-                        'probability': confidence,
-                        'common_names': []
-                    }
+                async with upstream('gemini'):
+                    response = await self.gemini_model.generate_content_async([SPECIES_PROMPT, image.gemini_part()])
+                species_info = self._parse_species_response(response.text)
+                if species_info:
+                    return species_info
             except Exception as e:
                 print(f"  ⚠ Error en identificación con Gemini Vision: {e}")
         
         print("  ⚠ No se pudo identificar la especie")
         return None
     
-    def analyze_plant_health(self, image_path: str, user_actions: str = "") -> Dict:
+    def analyze_plant_health(self, image: Union[ImageSource, PreparedImage], user_actions: str = "") -> Dict:
+        """Versión síncrona de aanalyze_plant_health"""
+        return run_sync(self.aanalyze_plant_health, image, user_actions)
+    
+    async def aanalyze_plant_health(self, image: Union[ImageSource, PreparedImage], user_actions: str = "") -> Dict:
         """
         Analiza la salud de la planta usando Gemini Vision
         
         Args:
-            image_path: Ruta a la imagen
+            image: Imagen original (ruta, bytes o archivo) o PreparedImage
             user_actions: Descripción de lo que el usuario ha hecho con la planta
             
         Returns:
             Análisis visual de la planta
         """
         if not self.gemini_model:
-            return {
-                'health_status': 'No se pudo analizar (falta API key)',
-                'visual_problems': [],
-                'health_score': 5
-            }
+            return self._no_model_health()
         
         try:
-            # Cargar imagen
-            from PIL import Image
-            img = Image.open(image_path)
-            
-            # Prompt para Gemini
-            prompt = f"""Eres un experto botánico. Analiza esta imagen de planta y proporciona:
-1. Estado visual de salud (excelente/bueno/regular/malo/crítico)
-2. Problemas visuales detectados (manchas, hojas amarillas, plagas, etc.)
-3. Puntuación de salud del 1-10
-4. Observaciones sobre color de hojas, tallo, tierra
-
-Contexto del usuario: {user_actions if user_actions else "Sin información adicional"}
-
-Responde en formato:
-ESTADO: [estado]
-PROBLEMAS: [lista de problemas separados por comas, o "ninguno"]
-PUNTUACIÓN: [número del 1-10]
-OBSERVACIONES: [detalles visuales]"""
-            
-            response = self.gemini_model.generate_content([prompt, img])
-            analysis_text = response.text
-            
-            # Parsear respuesta
-            result = self._parse_gemini_response(analysis_text)
-            return result
-            
+            image = await run_blocking(self._prepare, image)
+            async with upstream('gemini'):
+                response = await self.gemini_model.generate_content_async(
+                    [self._health_prompt(user_actions), image.gemini_part()]
+                )
+            return self._parse_gemini_response(response.text)
         except Exception as e:
-            print(f"Error en Gemini Vision: {e}")
-            return {
-                'health_status': 'Error en análisis',
-                'visual_problems': [],
-                'health_score': 5,
-                'observations': str(e)
-            }
+            return self._health_error(e)
     
     def _parse_gemini_response(self, text: str) -> Dict:
         """Parsea la respuesta de Gemini"""
@@ -258,37 +315,85 @@ OBSERVACIONES: [detalles visuales]"""
         
         return result
     
-    def execute(self, image_path: str, user_actions: str = "") -> Dict:
+    def _combine(self, species_info: Optional[Dict], health_info: Dict) -> Dict:
+        """Combina identificación y análisis de salud en el resultado del agente"""
+        result = {
+            'agent': 'VisionAgent',
+            'species': species_info.get('species', 'Desconocida') if species_info else 'Desconocida',
+            'species_probability': species_info.get('probability', 0) if species_info else 0,
+            'common_names': species_info.get('common_names', []) if species_info else [],
+            **health_info
+        }
+        
+        print(f"  ✓ Especie identificada: {result['species']} (confianza: {result['species_probability']:.0%})")
+        print(f"  ✓ Estado de salud: {result['health_status']} ({result['health_score']}/10)")
+        
+        return result
+    
+    def execute(self, image: ImageSource, user_actions: str = "", near_match: bool = True) -> Dict:
+        """Versión síncrona de aexecute (scripts y agente LangChain; la API usa aexecute)"""
+        return run_sync(self.aexecute, image, user_actions, near_match)
+    
+    async def aexecute(self, image: ImageSource, user_actions: str = "", near_match: bool = True) -> Dict:
         """
         Ejecuta el agente completo: identificación + análisis
         
+        Ambas llamadas corren como tareas concurrentes; la que no termine antes de
+        VISION_DEADLINE se cancela, liberando su conexión y su semáforo de upstream.
+        
         Args:
-            image_path: Ruta a la imagen de la planta
+            image: Imagen de la planta (ruta, bytes u objeto tipo archivo)
             user_actions: Lo que el usuario ha hecho con la planta
+            near_match: Aceptar de la caché fotos casi idénticas (False = solo los mismos bytes)
             
         Returns:
             Análisis completo
         """
         print(f"\n🔍 AGENTE DE VISIÓN ejecutando...")
         
-        # 1. Identificar especie
-        species_info = self.identify_plant_species(image_path)
+        try:
+            image = await run_blocking(prepare_image, image)
+        except Exception as e:
+            return self._combine(None, self._health_error(e))
+        print(f"  ✓ Imagen preparada: {image}")
         
-        # 2. Analizar salud
-        health_info = self.analyze_plant_health(image_path, user_actions)
+        cached = self._cached_result(image, user_actions, near_match)
+        if cached is not None:
+            return cached
         
-        # Combinar resultados
-        result = {
-            'agent': 'VisionAgent',
-            'species': species_info.get('species', 'Desconocida') if species_info else 'Desconocida',
-            'species_probability': species_info.get('probability', 0) if species_info else 0,
-            'common_names': species_info.get('common_names', []) if species_info else [],
-            **health_info
-        }
+        species_task = asyncio.create_task(self.aidentify_plant_species(image))
+        health_task = asyncio.create_task(self.aanalyze_plant_health(image, user_actions))
+        try:
+            done, pending = await asyncio.wait({species_task, health_task}, timeout=VISION_DEADLINE)
+        finally:
+            # También si se cancela la petición entera (cliente desconectado)
+            for task in (species_task, health_task):
+                if not task.done():
+                    task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
         
-        print(f"  ✓ Especie identificada: {result['species']} (confianza: {result['species_probability']:.0%})")
-        print(f"  ✓ Estado de salud: {result['health_status']} ({result['health_score']}/10)")
+        species_info = species_task.result() if species_task in done else self._species_timeout()
+        health_info = health_task.result() if health_task in done else self._health_timeout()
         
+        return self._remember(image, user_actions, species_info, health_info)
+    
+    def _cached_result(self, image: PreparedImage, user_actions: str, near_match: bool = True) -> Optional[Dict]:
+        """Resultado guardado para esta foto (o una casi idéntica) y las mismas acciones"""
+        cached = self.cache.get(image.digest, image.dhash, user_actions, max_distance=None if near_match else 0)
+        if cached is None:
+            return None
+        result, distance = cached
+        print(f"  ✓ Resultado de visión desde caché (distancia {distance}/64): {result['species']}")
+        return result
+    
+    def _remember(self, image: PreparedImage, user_actions: str,
+                  species_info: Optional[Dict], health_info: Dict) -> Dict:
+        """Combina ambos resultados y los guarda en caché si están completos"""
+        result = self._combine(species_info, health_info)
+        # Sin especie o con salud por defecto un reintento puede ir mejor: no se guarda
+        if species_info is not None and health_info.get('health_status') not in DEGRADED_HEALTH_STATUSES:
+            self.cache.put(image.digest, image.dhash, user_actions, result)
         return result
 
 
@@ -0,0 +1,175 @@
+"""
+Módulo de Caché Semántica de Respuestas
+Guarda las respuestas finales de /api/chat indexadas por el embedding de la pregunta.
+Las preguntas se repiten mucho ("¿cómo cuido una suculenta?" y sus variantes): una
+pregunta parecida, con el mismo historial y el mismo corpus, se responde sin volver
+a recuperar documentos ni llamar a Gemini.
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from manifiesto import DEFAULT_MANIFEST_FILE
+from similitud import DEFAULT_INDEX_DIR, EMBEDDINGS_FILE, METADATA_FILE
+
+# Entradas máximas (0 desactiva la caché)
+CHAT_CACHE_SIZE = int(os.getenv("CHAT_CACHE_SIZE", "512"))
+# Segundos de validez de cada respuesta (0 = sin expiración)
+CHAT_CACHE_TTL = float(os.getenv("CHAT_CACHE_TTL", "3600"))
+# Similitud del coseno mínima entre preguntas para reutilizar la respuesta
+CHAT_CACHE_THRESHOLD = float(os.getenv("CHAT_CACHE_THRESHOLD", "0.95"))
+# Mensajes del historial que entran en el prompt (los mismos que usa ChatContext)
+HISTORY_WINDOW = 6
+
+# Archivos que reescribe una reindexación (process_documents.py, reindex_all.py)
+CORPUS_FILES = (EMBEDDINGS_FILE, METADATA_FILE, DEFAULT_MANIFEST_FILE)
+
+
+def history_key(history: List) -> str:
+    """
+    Clave del historial que ve el LLM (últimos HISTORY_WINDOW mensajes, normalizados)
+    
+    Dos conversaciones son compatibles si esta clave coincide: la respuesta cacheada
+    se generó con el mismo historial en el prompt.
+    """
+    if not history:
+        return ""
+    return "\n".join(
+        f"{msg.role}: {' '.join(msg.content.split()).lower()}"
+        for msg in history[-HISTORY_WINDOW:]
+    )
+
+
+def corpus_version(index_dir: str = DEFAULT_INDEX_DIR) -> Tuple[int, ...]:
+    """mtime (ns) del índice local y del manifiesto; cambia al reindexar el corpus"""
+    version = []
+    for name in CORPUS_FILES:
+        try:
+            version.append(os.stat(Path(index_dir) / name).st_mtime_ns)
+        except OSError:
+            version.append(0)
+    return tuple(version)
+
+
+class SemanticAnswerCache:
+    """
+    Caché LRU con TTL de respuestas de chat por similitud semántica
+    
+    Cada entrada guarda el embedding normalizado de la pregunta, la clave del
+    historial y la respuesta. Una búsqueda compara el embedding (producto escalar =
+    coseno) contra las entradas con el mismo historial y acepta la más parecida si
+    supera el umbral. El recorrido es lineal, pero con unos cientos de entradas de
+    384 dimensiones cuesta microsegundos frente a segundos de una llamada al LLM.
+    
+    Toda la caché se vacía cuando cambia la versión del corpus (mtime del índice
+    local o del manifiesto): las respuestas dependen de los documentos recuperados.
+    """
+    
+    def __init__(self, max_size: Optional[int] = None, ttl: Optional[float] = None,
+                 threshold: Optional[float] = None, index_dir: str = DEFAULT_INDEX_DIR):
+        """
+        Args:
+            max_size: Máximo de entradas (None = CHAT_CACHE_SIZE; 0 desactiva)
+            ttl: Segundos de validez (None = CHAT_CACHE_TTL; 0 = sin expiración)
+            threshold: Similitud mínima (None = CHAT_CACHE_THRESHOLD)
+            index_dir: Directorio del índice y del manifiesto que se vigilan
+        """
+        self.max_size = CHAT_CACHE_SIZE if max_size is None else max_size
+        self.ttl = CHAT_CACHE_TTL if ttl is None else ttl
+        self.threshold = CHAT_CACHE_THRESHOLD if threshold is None else threshold
+        self.index_dir = index_dir
+        self._version = corpus_version(index_dir)
+        self._entries = OrderedDict()  # id -> (embedding, clave del historial, respuesta, timestamp)
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+    
+    def _expired(self, created_at: float, now: float) -> bool:
+        return bool(self.ttl) and now - created_at >= self.ttl
+    
+    def _check_corpus(self):
+        """Vacía la caché si el corpus se reindexó (llamar con el lock tomado)"""
+        version = corpus_version(self.index_dir)
+        if version != self._version:
+            if self._entries:
+                print("⚠️ Corpus reindexado: se vacía la caché de respuestas del chat")
+                self.invalidations += 1
+            self._entries.clear()
+            self._version = version
+    
+    def get(self, embedding: np.ndarray, history: List = None) -> Optional[Tuple[str, float]]:
+        """
+        Busca una respuesta para una pregunta parecida con el mismo historial
+        
+        Args:
+            embedding: Embedding normalizado de la pregunta
+            history: Historial de la conversación
+            
+        Returns:
+            (respuesta, similitud) o None
+        """
+        if self.max_size <= 0:
+            return None
+        
+        key = history_key(history)
+        now = time.monotonic()
+        with self._lock:
+            self._check_corpus()
+            best_id, best_score = None, self.threshold
+            for entry_id, (other, other_key, _, created_at) in list(self._entries.items()):
+                if self._expired(created_at, now):
+                    del self._entries[entry_id]
+                    continue
+                if other_key != key:
+                    continue
+                score = float(np.dot(embedding, other))
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+            
+            if best_id is None:
+                self.misses += 1
+                return None
+            
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            return self._entries[best_id][2], best_score
+    
+    def put(self, embedding: np.ndarray, history: List, answer: str):
+        """Guarda la respuesta final de una pregunta (solo respuestas generadas por un LLM)"""
+        if self.max_size <= 0 or not answer:
+            return
+        
+        entry = (np.asarray(embedding, dtype=np.float32), history_key(history), answer, time.monotonic())
+        with self._lock:
+            self._check_corpus()
+            self._entries[self._next_id] = entry
+            self._next_id += 1
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        """Vacía la caché (los contadores se mantienen)"""
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> dict:
+        """Contadores de la caché"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'invalidations': self.invalidations,
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl,
+                'threshold': self.threshold
+            }
@@ -0,0 +1,146 @@
+"""
+Módulo de Caché de Visión
+Guarda el resultado de VisionAgent por (SHA-256 de la imagen subida, acciones del
+usuario normalizadas). Los usuarios vuelven a subir la misma foto (reintentos, o para
+añadir texto) y cada subida repetiría Plant.id y dos llamadas a Gemini de pago.
+"""
+import os
+import time
+import copy
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from imagen import hamming_distance
+
+# Entradas máximas (0 desactiva la caché)
+VISION_CACHE_SIZE = int(os.getenv("VISION_CACHE_SIZE", "256"))
+# Segundos de validez de cada resultado (0 = sin expiración)
+VISION_CACHE_TTL = float(os.getenv("VISION_CACHE_TTL", "3600"))
+# Bits de dHash distintos (de 64) para reutilizar el resultado de una foto casi idéntica.
+# 0 = solo los mismos bytes (SHA-256). El dHash es una miniatura de 9×8 en grises: dos
+# plantas distintas con el mismo encuadre pueden compartirlo, y no ve color ni manchas
+VISION_CACHE_MAX_DISTANCE = int(os.getenv("VISION_CACHE_MAX_DISTANCE", "0"))
+
+
+def normalize_actions(user_actions: str) -> str:
+    """Colapsa espacios y pasa a minúsculas el texto del usuario"""
+    return ' '.join((user_actions or '').split()).lower()
+
+
+class VisionResultCache:
+    """
+    Caché LRU con TTL de resultados de visión
+    
+    Las claves son (SHA-256 de la imagen, acciones normalizadas): una búsqueda exacta
+    solo acepta los mismos bytes. Si falla y max_distance > 0, se recorren las entradas
+    con las mismas acciones y se acepta la más cercana por dHash con distancia de
+    Hamming <= max_distance (recompresiones de la misma foto). El recorrido es lineal
+    pero la caché es pequeña y comparar dos enteros de 64 bits es trivial frente a una
+    llamada a la API.
+    """
+    
+    def __init__(self, max_size: Optional[int] = None, ttl: Optional[float] = None,
+                 max_distance: Optional[int] = None):
+        """
+        Args:
+            max_size: Máximo de entradas (None = VISION_CACHE_SIZE; 0 desactiva)
+            ttl: Segundos de validez (None = VISION_CACHE_TTL; 0 = sin expiración)
+            max_distance: Distancia de Hamming máxima (None = VISION_CACHE_MAX_DISTANCE)
+        """
+        self.max_size = VISION_CACHE_SIZE if max_size is None else max_size
+        self.ttl = VISION_CACHE_TTL if ttl is None else ttl
+        self.max_distance = VISION_CACHE_MAX_DISTANCE if max_distance is None else max_distance
+        self._entries = OrderedDict()  # (sha256, acciones) -> (dhash, resultado, timestamp)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+    
+    def _expired(self, created_at: float, now: float) -> bool:
+        return bool(self.ttl) and now - created_at >= self.ttl
+    
+    def get(self, digest: str, dhash: int, user_actions: str = "",
+            max_distance: Optional[int] = None) -> Optional[Tuple[Dict, int]]:
+        """
+        Busca un resultado para la imagen y las acciones
+        
+        Args:
+            digest: SHA-256 de la imagen subida
+            dhash: Hash perceptual de la imagen
+            user_actions: Texto del usuario (se normaliza)
+            max_distance: Distancia máxima para esta búsqueda (None = la de la caché;
+                0 = solo la misma imagen)
+            
+        Returns:
+            (copia del resultado, distancia de Hamming) o None
+        """
+        if self.max_size <= 0:
+            return None
+        
+        actions = normalize_actions(user_actions)
+        if max_distance is None:
+            max_distance = self.max_distance
+        now = time.monotonic()
+        with self._lock:
+            key = (digest, actions)
+            entry = self._entries.get(key)
+            distance, near = 0, False
+            if entry is not None and self._expired(entry[2], now):
+                del self._entries[key]
+                entry = None
+            if entry is None and max_distance > 0:
+                key, distance, near = None, max_distance + 1, True
+                for other_key, candidate in list(self._entries.items()):
+                    if self._expired(candidate[2], now):
+                        del self._entries[other_key]
+                        continue
+                    if other_key[1] != actions:
+                        continue
+                    d = hamming_distance(dhash, candidate[0])
+                    if d < distance:
+                        key, entry, distance = other_key, candidate, d
+            
+            if entry is None:
+                self.misses += 1
+                return None
+            
+            self._entries.move_to_end(key)
+            if near:
+                self.near_hits += 1
+            else:
+                self.hits += 1
+            # Copia: quien la reciba puede modificarla sin tocar la caché
+            return copy.deepcopy(entry[1]), distance
+    
+    def put(self, digest: str, dhash: int, user_actions: str, result: Dict):
+        """Guarda un resultado (solo resultados completos; los degradados no se cachean)"""
+        if self.max_size <= 0:
+            return
+        
+        key = (digest, normalize_actions(user_actions))
+        with self._lock:
+            self._entries[key] = (dhash, copy.deepcopy(result), time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        """Vacía la caché (los contadores se mantienen)"""
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> dict:
+        """Contadores de la caché"""
+        with self._lock:
+            total = self.hits + self.near_hits + self.misses
+            return {
+                'hits': self.hits,
+                'near_hits': self.near_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.near_hits) / total if total else 0.0,
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl,
+                'max_distance': self.max_distance
+            }
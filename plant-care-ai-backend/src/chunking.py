@@ -2,20 +2,261 @@
 Módulo de Chunking (Segmentación)
 Divide documentos largos en chunks más pequeños para procesamiento
 """
-from typing import List
+import os
+import re
+import hashlib
+from typing import Callable, List, Optional, Tuple
+
+# Fin de oración: punto seguido de espacio o salto de línea
+_SENTENCE_END = re.compile(r'\.(?=[ \n])')
+
+# Markdown: títulos, ítems de lista, separadores y bloques de código
+_MD_HEADING = re.compile(r'^(#{1,6})[ \t]+(.+?)[ \t#]*$')
+_MD_LIST_ITEM = re.compile(r'^([ \t]*)(?:[-*+]|\d+[.)])[ \t]+')
+_MD_RULE = re.compile(r'^[ \t]*([-*_])(?:[ \t]*\1){2,}[ \t]*$')
+_MD_FENCE = re.compile(r'^[ \t]*(```|~~~)')
+_MD_EMPHASIS = re.compile(r'[*_`]+')
+_WORD = re.compile(r'\S+')
+
+# Modo por defecto: 'sentences' (solo oraciones) o 'markdown' (respeta títulos y listas).
+# Cambiar de modo cambia los chunks y sus IDs: la siguiente indexación es completa
+DEFAULT_CHUNKING_MODE = os.getenv("CHUNKING_MODE", "sentences")
+CHUNKING_MODES = ('sentences', 'markdown')
+
+# Unidad de tamaño: 'chars' (chunk_size/overlap en caracteres) o 'tokens' (tokenizer del modelo)
+DEFAULT_CHUNKING_UNIT = os.getenv("CHUNKING_UNIT", "chars")
+# En modo tokens: presupuesto por chunk (0 = el máximo que vectoriza el modelo) y overlap
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "0"))
+CHUNK_TOKEN_OVERLAP = int(os.getenv("CHUNK_TOKEN_OVERLAP", "32"))
+
+# Sube cuando cambia la forma de generar los chunks (invalida manifiestos anteriores)
+CHUNKER_VERSION = 3
+
+
+def sentence_spans(text: str) -> List[Tuple[int, int]]:
+    """
+    Offsets (inicio, fin) de cada oración en el texto, sin espacios en los bordes
+    
+    Args:
+        text: Texto a dividir
+        
+    Returns:
+        Lista de tuplas (inicio, fin) con text[inicio:fin] = oración
+    """
+    spans = []
+    start = 0
+    n = len(text)
+    for match in [*_SENTENCE_END.finditer(text), None]:
+        end = match.end() if match else n
+        s, e = start, end
+        while s < e and text[s].isspace():
+            s += 1
+        while e > s and text[e - 1].isspace():
+            e -= 1
+        if s < e:
+            spans.append((s, e))
+        start = end
+    return spans
+
+
+def markdown_blocks(text: str) -> List[Tuple[Tuple[str, ...], int, int]]:
+    """
+    Divide un documento markdown en bloques (párrafos, ítems de lista, código)
+    
+    Los títulos no forman parte de ningún bloque: se acumulan en la ruta de
+    sección de los bloques que vienen debajo.
+    
+    Args:
+        text: Texto markdown
+        
+    Returns:
+        Lista de tuplas (ruta de sección, inicio, fin) con text[inicio:fin] = bloque
+    """
+    blocks = []
+    headings = []  # pila de (nivel, título)
+    section = ()
+    block_start = block_end = None
+    block_kind = None  # 'paragraph', 'item' o 'code'
+    item_indent = 0
+    
+    def close():
+        nonlocal block_start, block_kind
+        if block_start is not None:
+            blocks.append((section, block_start, block_end))
+        block_start = block_kind = None
+    
+    pos = 0
+    for line in text.splitlines(keepends=True):
+        start, pos = pos, pos + len(line)
+        content = line.rstrip('\r\n')
+        end = start + len(content.rstrip())
+        
+        if block_kind == 'code':
+            block_end = end
+            if _MD_FENCE.match(content):
+                close()
+            continue
+        
+        if not content.strip():
+            if block_kind == 'paragraph':
+                close()
+            continue
+        
+        heading = _MD_HEADING.match(content)
+        if heading:
+            close()
+            level = len(heading.group(1))
+            while headings and headings[-1][0] >= level:
+                headings.pop()
+            headings.append((level, _MD_EMPHASIS.sub('', heading.group(2)).strip()))
+            section = tuple(title for _, title in headings)
+            continue
+        
+        if _MD_RULE.match(content):
+            close()
+            continue
+        
+        if _MD_FENCE.match(content):
+            close()
+            block_start, block_end, block_kind = start, end, 'code'
+            continue
+        
+        indent = len(content) - len(content.lstrip())
+        item = _MD_LIST_ITEM.match(content)
+        if item and not (block_kind == 'item' and indent > item_indent):
+            # Nuevo ítem de lista (los sub-ítems quedan dentro del ítem padre)
+            close()
+            block_start, block_end, block_kind = start + indent, end, 'item'
+            item_indent = indent
+        elif block_kind is not None:
+            # Continuación del párrafo o del ítem actual
+            block_end = end
+        else:
+            block_start, block_end, block_kind = start + indent, end, 'paragraph'
+    
+    close()
+    return blocks
+
+
+def section_prefix(section_path) -> str:
+    """Prefijo con la ruta de títulos que embedding_text antepone al chunk"""
+    return ' > '.join(section_path) + '\n' if section_path else ''
+
+
+def chunk_id(source_path: str, filename: str, text: str, seen: dict) -> str:
+    """
+    ID estable de un chunk: nombre de archivo + hash de su ruta y su texto vectorizado
+    
+    No depende de la posición, así insertar un párrafo no renumera los chunks
+    siguientes. Un texto repetido en el mismo archivo lleva un sufijo de ocurrencia.
+    """
+    digest = hashlib.sha1(f"{source_path}\0{text}".encode('utf-8')).hexdigest()[:16]
+    seen[digest] = seen.get(digest, 0) + 1
+    suffix = f"_{seen[digest]}" if seen[digest] > 1 else ""
+    return f"{filename}_{digest}{suffix}"
+
+
+def embedding_text(chunk: dict) -> str:
+    """
+    Texto a vectorizar para un chunk: la ruta de títulos como prefijo y luego el texto
+    
+    Los títulos quedan fuera de chunk['text'] (lo que llega al prompt), pero el
+    embedding conserva el contexto de sección (p. ej. la especie y el tema).
+    """
+    return section_prefix(chunk.get('section_path')) + chunk['text']
 
 
 class TextChunker:
     """Divide texto en chunks semánticos"""
     
-    def __init__(self, chunk_size: int = 500, overlap: int = 50):
+    def __init__(self, chunk_size: int = 500, overlap: int = 50, mode: str = None,
+                 token_counter: Optional[Callable[[List[str]], List[int]]] = None):
         """
         Args:
-            chunk_size: Tamaño aproximado de cada chunk en caracteres
-            overlap: Cantidad de caracteres de overlap entre chunks
+            chunk_size: Tamaño aproximado de cada chunk en caracteres (o tokens)
+            overlap: Cantidad de caracteres (o tokens) de overlap entre chunks
+            mode: 'sentences' o 'markdown' (None = CHUNKING_MODE, por defecto 'sentences')
+            token_counter: Si se indica (p. ej. EmbeddingGenerator.token_counter),
+                           chunk_size y overlap se miden en tokens del modelo
         """
         self.chunk_size = chunk_size
         self.overlap = overlap
+        self.mode = mode or DEFAULT_CHUNKING_MODE
+        self.token_counter = token_counter
+        if self.mode not in CHUNKING_MODES:
+            raise ValueError(f"Modo de chunking desconocido: {self.mode} (opciones: {', '.join(CHUNKING_MODES)})")
+    
+    @classmethod
+    def from_config(cls, chunk_size: int, overlap: int, token_counter=None) -> 'TextChunker':
+        """
+        Chunker según CHUNKING_UNIT: en 'tokens' usa el tokenizer del modelo con
+        CHUNK_TOKENS/CHUNK_TOKEN_OVERLAP; si no, chunk_size/overlap en caracteres
+        """
+        if DEFAULT_CHUNKING_UNIT == 'tokens':
+            if token_counter is None:
+                raise ValueError("CHUNKING_UNIT=tokens requiere el token_counter del modelo de embeddings")
+            return cls(CHUNK_TOKENS or token_counter.max_tokens, CHUNK_TOKEN_OVERLAP, token_counter=token_counter)
+        return cls(chunk_size, overlap)
+    
+    @property
+    def unit(self) -> str:
+        return 'tokens' if self.token_counter is not None else 'chars'
+    
+    def config(self) -> dict:
+        """Parámetros que determinan los chunks (para el manifiesto de indexación)"""
+        return {'chunk_size': self.chunk_size, 'overlap': self.overlap,
+                'chunking_mode': self.mode, 'chunking_unit': self.unit,
+                'chunker_version': CHUNKER_VERSION}
+    
+    def _overlap_start(self, text: str, chunk_start: int, chunk_end: int) -> int:
+        """
+        Inicio del siguiente chunk: los últimos `overlap` caracteres del chunk anterior,
+        ajustados al comienzo de la palabra siguiente para no cortar palabras
+        """
+        pos = max(chunk_end - self.overlap, chunk_start + 1)
+        if pos > chunk_start and not text[pos - 1].isspace():
+            while pos < chunk_end and not text[pos].isspace():
+                pos += 1
+        while pos < chunk_end and text[pos].isspace():
+            pos += 1
+        return pos
+    
+    def chunk_spans(self, text: str) -> List[Tuple[int, int]]:
+        """
+        Offsets (inicio, fin) de cada chunk respetando límites de oraciones
+        
+        Los chunks son rebanadas del texto original: no se concatenan cadenas ni se
+        vuelve a dividir el chunk actual para calcular el overlap, así el costo es
+        lineal en el largo del texto.
+        
+        Args:
+            text: Texto a dividir
+            
+        Returns:
+            Lista de tuplas (inicio, fin) con text[inicio:fin] = chunk
+        """
+        spans = []
+        chunk_start = chunk_end = None
+        
+        for start, end in sentence_spans(text):
+            if chunk_start is None:
+                chunk_start, chunk_end = start, end
+                continue
+            
+            # Si agregar esta oración excede el tamaño, cerrar el chunk actual
+            if end - chunk_start > self.chunk_size:
+                spans.append((chunk_start, chunk_end))
+                
+                # Comenzar nuevo chunk con overlap (o en la oración si no hay overlap)
+                overlap_start = self._overlap_start(text, chunk_start, chunk_end) if self.overlap > 0 else chunk_end
+                chunk_start = overlap_start if overlap_start < chunk_end else start
+            chunk_end = end
+        
+        # Agregar último chunk
+        if chunk_start is not None:
+            spans.append((chunk_start, chunk_end))
+        
+        return spans
     
     def chunk_by_sentences(self, text: str) -> List[str]:
         """
@@ -27,56 +268,178 @@ class TextChunker:
         Returns:
             Lista de chunks
         """
-        # Dividir por oraciones (aproximado)
-        sentences = text.replace('.\n', '.|').replace('. ', '.|').split('|')
+        return [text[start:end] for start, end in self.chunk_spans(text)]
+    
+    def markdown_spans(self, text: str) -> List[Tuple[Tuple[str, ...], int, int]]:
+        """
+        Chunks por sección markdown: agrupa bloques consecutivos de la misma sección
+        hasta chunk_size caracteres, sin cruzar títulos
+        
+        Los bloques no se solapan entre sí (son unidades completas: un párrafo, un
+        ítem de lista); el overlap solo se aplica al dividir por oraciones un bloque
+        más largo que chunk_size.
         
-        chunks = []
-        current_chunk = ""
+        Args:
+            text: Texto markdown
+            
+        Returns:
+            Lista de tuplas (ruta de sección, inicio, fin)
+        """
+        spans = []
+        section = chunk_start = chunk_end = None
         
-        for sentence in sentences:
-            sentence = sentence.strip()
-            if not sentence:
+        for block_section, start, end in markdown_blocks(text):
+            if chunk_start is not None and (block_section != section or end - chunk_start > self.chunk_size):
+                spans.append((section, chunk_start, chunk_end))
+                chunk_start = None
+            
+            if end - start > self.chunk_size:
+                # Bloque demasiado largo: dividirlo por oraciones
+                spans.extend((block_section, start + s, start + e)
+                             for s, e in self.chunk_spans(text[start:end]))
                 continue
-                
-            # Si agregar esta oración excede el tamaño, guardar chunk actual
-            if len(current_chunk) + len(sentence) > self.chunk_size and current_chunk:
-                chunks.append(current_chunk.strip())
-                
-                # Comenzar nuevo chunk con overlap
-                words = current_chunk.split()
-                overlap_text = ' '.join(words[-self.overlap:]) if len(words) > self.overlap else current_chunk
-                current_chunk = overlap_text + " " + sentence
-            else:
-                current_chunk += " " + sentence
+            
+            if chunk_start is None:
+                section, chunk_start = block_section, start
+            chunk_end = end
         
-        # Agregar último chunk
-        if current_chunk.strip():
-            chunks.append(current_chunk.strip())
+        if chunk_start is not None:
+            spans.append((section, chunk_start, chunk_end))
         
-        return chunks
+        return spans
+    
+    def _token_units(self, text: str, spans: List[Tuple[int, int]], budget: int):
+        """
+        Cuenta tokens de cada span; los que exceden el presupuesto se parten en palabras
+        
+        Returns:
+            Tupla (spans, tokens por span)
+        """
+        counts = self.token_counter([text[start:end] for start, end in spans])
+        units, unit_counts = [], []
+        for (start, end), n in zip(spans, counts):
+            if n <= budget:
+                units.append((start, end))
+                unit_counts.append(n)
+                continue
+            words = [(m.start(), m.end()) for m in _WORD.finditer(text, start, end)]
+            units.extend(words)
+            unit_counts.extend(self.token_counter([text[a:b] for a, b in words]))
+        return units, unit_counts
+    
+    @staticmethod
+    def _pack_tokens(units: List[Tuple[int, int]], counts: List[int], budget: int, overlap: int) -> List[Tuple[int, int]]:
+        """
+        Agrupa unidades consecutivas mientras la suma de tokens quede dentro del presupuesto
+        
+        El tokenizer (WordPiece) parte primero por espacios y puntuación, así que los
+        tokens de un tramo son la suma de los de sus unidades: cada unidad se tokeniza
+        una sola vez. El overlap repite las últimas unidades que sumen hasta `overlap` tokens.
+        """
+        spans = []
+        window = []  # índices de las unidades del chunk actual
+        total = 0
+        for i, n in enumerate(counts):
+            if window and total + n > budget:
+                spans.append((units[window[0]][0], units[window[-1]][1]))
+                keep, kept = [], 0
+                for j in reversed(window):
+                    if kept + counts[j] > overlap or kept + counts[j] + n > budget:
+                        break
+                    keep.append(j)
+                    kept += counts[j]
+                window, total = keep[::-1], kept
+            window.append(i)
+            total += n
+        if window:
+            spans.append((units[window[0]][0], units[window[-1]][1]))
+        return spans
+    
+    def token_spans(self, text: str) -> List[Tuple[int, int]]:
+        """Como chunk_spans pero empaquetando oraciones hasta chunk_size tokens"""
+        units, counts = self._token_units(text, sentence_spans(text), self.chunk_size)
+        return self._pack_tokens(units, counts, self.chunk_size, self.overlap)
+    
+    def markdown_token_spans(self, text: str) -> List[Tuple[Tuple[str, ...], int, int]]:
+        """
+        Como markdown_spans pero con presupuesto en tokens
+        
+        Al presupuesto de cada sección se le descuentan los tokens del prefijo de
+        títulos que embedding_text antepone, así el texto vectorizado nunca se trunca.
+        """
+        blocks = markdown_blocks(text)
+        counts = self.token_counter([text[start:end] for _, start, end in blocks])
+        prefix_tokens = {}
+        spans = []
+        group, group_counts = [], []
+        section = None
+        budget = self.chunk_size
+        
+        def flush():
+            spans.extend((section, start, end) for start, end in self._pack_tokens(group, group_counts, budget, 0))
+            group.clear()
+            group_counts.clear()
+        
+        for (block_section, start, end), n in zip(blocks, counts):
+            if block_section != section:
+                flush()
+                section = block_section
+                if section not in prefix_tokens:
+                    prefix_tokens[section] = self.token_counter([section_prefix(section)])[0] if section else 0
+                budget = max(self.chunk_size - prefix_tokens[section], self.chunk_size // 2)
+            
+            if n <= budget:
+                group.append((start, end))
+                group_counts.append(n)
+                continue
+            
+            # Bloque demasiado largo: dividirlo por oraciones (con overlap)
+            flush()
+            sentences = [(start + s, start + e) for s, e in sentence_spans(text[start:end])]
+            units, unit_counts = self._token_units(text, sentences, budget)
+            spans.extend((section, s, e) for s, e in self._pack_tokens(units, unit_counts, budget, self.overlap))
+        
+        flush()
+        return spans
     
     def chunk_document(self, document: dict) -> List[dict]:
         """
         Divide un documento en chunks
         
         Args:
-            document: Dict con 'filename' y 'content'
+            document: Dict con 'filename', 'content' y opcionalmente 'filepath'
             
         Returns:
-            Lista de chunks con metadata
+            Lista de chunks con metadata (incluye offsets start_char/end_char en el texto
+            original, source_path con la ruta del archivo y, en modo markdown,
+            section_path/section con la ruta de títulos)
         """
         text = document['content']
-        chunks = self.chunk_by_sentences(text)
         
+        if self.mode == 'markdown':
+            spans = self.markdown_token_spans(text) if self.token_counter else self.markdown_spans(text)
+        else:
+            sentence_chunks = self.token_spans(text) if self.token_counter else self.chunk_spans(text)
+            spans = [(None, start, end) for start, end in sentence_chunks]
+        
+        source_path = document.get('filepath', document['filename'])
+        seen = {}
         result = []
-        for i, chunk in enumerate(chunks):
-            result.append({
-                'chunk_id': f"{document['filename']}_chunk_{i}",
+        for i, (section, start, end) in enumerate(spans):
+            chunk = {
                 'source_file': document['filename'],
+                'source_path': source_path,
                 'chunk_index': i,
-                'text': chunk,
-                'char_count': len(chunk)
-            })
+                'text': text[start:end],
+                'char_count': end - start,
+                'start_char': start,
+                'end_char': end
+            }
+            if section is not None:
+                chunk['section_path'] = list(section)
+                chunk['section'] = section[-1] if section else ''
+            chunk['chunk_id'] = chunk_id(source_path, document['filename'], embedding_text(chunk), seen)
+            result.append(chunk)
         
         return result
 
@@ -98,3 +461,26 @@ if __name__ == "__main__":
     for chunk in chunks:
         print(f"\n{chunk['chunk_id']}: {chunk['char_count']} chars")
         print(chunk['text'][:100])
+    
+    # Modo markdown: los títulos van a section_path, no al texto
+    md_doc = {
+        'filename': 'test.md',
+        'content': """# Cuidado de Suculentas
+
+## Riego
+- **Frecuencia**: Cada 10-14 días en verano
+- **Señales de exceso**: Hojas amarillas y blandas
+
+## Luz
+Prefieren luz indirecta brillante."""
+    }
+    for chunk in TextChunker(chunk_size=300, overlap=30, mode='markdown').chunk_document(md_doc):
+        print(f"\n{' > '.join(chunk['section_path'])}: {chunk['text']!r}")
+    
+    # Rendimiento con un documento de ~1 MB
+    import time
+    big_text = test_doc['content'] * 4000
+    start = time.perf_counter()
+    spans = TextChunker(chunk_size=400, overlap=50).chunk_spans(big_text)
+    elapsed = time.perf_counter() - start
+    print(f"\n{len(big_text) / 1e6:.1f} MB -> {len(spans)} chunks en {elapsed * 1000:.0f} ms")
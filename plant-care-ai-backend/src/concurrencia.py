@@ -0,0 +1,139 @@
+"""
+Módulo de Concurrencia
+Utilidades para no bloquear el event loop de FastAPI:
+- Un pool de hilos acotado para trabajo bloqueante o de CPU (embeddings, cliente
+  síncrono de Supabase, lectura de imágenes)
+- Un semáforo asyncio por servicio externo (Gemini, Plant.id, Ollama) para limitar
+  cuántas llamadas simultáneas salen hacia cada uno
+- Un cliente HTTP asíncrono compartido (httpx) con conexiones reutilizables
+
+El cliente HTTP y los semáforos quedan ligados a su event loop: se guarda uno por
+loop, así los scripts síncronos (run_sync) no interfieren con el loop del servidor.
+"""
+import os
+import asyncio
+import functools
+import weakref
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+import httpx
+
+# Hilos para trabajo bloqueante (el encode de sentence-transformers libera el GIL)
+BLOCKING_WORKERS = int(os.getenv("BLOCKING_WORKERS", "4"))
+
+# Llamadas simultáneas permitidas hacia cada servicio externo
+UPSTREAM_LIMITS = {
+    'gemini': int(os.getenv("GEMINI_MAX_CONCURRENCY", "8")),
+    'plant_id': int(os.getenv("PLANT_ID_MAX_CONCURRENCY", "4")),
+    'ollama': int(os.getenv("OLLAMA_MAX_CONCURRENCY", "2")),
+}
+
+_executor: Optional[ThreadPoolExecutor] = None
+# Por event loop: {loop: {servicio: semáforo}} y {loop: cliente}
+_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = weakref.WeakKeyDictionary()
+_in_flight: Dict[str, int] = {}
+_http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Pool de hilos compartido para trabajo bloqueante"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix="plantcare-io")
+    return _executor
+
+
+async def run_blocking(func: Callable, *args, **kwargs):
+    """
+    Ejecuta una función bloqueante en el pool acotado sin bloquear el event loop
+    
+    Args:
+        func: Función síncrona
+        *args, **kwargs: Argumentos de la función
+        
+    Returns:
+        Lo que retorne func
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(func, *args, **kwargs))
+
+
+@asynccontextmanager
+async def upstream(name: str):
+    """
+    Limita las llamadas concurrentes a un servicio externo
+    
+    Uso:
+        async with upstream('gemini'):
+            response = await model.generate_content_async(prompt)
+    """
+    semaphores = _semaphores.setdefault(asyncio.get_running_loop(), {})
+    semaphore = semaphores.get(name)
+    if semaphore is None:
+        semaphore = semaphores[name] = asyncio.Semaphore(UPSTREAM_LIMITS.get(name, 4))
+    async with semaphore:
+        _in_flight[name] = _in_flight.get(name, 0) + 1
+        try:
+            yield
+        finally:
+            _in_flight[name] -= 1
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Cliente HTTP asíncrono compartido por el loop actual (pool de conexiones keep-alive)"""
+    loop = asyncio.get_running_loop()
+    client = _http_clients.get(loop)
+    if client is None or client.is_closed:
+        client = _http_clients[loop] = httpx.AsyncClient(timeout=httpx.Timeout(30.0, connect=5.0))
+    return client
+
+
+async def close_http_client():
+    """Cierra el cliente HTTP del loop actual, si se llegó a crear"""
+    client = _http_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def run_sync(func: Callable, *args, **kwargs):
+    """
+    Ejecuta una corrutina desde código síncrono (scripts, agente LangChain)
+    
+    Usa un event loop propio y cierra su cliente HTTP al terminar. No se puede
+    llamar desde un hilo que ya tiene un loop en marcha: ahí se usa await.
+    
+    Args:
+        func: Función async
+        *args, **kwargs: Argumentos de la función
+        
+    Returns:
+        Lo que retorne la corrutina
+    """
+    async def runner():
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            await close_http_client()
+    return asyncio.run(runner())
+
+
+async def shutdown():
+    """Cierra el cliente HTTP y el pool de hilos (evento shutdown de FastAPI)"""
+    global _executor
+    await close_http_client()
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+
+
+def concurrency_stats() -> dict:
+    """Límites y llamadas en curso por servicio externo"""
+    return {
+        'blocking_workers': BLOCKING_WORKERS,
+        'upstreams': {
+            name: {'limit': limit, 'in_flight': _in_flight.get(name, 0)}
+            for name, limit in UPSTREAM_LIMITS.items()
+        }
+    }
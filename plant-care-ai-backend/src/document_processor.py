@@ -3,7 +3,20 @@ Procesador Inteligente de Documentos
 Analiza documentos encontrados y genera respuestas contextuales sin LLM
 """
 import re
-from typing import List, Dict
+from typing import List, Dict, Optional
+
+# Patrones de limpieza compilados una vez (se aplican a cada documento de cada petición)
+_MD_HEADING_LINE = re.compile(r'^#{1,6}\s+', re.MULTILINE)
+_MD_HEADING = re.compile(r'#{1,6}\s+')
+_ELLIPSIS = re.compile(r'\.\.\.+')
+_ONLY_MARKERS = re.compile(r'^[\d\.\-\•\*]+$')
+
+
+def strip_markup(text: str) -> str:
+    """Quita encabezados markdown y puntos suspensivos, conservando los saltos de línea"""
+    text = _MD_HEADING_LINE.sub('', text)
+    text = _MD_HEADING.sub('', text)
+    return _ELLIPSIS.sub('', text)
 
 
 class DocumentProcessor:
@@ -19,13 +32,16 @@ class DocumentProcessor:
             'cuando': ['momento', 'época', 'tiempo', 'condición']
         }
     
-    def extract_relevant_info(self, query: str, documents: List[Dict]) -> str:
+    def extract_relevant_info(self, query: str, documents: List[Dict],
+                              stripped_docs: Optional[List[Dict]] = None) -> str:
         """
         Extrae información relevante de documentos basándose en la pregunta
         
         Args:
             query: Pregunta del usuario
             documents: Lista de documentos encontrados con relevancia
+            stripped_docs: Los mismos documentos ya pasados por strip_markup
+                           ({'text', 'score', 'source'}), si el llamador ya los limpió
             
         Returns:
             Respuesta estructurada basada en los documentos
@@ -36,15 +52,20 @@ class DocumentProcessor:
         query_lower = query.lower().strip()
         
         # Limpiar y combinar documentos
-        cleaned_docs = []
-        for doc in documents[:5]:  # Top 5 documentos
-            doc_text = self._clean_document(doc['text'])
-            if doc_text:
-                cleaned_docs.append({
-                    'text': doc_text,
+        if stripped_docs is None:
+            stripped_docs = [
+                {
+                    'text': strip_markup(doc['text']),
                     'score': doc['relevance_score'],
                     'source': doc.get('source', 'desconocido')
-                })
+                }
+                for doc in documents[:5]  # Top 5 documentos
+            ]
+        cleaned_docs = []
+        for doc in stripped_docs[:5]:
+            doc_text = self._join_lines(doc['text'])
+            if doc_text:
+                cleaned_docs.append({**doc, 'text': doc_text})
         
         if not cleaned_docs:
             return None
@@ -68,15 +89,14 @@ class DocumentProcessor:
     
     def _clean_document(self, text: str) -> str:
         """Limpia el texto del documento"""
-        # Eliminar markdown
-        text = re.sub(r'^#{1,6}\s+', '', text, flags=re.MULTILINE)
-        text = re.sub(r'#{1,6}\s+', '', text)
-        text = re.sub(r'\.\.\.+', '', text)
-        
+        return self._join_lines(strip_markup(text))
+    
+    def _join_lines(self, text: str) -> str:
+        """Une las líneas útiles de un texto ya sin markdown"""
         # Eliminar líneas muy cortas o solo números
         lines = [l.strip() for l in text.split('\n') 
                 if l.strip() and len(l.strip()) > 10 
-                and not re.match(r'^[\d\.\-\•\*]+$', l.strip())]
+                and not _ONLY_MARKERS.match(l.strip())]
         
         return ' '.join(lines)
     
@@ -2,52 +2,425 @@
 Módulo de Embeddings
 Genera embeddings vectoriales usando sentence-transformers
 """
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+from collections import OrderedDict
 from sentence_transformers import SentenceTransformer
 import numpy as np
-from typing import List, Union
+from typing import List, Union, Optional, Tuple
+
+# Caché en disco de embeddings de chunks (la usan process_documents.py y reindex_all.py)
+DEFAULT_DISK_CACHE_DIR = os.getenv("EMBEDDING_DISK_CACHE_DIR", "data/cache_embeddings")
+
+
+class DiskEmbeddingCache:
+    """
+    Caché persistente de embeddings direccionada por contenido
+    
+    Cada modelo tiene su propio subdirectorio con dos archivos de solo-anexar:
+    - keys.bin: digests SHA-1 (20 bytes) del texto de cada chunk
+    - vectors.f32: embeddings float32 en bruto, una fila por clave
+    Así, reindexar tras editar un archivo solo codifica los chunks nuevos.
+    
+    Las filas ya guardadas se leen con un memmap (no se cargan en RAM); las que se
+    anexan durante la ejecución van a un búfer que crece por duplicación. compact()
+    reescribe los archivos con solo las entradas usadas en esta ejecución.
+    """
+    
+    KEY_SIZE = 20
+    # Filas iniciales del búfer de filas nuevas
+    INITIAL_TAIL_ROWS = 1024
+    
+    def __init__(self, cache_dir: str, model_name: str, embedding_dim: int):
+        """
+        Args:
+            cache_dir: Directorio raíz de la caché
+            model_name: Modelo de embeddings (las entradas no se comparten entre modelos)
+            embedding_dim: Dimensión de los embeddings del modelo
+        """
+        slug = re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name)
+        self.path = Path(cache_dir) / slug
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.keys_file = self.path / "keys.bin"
+        self.vectors_file = self.path / "vectors.f32"
+        self.embedding_dim = embedding_dim
+        self._lock = threading.Lock()
+        
+        meta_file = self.path / "meta.json"
+        if meta_file.exists():
+            meta = json.loads(meta_file.read_text(encoding='utf-8'))
+            if meta.get('embedding_dim') != embedding_dim:
+                print(f"⚠ Caché de embeddings con dimensión distinta, se descarta: {self.path}")
+                self.keys_file.unlink(missing_ok=True)
+                self.vectors_file.unlink(missing_ok=True)
+        meta_file.write_text(json.dumps({'model_name': model_name, 'embedding_dim': embedding_dim}), encoding='utf-8')
+        
+        self._index = {}
+        self._used = set()
+        self._load()
+    
+    @staticmethod
+    def text_key(text: str) -> bytes:
+        """Clave de contenido de un texto (SHA-1 de su UTF-8)"""
+        return hashlib.sha1(text.encode('utf-8')).digest()
+    
+    def _load(self):
+        """Carga claves y vectores, descartando una cola incompleta (escritura interrumpida)"""
+        keys = self.keys_file.read_bytes() if self.keys_file.exists() else b''
+        n_keys = len(keys) // self.KEY_SIZE
+        row_bytes = self.embedding_dim * 4
+        n_rows = self.vectors_file.stat().st_size // row_bytes if self.vectors_file.exists() else 0
+        n = min(n_keys, n_rows)
+        
+        if n_keys != n or (self.vectors_file.exists() and self.vectors_file.stat().st_size != n * row_bytes):
+            # Truncar ambos archivos al último registro completo
+            with open(self.keys_file, 'r+b' if self.keys_file.exists() else 'wb') as f:
+                f.truncate(n * self.KEY_SIZE)
+            with open(self.vectors_file, 'r+b' if self.vectors_file.exists() else 'wb') as f:
+                f.truncate(n * row_bytes)
+        
+        if n:
+            self._vectors = np.memmap(self.vectors_file, dtype=np.float32, mode='r', shape=(n, self.embedding_dim))
+        else:
+            self._vectors = np.empty((0, self.embedding_dim), dtype=np.float32)
+        self._tail = np.empty((0, self.embedding_dim), dtype=np.float32)
+        self._tail_count = 0
+        self._index = {keys[i * self.KEY_SIZE:(i + 1) * self.KEY_SIZE]: i for i in range(n)}
+    
+    def __len__(self) -> int:
+        return len(self._index)
+    
+    def lookup(self, texts: List[str]) -> Tuple[List[bytes], List[Optional[int]]]:
+        """
+        Busca textos en la caché
+        
+        Returns:
+            Tupla (claves, filas) donde fila es None si el texto no está en caché
+        """
+        keys = [self.text_key(text) for text in texts]
+        with self._lock:
+            rows = [self._index.get(key) for key in keys]
+            self._used.update(keys)
+        return keys, rows
+    
+    def get_rows(self, rows: List[int]) -> np.ndarray:
+        """Embeddings de las filas indicadas (copia en RAM)"""
+        rows = np.asarray(rows, dtype=np.int64)
+        n_mapped = len(self._vectors)
+        out = np.empty((len(rows), self.embedding_dim), dtype=np.float32)
+        mapped = rows < n_mapped
+        out[mapped] = self._vectors[rows[mapped]]
+        out[~mapped] = self._tail[rows[~mapped] - n_mapped]
+        return out
+    
+    def add(self, keys: List[bytes], embeddings: np.ndarray):
+        """
+        Agrega embeddings nuevos (los vectores se escriben antes que las claves,
+        así una clave nunca apunta a un vector que no llegó a disco)
+        """
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        with self._lock:
+            new = [(key, emb) for key, emb in zip(keys, embeddings) if key not in self._index]
+            if not new:
+                return
+            new_keys = [key for key, _ in new]
+            new_vectors = np.stack([emb for _, emb in new])
+            
+            with open(self.vectors_file, 'ab') as f:
+                f.write(new_vectors.tobytes())
+            with open(self.keys_file, 'ab') as f:
+                f.write(b''.join(new_keys))
+            
+            # Búfer de filas nuevas: crece por duplicación (coste amortizado lineal)
+            needed = self._tail_count + len(new_vectors)
+            if needed > len(self._tail):
+                grown = np.empty((max(needed, 2 * len(self._tail), self.INITIAL_TAIL_ROWS), self.embedding_dim),
+                                 dtype=np.float32)
+                grown[:self._tail_count] = self._tail[:self._tail_count]
+                self._tail = grown
+            self._tail[self._tail_count:needed] = new_vectors
+            
+            start = len(self._vectors) + self._tail_count
+            self._tail_count = needed
+            for offset, key in enumerate(new_keys):
+                self._index[key] = start + offset
+    
+    def compact(self) -> int:
+        """
+        Reescribe la caché con solo las entradas consultadas en esta ejecución
+        
+        Tras una indexación completa son exactamente los chunks del corpus actual;
+        el resto (chunks editados o borrados) se descarta. Primero se borra keys.bin:
+        si el proceso se corta a mitad, la caché queda vacía, nunca desalineada.
+        
+        Returns:
+            Número de entradas eliminadas
+        """
+        with self._lock:
+            keep = [(key, row) for key, row in self._index.items() if key in self._used]
+            removed = len(self._index) - len(keep)
+            if not removed:
+                return 0
+            
+            vectors_tmp = self.path / "vectors.f32.tmp"
+            keys_tmp = self.path / "keys.bin.tmp"
+            with open(vectors_tmp, 'wb') as f:
+                for start in range(0, len(keep), self.INITIAL_TAIL_ROWS):
+                    block = keep[start:start + self.INITIAL_TAIL_ROWS]
+                    f.write(self.get_rows([row for _, row in block]).tobytes())
+            keys_tmp.write_bytes(b''.join(key for key, _ in keep))
+            
+            # Soltar el memmap antes de reemplazar el archivo
+            self._vectors = np.empty((0, self.embedding_dim), dtype=np.float32)
+            self.keys_file.unlink(missing_ok=True)
+            os.replace(vectors_tmp, self.vectors_file)
+            os.replace(keys_tmp, self.keys_file)
+            self._load()
+            return removed
+
+
+class TokenCounter:
+    """
+    Cuenta tokens (word-pieces) con el tokenizer del modelo de embeddings
+    
+    Se puede enviar a otros procesos (ingesta paralela): al serializarse solo viaja
+    el nombre del modelo y el tokenizer se vuelve a cargar en el proceso destino.
+    """
+    
+    def __init__(self, model_name: str, max_tokens: int, tokenizer=None):
+        """
+        Args:
+            model_name: Modelo cuyo tokenizer se usa
+            max_tokens: Tokens que el modelo vectoriza por texto (sin los especiales)
+            tokenizer: Tokenizer ya cargado (opcional)
+        """
+        self.model_name = model_name
+        self.max_tokens = max_tokens
+        self._tokenizer = tokenizer
+    
+    def __getstate__(self):
+        return {'model_name': self.model_name, 'max_tokens': self.max_tokens, '_tokenizer': None}
+    
+    @property
+    def tokenizer(self):
+        if self._tokenizer is None:
+            from transformers import AutoTokenizer
+            self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        return self._tokenizer
+    
+    def __call__(self, texts: List[str]) -> List[int]:
+        """Número de tokens de cada texto (sin [CLS]/[SEP] ni truncar)"""
+        if not texts:
+            return []
+        encoded = self.tokenizer(list(texts), add_special_tokens=False, truncation=False,
+                                 return_attention_mask=False, return_token_type_ids=False, verbose=False)
+        return [len(ids) for ids in encoded['input_ids']]
 
 
 class EmbeddingGenerator:
     """Genera embeddings usando modelos de sentence-transformers"""
     
-    def __init__(self, model_name: str = 'sentence-transformers/all-MiniLM-L6-v2'):
+    def __init__(self, model_name: str = 'sentence-transformers/all-MiniLM-L6-v2',
+                 cache_size: Optional[int] = None, cache_ttl: Optional[float] = None,
+                 disk_cache_dir: Optional[str] = None, track_truncation: bool = False):
         """
         Inicializa el generador de embeddings
         
         Args:
             model_name: Nombre del modelo de sentence-transformers
                        'all-MiniLM-L6-v2' genera embeddings de 384 dimensiones
+            cache_size: Máximo de consultas en la caché LRU de generate_embedding
+                        (None = EMBEDDING_CACHE_SIZE o 1024; 0 desactiva la caché)
+            cache_ttl: Segundos de validez de cada entrada (None = EMBEDDING_CACHE_TTL;
+                       0 = sin expiración)
+            disk_cache_dir: Si se indica, generate_embeddings_batch consulta una caché
+                            persistente por (modelo, hash del texto) antes de codificar
+            track_truncation: Contar los textos que el modelo trunca (solo en indexación:
+                              cuesta una pasada extra del tokenizer por lote)
         """
         print(f"Cargando modelo de embeddings: {model_name}...")
+        self.model_name = model_name
         self.model = SentenceTransformer(model_name)
         self.embedding_dim = self.model.get_sentence_embedding_dimension()
         print(f"✓ Modelo cargado. Dimensiones: {self.embedding_dim}")
+        
+        # El modelo trunca cada texto en max_seq_length tokens, incluidos [CLS] y [SEP]
+        tokenizer = getattr(self.model, 'tokenizer', None)
+        special_tokens = tokenizer.num_special_tokens_to_add() if tokenizer is not None else 2
+        self.max_tokens = self.model.max_seq_length - special_tokens
+        self.token_counter = TokenCounter(model_name, self.max_tokens, tokenizer)
+        self.track_truncation = track_truncation
+        self._truncation_lock = threading.Lock()
+        self.encoded_texts = 0
+        self.truncated_texts = 0
+        self.truncated_tokens = 0
+        
+        # Caché LRU de embeddings de consultas (el chat repite mucho las mismas preguntas)
+        self.cache_size = cache_size if cache_size is not None else int(os.getenv("EMBEDDING_CACHE_SIZE", "1024"))
+        self.cache_ttl = cache_ttl if cache_ttl is not None else float(os.getenv("EMBEDDING_CACHE_TTL", "0"))
+        self._query_cache = OrderedDict()  # texto normalizado -> (embedding, timestamp)
+        self._cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        
+        self.disk_cache = None
+        self.disk_cache_reused = 0
+        self.disk_cache_encoded = 0
+        if disk_cache_dir:
+            self.disk_cache = DiskEmbeddingCache(disk_cache_dir, model_name, self.embedding_dim)
+            print(f"✓ Caché de embeddings en disco: {self.disk_cache.path} ({len(self.disk_cache)} entradas)")
+    
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        """
+        Normaliza una consulta para usarla como clave de caché
+        
+        Colapsa espacios y pasa a minúsculas; all-MiniLM-L6-v2 usa un tokenizer
+        sin mayúsculas, así que ambas variantes producen el mismo embedding.
+        """
+        return ' '.join(text.split()).lower()
     
     def generate_embedding(self, text: str) -> np.ndarray:
         """
-        Genera embedding para un texto
+        Genera embedding para un texto (con caché LRU por texto normalizado)
         
         Args:
             text: Texto a convertir en embedding
             
         Returns:
-            Vector numpy de embedding normalizado
+            Vector numpy de embedding normalizado (solo lectura si viene de caché)
         """
+        if self.cache_size <= 0:
+            return self.model.encode(text, normalize_embeddings=True)
+        
+        key = self.normalize_text(text)
+        now = time.monotonic()
+        with self._cache_lock:
+            entry = self._query_cache.get(key)
+            if entry is not None:
+                embedding, created_at = entry
+                if not self.cache_ttl or now - created_at < self.cache_ttl:
+                    self._query_cache.move_to_end(key)
+                    self.cache_hits += 1
+                    return embedding
+                del self._query_cache[key]
+            self.cache_misses += 1
+        
+        # Codificar fuera del lock para no serializar consultas distintas
         embedding = self.model.encode(text, normalize_embeddings=True)
+        embedding.flags.writeable = False
+        
+        with self._cache_lock:
+            self._query_cache[key] = (embedding, now)
+            self._query_cache.move_to_end(key)
+            while len(self._query_cache) > self.cache_size:
+                self._query_cache.popitem(last=False)
+        
         return embedding
     
-    def generate_embeddings_batch(self, texts: List[str]) -> np.ndarray:
+    def cache_stats(self) -> dict:
+        """Contadores de la caché de consultas"""
+        with self._cache_lock:
+            total = self.cache_hits + self.cache_misses
+            return {
+                'hits': self.cache_hits,
+                'misses': self.cache_misses,
+                'hit_rate': self.cache_hits / total if total else 0.0,
+                'size': len(self._query_cache),
+                'max_size': self.cache_size,
+                'ttl_seconds': self.cache_ttl
+            }
+    
+    def clear_cache(self):
+        """Vacía la caché de consultas (los contadores se mantienen)"""
+        with self._cache_lock:
+            self._query_cache.clear()
+    
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        """Número de tokens de cada texto según el tokenizer del modelo"""
+        return self.token_counter(texts)
+    
+    def _track_truncation(self, texts: List[str]):
+        """Acumula cuántos textos codificados exceden max_tokens (el modelo corta la cola)"""
+        if not self.track_truncation:
+            return
+        lost = [n - self.max_tokens for n in self.token_counter(texts) if n > self.max_tokens]
+        with self._truncation_lock:
+            self.encoded_texts += len(texts)
+            self.truncated_texts += len(lost)
+            self.truncated_tokens += sum(lost)
+    
+    def truncation_stats(self) -> dict:
+        """Textos codificados en lote que el modelo truncó y tokens que quedaron fuera"""
+        with self._truncation_lock:
+            return {
+                'encoded': self.encoded_texts,
+                'truncated': self.truncated_texts,
+                'truncated_rate': self.truncated_texts / self.encoded_texts if self.encoded_texts else 0.0,
+                'tokens_lost': self.truncated_tokens,
+                'max_tokens': self.max_tokens
+            }
+    
+    def report_truncation(self):
+        """Imprime el resumen de truncamiento de la indexación"""
+        stats = self.truncation_stats()
+        if stats['truncated']:
+            print(f"⚠ {stats['truncated']} de {stats['encoded']} chunks superan {stats['max_tokens']} tokens "
+                  f"({stats['tokens_lost']} tokens sin vectorizar); considera CHUNKING_UNIT=tokens")
+        elif stats['encoded']:
+            print(f"✓ Ningún chunk supera {stats['max_tokens']} tokens ({stats['encoded']} codificados)")
+    
+    def report_disk_cache(self, compact: bool = False):
+        """
+        Imprime el resumen de la caché en disco de la indexación
+        
+        Args:
+            compact: Descartar las entradas que no se usaron (solo tras indexar todo el corpus)
+        """
+        if self.disk_cache is None:
+            return
+        removed = self.disk_cache.compact() if compact else 0
+        print(f"✓ Caché de embeddings: {self.disk_cache_reused} reutilizados, {self.disk_cache_encoded} codificados"
+              + (f", {removed} entradas obsoletas eliminadas" if removed else ""))
+    
+    def generate_embeddings_batch(self, texts: List[str], show_progress_bar: bool = True) -> np.ndarray:
         """
         Genera embeddings para múltiples textos (más eficiente)
         
         Args:
             texts: Lista de textos
+            show_progress_bar: Mostrar barra de progreso (útil en indexación)
             
         Returns:
             Array numpy de embeddings normalizados
         """
-        embeddings = self.model.encode(texts, normalize_embeddings=True, show_progress_bar=True)
-        return embeddings
+        if self.disk_cache is None:
+            self._track_truncation(texts)
+            return self.model.encode(texts, normalize_embeddings=True, show_progress_bar=show_progress_bar)
+        
+        keys, rows = self.disk_cache.lookup(texts)
+        
+        # Codificar solo los textos que no están en caché (una vez por texto distinto)
+        missing = {}
+        for i, (key, row) in enumerate(zip(keys, rows)):
+            if row is None and key not in missing:
+                missing[key] = i
+        if missing:
+            missing_texts = [texts[i] for i in missing.values()]
+            self._track_truncation(missing_texts)
+            new_embeddings = self.model.encode(missing_texts, normalize_embeddings=True,
+                                               show_progress_bar=show_progress_bar)
+            self.disk_cache.add(list(missing.keys()), new_embeddings)
+            keys, rows = self.disk_cache.lookup(texts)
+        
+        self.disk_cache_reused += len(texts) - len(missing)
+        self.disk_cache_encoded += len(missing)
+        return self.disk_cache.get_rows(rows) if rows else np.empty((0, self.embedding_dim), dtype=np.float32)
     
     def cosine_similarity(self, embedding1: np.ndarray, embedding2: np.ndarray) -> float:
         """
@@ -3,7 +3,9 @@ Módulo de Extracción de Datos
 Extrae información de documentos de texto sobre cuidado de plantas
 """
 import os
-from typing import List
+import queue
+import threading
+from typing import List, Iterator
 from pathlib import Path
 
 
@@ -31,31 +33,65 @@ class DataExtractor:
             print(f"Error al leer {filepath}: {e}")
             return ""
     
-    def extract_all_documents(self) -> List[dict]:
+    def iter_documents(self, prefetch: int = 0) -> Iterator[dict]:
         """
-        Extrae todos los documentos del directorio de datos
+        Extrae documentos de forma perezosa, uno a la vez
         
-        Returns:
-            Lista de diccionarios con 'filename' y 'content'
+        Args:
+            prefetch: Si > 0, un hilo lee por adelantado hasta este número de
+                      documentos (cola acotada), para solapar la lectura de archivos
+                      con el procesamiento del consumidor
+            
+        Yields:
+            Diccionarios con 'filename', 'filepath' y 'content'
         """
-        documents = []
+        if prefetch > 0:
+            yield from self._iter_prefetched(prefetch)
+            return
         
         if not self.data_dir.exists():
             print(f"Directorio {self.data_dir} no existe")
-            return documents
+            return
         
         # Buscar archivos .txt y .md
         for ext in ['*.txt', '*.md']:
             for filepath in self.data_dir.rglob(ext):
                 content = self.extract_from_file(filepath)
                 if content:
-                    documents.append({
+                    print(f"✓ Extraído: {filepath.name}")
+                    yield {
                         'filename': filepath.name,
                         'filepath': str(filepath),
                         'content': content
-                    })
-                    print(f"✓ Extraído: {filepath.name}")
+                    }
+    
+    def _iter_prefetched(self, prefetch: int) -> Iterator[dict]:
+        """Lee documentos en un hilo de fondo hacia una cola acotada"""
+        pending = queue.Queue(maxsize=prefetch)
+        done = object()
         
+        def reader():
+            try:
+                for document in self.iter_documents():
+                    pending.put(document)
+            finally:
+                pending.put(done)
+        
+        threading.Thread(target=reader, daemon=True).start()
+        while True:
+            document = pending.get()
+            if document is done:
+                return
+            yield document
+    
+    def extract_all_documents(self) -> List[dict]:
+        """
+        Extrae todos los documentos del directorio de datos
+        
+        Returns:
+            Lista de diccionarios con 'filename' y 'content'
+        """
+        documents = list(self.iter_documents())
         print(f"\nTotal documentos extraídos: {len(documents)}")
         return documents
 
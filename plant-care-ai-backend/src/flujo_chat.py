@@ -0,0 +1,610 @@
+"""
+Flujo de Chat
+Orquesta /api/chat en una sola pasada: clasifica la pregunta, recupera los documentos
+una vez y calcula una vez el contexto limpio y la relevancia. Después se los entrega al
+primer nivel de generación que responda:
+Gemini → LLM local (Ollama) → DocumentProcessor → resumen extractivo → modo demo
+La misma cascada se sirve completa (run) o por trozos según se genera (stream).
+Delante de todo, una caché semántica devuelve la respuesta de una pregunta parecida ya
+contestada (mismo historial y mismo corpus) sin recuperar documentos ni generar.
+"""
+import re
+import traceback
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Tuple
+
+import numpy as np
+
+from cache_semantico import SemanticAnswerCache
+from concurrencia import run_blocking, upstream
+from document_processor import DocumentProcessor, strip_markup
+from sanitizador import ResponseSanitizer, has_markdown, sanitize_response
+
+# Relevancia mínima para usar los documentos (por debajo: "no encontré información")
+MIN_RELEVANCE = 0.25
+# Por debajo se avisa en el log de que los documentos son poco relevantes
+LOW_RELEVANCE = 0.3
+# Respuestas de Gemini con relevancia menor se validan contra palabras de plantas
+OFF_TOPIC_RELEVANCE = 0.4
+
+# Preguntas conceptuales generales que no son sobre cuidado de plantas
+CONCEPTUAL_PATTERNS = [
+    'que es una', 'que es un', 'que es el', 'que es la', 'que son las', 'que son los',
+    'que significa', 'definicion', 'definición', 'concepto de', 'que quiere decir'
+]
+
+# Palabras clave específicas de cuidado de plantas (no solo palabras relacionadas)
+PLANT_CARE_KEYWORDS = ['riego', 'cuidado', 'cuidar', 'mantener', 'regar', 'suelo', 'tierra',
+                       'luz', 'sol', 'sombra', 'maceta', 'trasplante', 'poda', 'fertilizante',
+                       'enfermedad', 'plaga', 'problema', 'hoja amarilla', 'hoja marron',
+                       'como cuidar', 'como mantener', 'como regar', 'cuando regar',
+                       'suculenta', 'cactus', 'bonsai', 'orquidea', 'helecho']
+
+# Palabras relacionadas con plantas (la pregunta merece una búsqueda)
+PLANT_KEYWORDS = ['planta', 'flor', 'hoja', 'jardín', 'verde', 'semilla', 'raíz', 'tallo']
+
+# Validación final de respuestas de Gemini con baja relevancia
+ON_TOPIC_WORDS = ['planta', 'flor', 'hoja', 'riego', 'cuidado', 'suelo', 'luz', 'agua', 'maceta', 'jardín', 'verde', 'semilla', 'raíz', 'tallo', 'bonsai', 'suculenta', 'cactus', 'tropical']
+
+CONCEPTUAL_RESPONSE = "Soy un asistente especializado en el cuidado práctico de plantas. Puedo ayudarte con:\n\n• Cómo cuidar diferentes tipos de plantas\n• Problemas comunes y sus soluciones\n• Recomendaciones de riego, luz y suelo\n• Identificación de problemas de salud\n• Propagación y trasplante\n\nSi tienes una pregunta específica sobre cómo cuidar una planta, estaré encantado de ayudarte. Por ejemplo: '¿Cómo cuido una suculenta?' o '¿Cuándo debo regar mi planta?'"
+
+OFF_TOPIC_RESPONSE = "Lo siento, pero esa pregunta no está relacionada con plantas. Soy un asistente especializado en cuidado de plantas. Puedo ayudarte con:\n\n• Identificación de plantas\n• Cuidado y mantenimiento\n• Problemas de salud de plantas\n• Recomendaciones de riego, luz y suelo\n• Tratamiento de plagas\n\n¿Tienes alguna pregunta sobre plantas que pueda ayudarte a resolver?"
+
+NO_INFO_RESPONSE = "Lo siento, no encontré información específica sobre esa pregunta en mi base de conocimiento. Por favor, intenta reformular tu pregunta o pregunta sobre otro aspecto del cuidado de plantas."
+
+FOLLOW_UP = '\n\n¿Te gustaría saber más sobre algún aspecto específico?'
+
+# Niveles cuyas respuestas se guardan en la caché semántica (los que cuestan una llamada
+# al LLM; los extractivos son baratos y el modo demo es una respuesta degradada)
+CACHED_TIERS = {'Gemini', 'LLM local'}
+# Respuestas fijas que esos niveles pueden devolver sin llamar al LLM: nunca se cachean
+CANNED_RESPONSES = {CONCEPTUAL_RESPONSE, OFF_TOPIC_RESPONSE, NO_INFO_RESPONSE}
+
+# Temas que busca el resumen extractivo en los documentos
+EXTRACTIVE_TOPICS = {
+    'riego': ['riego', 'agua', 'regar', 'humedad'],
+    'luz': ['luz', 'sol', 'iluminación', 'sombra'],
+    'suelo': ['suelo', 'tierra', 'drenaje', 'maceta'],
+    'temperatura': ['temperatura', 'frío', 'calor', 'clima'],
+    'propagación': ['propagación', 'reproducir', 'semilla', 'esqueje']
+}
+
+
+def not_found_response(message: str) -> str:
+    """Respuesta cuando ningún documento supera MIN_RELEVANCE"""
+    return f"Lo siento, no encontré información específica sobre '{message}' en mi base de conocimiento sobre cuidado de plantas. Puedo ayudarte con:\n\n• Cuidado de suculentas, cactus, plantas de interior\n• Problemas comunes de plantas\n• Riego, luz y suelo\n• Propagación y trasplante\n\n¿Te gustaría hacer una pregunta más específica sobre cuidado de plantas? Por ejemplo: '¿Cómo cuido una suculenta?'"
+
+
+def classify_message(message: str) -> Optional[str]:
+    """
+    Respuesta directa para preguntas que no requieren búsqueda
+    
+    Returns:
+        Texto de respuesta si la pregunta es conceptual general o ajena a las plantas;
+        None si hay que buscar en la base de conocimiento
+    """
+    message_lower = message.lower().strip()
+    is_conceptual_general = any(pattern in message_lower for pattern in CONCEPTUAL_PATTERNS)
+    is_plant_care_question = any(keyword in message_lower for keyword in PLANT_CARE_KEYWORDS)
+    
+    if is_conceptual_general and not is_plant_care_question:
+        return CONCEPTUAL_RESPONSE
+    
+    has_plant_keyword = any(keyword in message_lower for keyword in PLANT_KEYWORDS)
+    if not has_plant_keyword and not is_plant_care_question:
+        return OFF_TOPIC_RESPONSE
+    
+    return None
+
+
+class ChatContext:
+    """Todo lo que una petición de chat calcula una sola vez y comparten los niveles de generación"""
+    
+    def __init__(self, message: str, history: List, documents: List[dict],
+                 query_embedding: Optional[np.ndarray] = None):
+        """
+        Args:
+            message: Mensaje del usuario
+            history: Historial (objetos con role y content)
+            documents: Documentos recuperados por KnowledgeAgent
+            query_embedding: Embedding del mensaje (clave de la caché semántica)
+        """
+        self.message = message
+        self.history = history
+        self.documents = documents
+        self.query_embedding = query_embedding
+        self.max_relevance = max(doc['relevance_score'] for doc in documents) if documents else 0.0
+        
+        # Markdown y puntos suspensivos fuera, una vez por documento (top 5: lo máximo que usa un nivel)
+        self.stripped_docs = [
+            {
+                'text': strip_markup(doc['text']),
+                'score': doc['relevance_score'],
+                'source': doc.get('source', 'desconocido')
+            }
+            for doc in documents[:5]
+        ]
+        
+        self.history_context = "\n".join([
+            f"{'Usuario' if msg.role == 'user' else 'Asistente'}: {msg.content}"
+            for msg in history[-6:]  # Últimos 6 mensajes
+        ]) if history else ""
+        
+        if documents:
+            self.knowledge_context = "\n\n--- INFORMACIÓN DE REFERENCIA ---\n\n".join([
+                f"Fuente {i+1} (Relevancia: {doc['score']:.2f}):\n{doc['text']}"
+                for i, doc in enumerate(self.stripped_docs[:3])
+            ])
+        else:
+            self.knowledge_context = "No se encontró información relevante en la base de conocimiento sobre esta pregunta."
+    
+    @property
+    def has_documents(self) -> bool:
+        """Hay documentos con relevancia suficiente para responder con ellos"""
+        return bool(self.documents) and self.max_relevance >= MIN_RELEVANCE
+
+
+def gemini_prompt(ctx: ChatContext) -> str:
+    """Prompt conversacional para Gemini"""
+    return f"""Eres un experto en cuidado de plantas hablando directamente con un amigo que te pregunta sobre plantas. Responde de forma completamente natural y conversacional.
+
+⚠️ REGLAS ABSOLUTAS - NO PUEDES ROMPER ESTAS:
+1. NUNCA uses símbolos # ## ### #### ##### ###### en tu respuesta - está completamente prohibido
+2. NUNCA copies texto directamente - SIEMPRE explica con tus propias palabras de forma natural
+3. NUNCA uses frases como "Basándome en", "Según", "De acuerdo a" - responde directamente
+4. NUNCA dejes respuestas incompletas o truncadas - completa TODO lo que vas a explicar
+5. NUNCA uses formato técnico o de documento - solo lenguaje conversacional normal
+
+FORMATO DE RESPUESTA CORRECTO:
+- Comienza respondiendo directamente la pregunta
+- Usa párrafos normales y fluidos (no títulos, no secciones)
+- Si hay pasos o listas, usa viñetas (•) o números (1. 2. 3.) de forma natural dentro del texto
+- Explica todo completamente antes de terminar
+- Puedes usar emojis ocasionalmente (🌱💧☀️🌿)
+- Termina con una pregunta amigable opcional
+
+EJEMPLO INCORRECTO (NO HAGAS ESTO):
+"# Cuidado de Suculentas
+## Descripción General
+Las suculentas son plantas que almacenan agua...
+## Propagación
+1. Usar tierra..."
+
+EJEMPLO CORRECTO (HAZ ESTO):
+"Las suculentas son plantas increíbles que almacenan agua en sus hojas y tallos, lo que las hace muy resistentes. Son perfectas para principiantes porque requieren muy poco mantenimiento.
+
+Para cuidarlas correctamente, aquí tienes lo más importante:
+
+• Riego: Solo riega cuando la tierra esté completamente seca. En invierno puede ser cada 2-4 semanas.
+
+• Luz: Necesitan al menos 6 horas de luz solar directa al día.
+
+• Suelo: Usa una mezcla especial para cactus con buen drenaje.
+
+Si quieres propagarlas, puedes cortar una hoja, dejarla secar unos días, y luego plantarla. En 4-12 semanas deberías ver raíces nuevas.
+
+¿Te gustaría saber más sobre algún aspecto específico?"
+
+HISTORIAL DE CONVERSACIÓN:
+{ctx.history_context if ctx.history_context else "Primera pregunta del usuario."}
+
+INFORMACIÓN DE REFERENCIA DE SUPABASE (usa esto SOLO para entender el tema, luego explica TODO con tus propias palabras de forma natural):
+{ctx.knowledge_context}
+
+⚠️ IMPORTANTE: NO copies texto directamente de la información de referencia. NO uses títulos como "Descripción General", "Propagación por Semillas", "Ventajas", "Desventajas", etc. Explica TODO con tus propias palabras de forma conversacional y natural.
+
+PREGUNTA DEL USUARIO: {ctx.message}
+
+IMPORTANTE: Responde SOLO con texto normal, sin símbolos #, sin copiar texto, explicando todo con tus propias palabras de forma natural y completa. Responde ahora:"""
+
+
+def local_prompt(ctx: ChatContext) -> str:
+    """Prompt más simple para el LLM local"""
+    return f"""Eres un experto en cuidado de plantas. Responde de forma natural y conversacional.
+
+HISTORIAL:
+{ctx.history_context if ctx.history_context else "Primera pregunta."}
+
+INFORMACIÓN DE REFERENCIA:
+{ctx.knowledge_context[:1500] if ctx.knowledge_context else "No hay información específica disponible."}
+
+PREGUNTA: {ctx.message}
+
+Responde de forma natural, sin usar símbolos #, sin copiar texto directamente. Explica con tus propias palabras:"""
+
+
+def gemini_generation_config():
+    """Parámetros de Gemini para respuestas más completas y naturales"""
+    import google.generativeai as genai
+    try:
+        return genai.types.GenerationConfig(
+            temperature=0.9,  # Más creatividad para respuestas naturales y parafraseadas
+            top_p=0.95,
+            top_k=40,
+            max_output_tokens=2048,  # Respuestas más largas y completas
+        )
+    except:
+        # Fallback si GenerationConfig no está disponible
+        return {
+            "temperature": 0.9,
+            "top_p": 0.95,
+            "top_k": 40,
+            "max_output_tokens": 2048,
+        }
+
+
+def is_off_topic(ctx: ChatContext) -> bool:
+    """Con baja relevancia, la pregunta no menciona nada de plantas"""
+    if ctx.documents and ctx.max_relevance >= OFF_TOPIC_RELEVANCE:
+        return False
+    return not any(word in ctx.message.lower() for word in ON_TOPIC_WORDS)
+
+
+def is_quota_error(error: Exception) -> bool:
+    """Error de cuota (429 / ResourceExhausted) de Gemini"""
+    error_str = str(error)
+    return (
+        "429" in error_str or 
+        "ResourceExhausted" in error_str or 
+        "quota" in error_str.lower() or
+        "exceeded" in error_str.lower()
+    )
+
+
+def _single_piece(tier: Callable[[ChatContext], Awaitable[Optional[str]]]):
+    """Adapta un nivel que devuelve la respuesta completa a la interfaz de streaming"""
+    async def stream(ctx: ChatContext) -> AsyncIterator[str]:
+        response_text = await tier(ctx)
+        if response_text:
+            yield response_text
+    return stream
+
+
+class ChatPipeline:
+    """Orquestador de /api/chat: recupera una vez y prueba cada nivel de generación en orden"""
+    
+    def __init__(self, response_agent, local_llm=None, on_gemini_quota: Callable[[], None] = None):
+        """
+        Args:
+            response_agent: ResponseAgent (su knowledge_agent y su llm de Gemini)
+            local_llm: LocalLLM de respaldo (opcional)
+            on_gemini_quota: Se llama cuando Gemini agota la cuota (deshabilitarlo en la sesión)
+        """
+        self.response_agent = response_agent
+        self.local_llm = local_llm
+        self.on_gemini_quota = on_gemini_quota
+        # Sin estado por petición: una instancia para todo el proceso
+        self.processor = DocumentProcessor()
+        self.answer_cache = SemanticAnswerCache()
+        # Llamadas a Gemini y respuestas con markdown (las que antes se regeneraban)
+        self.gemini_calls = 0
+        self.markdown_responses = 0
+        self.tiers = [
+            ('Gemini', self._gemini),
+            ('LLM local', self._local_llm),
+            ('procesador de documentos', self._document_processor),
+            ('resumen extractivo', self._extractive),
+        ]
+        # Mismos niveles para stream(): los que no generan por trozos entregan todo de una vez
+        self.stream_tiers = [
+            ('Gemini', self._gemini_stream),
+            ('LLM local', self._local_llm_stream),
+            ('procesador de documentos', _single_piece(self._document_processor)),
+            ('resumen extractivo', _single_piece(self._extractive)),
+        ]
+    
+    async def run(self, message: str, history: List = None) -> str:
+        """
+        Responde un mensaje de chat
+        
+        Args:
+            message: Mensaje del usuario
+            history: Historial de la conversación
+            
+        Returns:
+            Texto de la respuesta
+        """
+        direct, ctx = await self._context(message, history)
+        if direct is not None:
+            return direct
+        
+        for name, tier in self.tiers:
+            try:
+                response_text = await tier(ctx)
+            except Exception as e:
+                print(f"⚠️ Error en nivel {name}: {e}")
+                traceback.print_exc()
+                continue
+            if response_text:
+                if name in CACHED_TIERS:
+                    self._remember(ctx, response_text)
+                return response_text
+        
+        return self._demo(ctx)
+    
+    async def stream(self, message: str, history: List = None) -> AsyncIterator[str]:
+        """
+        Responde un mensaje de chat por trozos, según se genera
+        
+        Gemini y el LLM local emiten el texto ya sanitizado a medida que llega; los demás
+        niveles entregan su respuesta de una vez. Un nivel que falla antes de emitir nada
+        cede el turno al siguiente; si falla a mitad, la respuesta termina ahí.
+        
+        Args:
+            message: Mensaje del usuario
+            history: Historial de la conversación
+            
+        Yields:
+            Trozos de texto de la respuesta
+        """
+        direct, ctx = await self._context(message, history)
+        if direct is not None:
+            yield direct
+            return
+        
+        for name, tier in self.stream_tiers:
+            pieces = []
+            try:
+                async for piece in tier(ctx):
+                    pieces.append(piece)
+                    yield piece
+            except Exception as e:
+                print(f"⚠️ Error en nivel {name}: {e}")
+                traceback.print_exc()
+                # Una respuesta cortada a mitad no se guarda en caché
+                if pieces:
+                    return
+            if pieces:
+                if name in CACHED_TIERS:
+                    self._remember(ctx, ''.join(pieces))
+                return
+        
+        yield self._demo(ctx)
+    
+    async def _context(self, message: str, history: List) -> Tuple[Optional[str], Optional[ChatContext]]:
+        """Respuesta directa sin generación (conceptual, fuera de tema, sin información, en caché) o el contexto"""
+        direct = classify_message(message)
+        if direct is not None:
+            return direct, None
+        
+        knowledge_agent = self.response_agent.knowledge_agent
+        query_embedding = None
+        if self.answer_cache.max_size > 0:
+            # La búsqueda de documentos vuelve a pedir este embedding y lo saca de la caché LRU
+            query_embedding = await run_blocking(knowledge_agent.embedding_generator.generate_embedding, message)
+            cached = self.answer_cache.get(query_embedding, history)
+            if cached is not None:
+                answer, similarity = cached
+                print(f"✓ Respuesta desde la caché semántica (similitud {similarity:.3f})")
+                return answer, None
+        
+        documents = await knowledge_agent.asearch_direct(message, top_k=5)
+        ctx = ChatContext(message, history or [], documents, query_embedding)
+        self._log_documents(ctx)
+        
+        if ctx.documents and ctx.max_relevance < MIN_RELEVANCE:
+            return not_found_response(message), None
+        return None, ctx
+    
+    def stats(self) -> dict:
+        """Contadores de /api/chat para /api/stats"""
+        return {
+            'gemini_calls': self.gemini_calls,
+            'markdown_responses': self.markdown_responses,
+            # Con el antiguo reintento cada respuesta con markdown costaba una segunda llamada
+            'retries_avoided': self.markdown_responses,
+            'markdown_rate': self.markdown_responses / self.gemini_calls if self.gemini_calls else 0.0
+        }
+    
+    def _remember(self, ctx: ChatContext, response_text: str):
+        """Guarda la respuesta final en la caché semántica (solo texto generado por el LLM)"""
+        if ctx.query_embedding is not None and response_text not in CANNED_RESPONSES:
+            self.answer_cache.put(ctx.query_embedding, ctx.history, response_text)
+    
+    def _log_documents(self, ctx: ChatContext):
+        if not ctx.documents:
+            print("⚠️ No se encontraron documentos")
+            return
+        print(f"📊 Documentos encontrados: {len(ctx.documents)}")
+        for i, doc in enumerate(ctx.documents[:3]):
+            print(f"  Doc {i+1}: relevancia={doc['relevance_score']:.3f}, fuente={doc.get('source', 'N/A')[:50]}")
+            print(f"    Texto preview: {doc.get('text', '')[:100]}...")
+        print(f"📈 Relevancia máxima: {ctx.max_relevance:.3f}")
+        if ctx.max_relevance < LOW_RELEVANCE:
+            print(f"⚠️ Relevancia máxima muy baja: {ctx.max_relevance:.3f}")
+    
+    async def _gemini(self, ctx: ChatContext) -> Optional[str]:
+        llm = self.response_agent.llm
+        if not llm:
+            return None
+        # Con baja relevancia, verificar que la pregunta sea realmente sobre plantas.
+        # No depende de la respuesta: se comprueba antes de gastar la llamada a Gemini
+        if is_off_topic(ctx):
+            return OFF_TOPIC_RESPONSE
+        
+        print("🤖 Usando LLM para generar respuesta")
+        prompt = gemini_prompt(ctx)
+        generation_config = gemini_generation_config()
+        
+        try:
+            # Una sola llamada: el markdown se limpia después (sanitize_response), no se regenera
+            self.gemini_calls += 1
+            async with upstream('gemini'):
+                response = await llm.generate_content_async(
+                    prompt,
+                    generation_config=generation_config
+                )
+            response_text = response.text.strip()
+        except Exception as e:
+            self._gemini_error(e)
+            traceback.print_exc()
+            print("⚠️ Gemini LLM no disponible o falló")
+            return None
+        
+        if has_markdown(response_text):
+            self.markdown_responses += 1
+            print("⚠️ Respuesta contiene markdown, se limpia sin volver a llamar a Gemini")
+        response_text = sanitize_response(response_text)
+        print(f"✅ Respuesta del LLM generada ({len(response_text)} caracteres)")
+        return response_text
+    
+    async def _gemini_stream(self, ctx: ChatContext) -> AsyncIterator[str]:
+        llm = self.response_agent.llm
+        if not llm:
+            return
+        # No depende de la respuesta: en streaming se comprueba antes de llamar a Gemini
+        if is_off_topic(ctx):
+            yield OFF_TOPIC_RESPONSE
+            return
+        
+        print("🤖 Usando LLM para generar respuesta (streaming)")
+        sanitizer = ResponseSanitizer()
+        length = 0
+        # Final del trozo anterior: un "## " puede llegar partido entre dos trozos
+        tail = ''
+        markdown = False
+        try:
+            self.gemini_calls += 1
+            async with upstream('gemini'):
+                response = await llm.generate_content_async(
+                    gemini_prompt(ctx),
+                    generation_config=gemini_generation_config(),
+                    stream=True
+                )
+                async for chunk in response:
+                    text = chunk.text
+                    markdown = markdown or has_markdown(tail + text)
+                    tail = text[-8:]
+                    piece = sanitizer.feed(text)
+                    if piece:
+                        length += len(piece)
+                        yield piece
+        except Exception as e:
+            self._gemini_error(e)
+            raise
+        
+        if markdown:
+            self.markdown_responses += 1
+        piece = sanitizer.finish()
+        if piece:
+            length += len(piece)
+            yield piece
+        print(f"✅ Respuesta del LLM generada ({length} caracteres)")
+    
+    def _gemini_error(self, error: Exception):
+        print(f"❌ Error generando respuesta con LLM: {error}")
+        if is_quota_error(error):
+            print("⚠️ Quota de Gemini agotada - deshabilitando LLM para esta sesión")
+            if self.on_gemini_quota:
+                self.on_gemini_quota()
+    
+    async def _local_llm(self, ctx: ChatContext) -> Optional[str]:
+        if not (self.local_llm and self.local_llm.available):
+            return None
+        
+        print(f"🤖 Intentando generar respuesta con LLM local ({self.local_llm.model})...")
+        local_response = await self.local_llm.agenerate(
+            prompt=local_prompt(ctx),
+            max_tokens=800,
+            temperature=0.8
+        )
+        if not local_response:
+            return None
+        
+        # Misma limpieza que Gemini y que la versión en streaming
+        local_response = sanitize_response(local_response)
+        
+        if len(local_response) > 50:
+            print(f"✅ Respuesta generada con LLM local ({len(local_response)} caracteres)")
+            return local_response
+        return None
+    
+    async def _local_llm_stream(self, ctx: ChatContext) -> AsyncIterator[str]:
+        if not (self.local_llm and self.local_llm.available):
+            return
+        
+        print(f"🤖 Intentando generar respuesta con LLM local ({self.local_llm.model}, streaming)...")
+        sanitizer = ResponseSanitizer()
+        # Como en _local_llm, una respuesta de 50 caracteres o menos cede el turno al
+        # siguiente nivel: no se emite nada hasta superar ese tamaño
+        pending = ''
+        length = 0
+        tokens = self.local_llm.astream(prompt=local_prompt(ctx), max_tokens=800, temperature=0.8)
+        async for token in tokens:
+            pending += sanitizer.feed(token)
+            if len(pending) > 50:
+                length += len(pending)
+                yield pending
+                pending = ''
+        pending += sanitizer.finish()
+        
+        if length or len(pending) > 50:
+            length += len(pending)
+            if pending:
+                yield pending
+            print(f"✅ Respuesta generada con LLM local ({length} caracteres)")
+    
+    async def _document_processor(self, ctx: ChatContext) -> Optional[str]:
+        if not ctx.has_documents:
+            return None
+        
+        print(f"📝 Usando procesador inteligente de documentos con {len(ctx.documents)} documentos")
+        response_text = await run_blocking(self.processor.extract_relevant_info, ctx.message, ctx.documents,
+                                           ctx.stripped_docs)
+        if not response_text:
+            return None
+        
+        response_text = re.sub(r'\s+', ' ', response_text)
+        if not response_text.endswith('.'):
+            response_text += '.'
+        return response_text + FOLLOW_UP
+    
+    async def _extractive(self, ctx: ChatContext) -> Optional[str]:
+        """Oraciones de los documentos que tratan los temas de cuidado más comunes"""
+        if not ctx.has_documents:
+            return None
+        
+        # Combinar información de múltiples documentos (sin líneas vacías o muy cortas)
+        combined_info = []
+        for doc in ctx.stripped_docs[:3]:
+            lines = [l.strip() for l in doc['text'].split('\n') if l.strip() and len(l.strip()) > 15]
+            combined_info.append(' '.join(lines))
+        full_text = ' '.join(combined_info)
+        
+        # Extraer información relevante según la pregunta
+        response_parts = []
+        
+        # Información general sobre suculentas
+        if 'suculent' in ctx.message.lower():
+            response_parts.append("Las suculentas son plantas que almacenan agua en sus hojas y tallos, lo que las hace muy resistentes y perfectas para principiantes.")
+        
+        full_sentences = [sentence.strip() for sentence in full_text.split('.')]
+        for topic, keywords in EXTRACTIVE_TOPICS.items():
+            relevant_sentences = [
+                sentence for sentence in full_sentences
+                if any(kw in sentence.lower() for kw in keywords) and 20 < len(sentence) < 200
+            ]
+            if relevant_sentences:
+                # Tomar las 2 más relevantes
+                response_parts.append('. '.join(relevant_sentences[:2]) + '.')
+        
+        # Si no encontramos información específica, usar las primeras oraciones útiles
+        if len(response_parts) < 2:
+            sentences = [s for s in full_sentences if 30 < len(s) < 250][:4]
+            response_parts.extend(sentences[:2])
+        
+        if not response_parts:
+            return None
+        
+        response_text = re.sub(r'\s+', ' ', ' '.join(response_parts))
+        if not response_text.endswith('.'):
+            response_text += '.'
+        return response_text + FOLLOW_UP
+    
+    def _demo(self, ctx: ChatContext) -> str:
+        print("📝 Sin respuesta de los niveles anteriores - usando modo demo")
+        try:
+            from demo_mode import get_demo_response
+            return get_demo_response(ctx.message)
+        except ImportError:
+            print("⚠️ Modo demo no disponible")
+            return NO_INFO_RESPONSE
@@ -0,0 +1,182 @@
+"""
+Módulo de Preprocesamiento de Imágenes
+Decodifica una sola vez la foto subida, aplica la orientación EXIF, la reduce a un
+lado máximo configurable y la recodifica como JPEG. El mismo buffer en memoria se
+entrega a Plant.id (base64) y a Gemini Vision (blob JPEG), en lugar de leer y
+enviar el archivo original a resolución completa en cada llamada.
+También calcula un resumen SHA-256 de los bytes subidos (la misma foto exacta) y un
+hash perceptual (dHash) para reconocer fotos casi idénticas.
+"""
+import os
+import io
+import base64
+import hashlib
+import threading
+from pathlib import Path
+from typing import Optional, Union
+
+from PIL import Image, ImageOps
+
+# Lado mayor tras el reescalado (px); las APIs de visión no ganan precisión por encima
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", "1024"))
+# Calidad JPEG de la recodificación
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+
+ImageSource = Union[str, Path, bytes, io.IOBase]
+
+
+class PreparedImage:
+    """
+    Imagen ya decodificada y orientada
+    
+    El reescalado y la recodificación JPEG se hacen una sola vez, la primera vez que
+    una API necesita los bytes; si el resultado sale de caché nunca se hacen.
+    """
+    
+    mime_type = "image/jpeg"
+    
+    def __init__(self, image: Image.Image, original_size: tuple, original_bytes: int,
+                 max_edge: int, quality: int, digest: str = ""):
+        """
+        Args:
+            image: Imagen PIL decodificada, orientada y en RGB
+            original_size: (ancho, alto) de la imagen subida
+            original_bytes: Tamaño en bytes de la imagen subida
+            digest: SHA-256 (hex) de los bytes subidos
+            max_edge: Lado mayor máximo en píxeles (0 = sin reducir)
+            quality: Calidad JPEG
+        """
+        self.original_size = original_size
+        self.original_bytes = original_bytes
+        self.digest = digest
+        self.dhash = difference_hash(image)
+        self.max_edge = max_edge
+        self.quality = quality
+        self._image = image
+        self._data: Optional[bytes] = None
+        self._size: Optional[tuple] = None
+        self._base64: Optional[str] = None
+        # Identificación y análisis de salud piden los bytes desde hilos distintos
+        self._lock = threading.Lock()
+    
+    @property
+    def data(self) -> bytes:
+        """Bytes JPEG reducidos (se codifican una vez y se reutilizan)"""
+        with self._lock:
+            if self._data is None:
+                img = self._image
+                if self.max_edge and max(img.size) > self.max_edge:
+                    img = img.copy()
+                    img.thumbnail((self.max_edge, self.max_edge), Image.BICUBIC)
+                buffer = io.BytesIO()
+                img.save(buffer, format='JPEG', quality=self.quality, optimize=True)
+                self._data = buffer.getvalue()
+                self._size = img.size
+                self._image = None
+            return self._data
+    
+    @property
+    def width(self) -> int:
+        self.data
+        return self._size[0]
+    
+    @property
+    def height(self) -> int:
+        self.data
+        return self._size[1]
+    
+    def base64(self) -> str:
+        """JPEG en base64 (se calcula una vez y se reutiliza)"""
+        if self._base64 is None:
+            self._base64 = base64.b64encode(self.data).decode('utf-8')
+        return self._base64
+    
+    def gemini_part(self) -> dict:
+        """Parte inline para generate_content: el SDK envía los bytes tal cual, sin recodificar"""
+        return {'mime_type': self.mime_type, 'data': self.data}
+    
+    def __repr__(self) -> str:
+        original = f"{self.original_size[0]}x{self.original_size[1]}, {self.original_bytes} bytes"
+        if self._data is None:
+            return f"PreparedImage({original}, sin codificar)"
+        return f"PreparedImage({original} -> {self._size[0]}x{self._size[1]}, {len(self._data)} bytes)"
+
+
+def _read_source(source: ImageSource) -> bytes:
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if isinstance(source, (str, Path)):
+        with open(source, 'rb') as f:
+            return f.read()
+    # Objeto tipo archivo (UploadFile.file, SpooledTemporaryFile, BytesIO...)
+    source.seek(0)
+    return source.read()
+
+
+def difference_hash(img: Image.Image, hash_size: int = 8) -> int:
+    """
+    Hash perceptual por diferencias (dHash) de hash_size² bits
+    
+    Reduce la imagen a escala de grises (hash_size+1)×hash_size y codifica si cada
+    píxel es más claro que su vecino derecho. Recompresiones, reescalados o pequeños
+    cambios de brillo apenas alteran bits; fotos distintas difieren en muchos.
+    """
+    small = img.convert('L').resize((hash_size + 1, hash_size), Image.BOX)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Número de bits distintos entre dos hashes"""
+    return bin(a ^ b).count('1')
+
+
+def prepare_image(source: ImageSource, max_edge: int = None, quality: int = None) -> PreparedImage:
+    """
+    Decodifica y orienta una imagen (reducción y JPEG se hacen al primer uso de los bytes)
+    
+    Args:
+        source: Ruta, bytes u objeto tipo archivo con la imagen original
+        max_edge: Lado mayor máximo en píxeles (por defecto IMAGE_MAX_EDGE; 0 = sin reducir)
+        quality: Calidad JPEG (por defecto IMAGE_JPEG_QUALITY)
+        
+    Returns:
+        PreparedImage (el buffer JPEG se genera al primer uso y se comparte)
+    """
+    max_edge = IMAGE_MAX_EDGE if max_edge is None else max_edge
+    quality = quality or IMAGE_JPEG_QUALITY
+    
+    raw = _read_source(source)
+    img = Image.open(io.BytesIO(raw))
+    original_size = img.size
+    
+    # draft() deja que el decodificador JPEG reduzca por potencias de 2 al decodificar,
+    # sin materializar los 12 MP completos de una foto de móvil
+    if max_edge and img.format == 'JPEG':
+        img.draft('RGB', (max_edge, max_edge))
+    
+    img = ImageOps.exif_transpose(img)
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    
+    return PreparedImage(img, original_size, len(raw), max_edge, quality,
+                         digest=hashlib.sha256(raw).hexdigest())
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    
+    if len(sys.argv) < 2:
+        print("Uso: python src/imagen.py <imagen>")
+        sys.exit(1)
+    
+    start = time.perf_counter()
+    prepared = prepare_image(sys.argv[1])
+    prepared.data
+    print(f"✓ {prepared} en {(time.perf_counter() - start) * 1000:.1f} ms (dHash {prepared.dhash:016x})")
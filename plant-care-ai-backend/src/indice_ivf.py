@@ -0,0 +1,279 @@
+"""
+Módulo de Índice IVF (Inverted File)
+Búsqueda aproximada de vecinos más cercanos para corpus grandes sin Supabase
+
+Los embeddings se agrupan con k-means esférico (similitud del coseno) en n_lists
+listas. Cada consulta solo se compara con los vectores de las nprobe listas
+cuyos centroides son más similares, en lugar de con todo el corpus.
+"""
+import os
+import numpy as np
+from pathlib import Path
+from typing import List, Tuple, Optional
+
+from similitud import select_top_k, load_documents, EMBEDDINGS_FILE
+
+IVF_FILE = "ivf.npz"
+IVF_VECTORS_FILE = "ivf_vectors.npy"
+
+
+def default_n_lists(n_docs: int) -> int:
+    """Número de listas recomendado: ~4·sqrt(N), acotado al tamaño del corpus"""
+    return int(max(1, min(n_docs, round(4 * np.sqrt(n_docs)))))
+
+
+def spherical_kmeans(embeddings: np.ndarray, n_clusters: int, n_iters: int = 10,
+                     seed: int = 0, block_rows: int = 16384) -> np.ndarray:
+    """
+    K-means con similitud del coseno (centroides normalizados)
+    
+    Args:
+        embeddings: Vectores normalizados de entrenamiento (n x dim)
+        n_clusters: Número de centroides
+        n_iters: Iteraciones de Lloyd
+        seed: Semilla para la inicialización
+        block_rows: Filas asignadas por bloque (acota la memoria temporal)
+    
+    Returns:
+        Centroides normalizados (n_clusters x dim)
+    """
+    rng = np.random.default_rng(seed)
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    centroids = embeddings[rng.choice(len(embeddings), n_clusters, replace=False)].copy()
+    
+    for _ in range(n_iters):
+        assignments = assign_to_centroids(embeddings, centroids, block_rows)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, embeddings)
+        counts = np.bincount(assignments, minlength=n_clusters)
+        
+        # Listas vacías: reiniciar con puntos aleatorios del corpus
+        empty = np.flatnonzero(counts == 0)
+        if empty.size:
+            sums[empty] = embeddings[rng.choice(len(embeddings), empty.size, replace=False)]
+        
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = sums / norms
+    
+    return centroids
+
+
+def assign_to_centroids(embeddings: np.ndarray, centroids: np.ndarray, block_rows: int = 16384) -> np.ndarray:
+    """Asigna cada vector al centroide más similar (por bloques de filas)"""
+    assignments = np.empty(len(embeddings), dtype=np.int64)
+    for start in range(0, len(embeddings), block_rows):
+        block = np.asarray(embeddings[start:start + block_rows], dtype=np.float32)
+        assignments[start:start + len(block)] = np.argmax(np.dot(block, centroids.T), axis=1)
+    return assignments
+
+
+class IVFIndex:
+    """Índice aproximado IVF con la misma interfaz de búsqueda que SimilaritySearch"""
+    
+    # Máximo de vectores usados para entrenar k-means (el resto solo se asigna)
+    MAX_TRAINING_POINTS = 100000
+    
+    def __init__(self, n_lists: Optional[int] = None, nprobe: int = 8, kmeans_iters: int = 10, seed: int = 0):
+        """
+        Args:
+            n_lists: Número de listas (None = default_n_lists según el corpus)
+            nprobe: Listas exploradas por consulta (más = mejor recall, más lento)
+            kmeans_iters: Iteraciones de k-means al construir el índice
+            seed: Semilla para muestreo e inicialización
+        """
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.kmeans_iters = kmeans_iters
+        self.seed = seed
+        self.centroids = None  # (n_lists x dim)
+        self.offsets = None    # Inicio de cada lista en vectors (n_lists + 1)
+        self.ids = None        # Posición original (en documents) de cada fila de vectors
+        self.vectors = None    # Embeddings reordenados por lista (contiguos por lista)
+        self.documents = None
+    
+    @property
+    def dimension(self) -> int:
+        """Dimensión de los embeddings indexados (0 si está vacío)"""
+        return self.centroids.shape[1] if self.centroids is not None else 0
+    
+    def memory_bytes(self) -> int:
+        """Bytes ocupados por vectores, centroides y tablas del índice"""
+        if self.centroids is None:
+            return 0
+        return self.vectors.nbytes + self.centroids.nbytes + self.offsets.nbytes + self.ids.nbytes
+    
+    def add_documents(self, embeddings: np.ndarray, documents: List[dict]):
+        """
+        Construye el índice: entrena centroides y agrupa los vectores por lista
+        
+        Args:
+            embeddings: Array de embeddings normalizados (n_docs x embedding_dim)
+            documents: Lista de documentos correspondientes
+        """
+        n_docs = len(embeddings)
+        n_lists = min(self.n_lists or default_n_lists(n_docs), n_docs)
+        rng = np.random.default_rng(self.seed)
+        
+        if n_docs > self.MAX_TRAINING_POINTS:
+            sample = np.sort(rng.choice(n_docs, self.MAX_TRAINING_POINTS, replace=False))
+            training = np.asarray(embeddings[sample], dtype=np.float32)
+        else:
+            training = np.asarray(embeddings, dtype=np.float32)
+        
+        self.centroids = spherical_kmeans(training, n_lists, self.kmeans_iters, self.seed)
+        assignments = assign_to_centroids(embeddings, self.centroids)
+        
+        # Ordenar por lista: cada lista queda como un bloque contiguo de filas
+        self.ids = np.argsort(assignments, kind='stable')
+        self.vectors = np.ascontiguousarray(np.asarray(embeddings, dtype=np.float32)[self.ids])
+        counts = np.bincount(assignments, minlength=n_lists)
+        self.offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self.n_lists = n_lists
+        self.documents = documents
+        print(f"✓ Índice IVF construido: {n_docs} documentos en {n_lists} listas (nprobe={self.nprobe})")
+    
+    def search_top_k(self, query_embedding: np.ndarray, top_k: int = 5, threshold: float = 0.3) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Busca los documentos más similares explorando solo nprobe listas
+        
+        Args:
+            query_embedding: Embedding de la consulta
+            top_k: Número de resultados a retornar
+            threshold: Umbral mínimo de similitud (0-1)
+        
+        Returns:
+            Tupla (índices en documents, scores) ordenados por similitud descendente
+        """
+        if self.centroids is None:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32)
+        
+        query_embedding = np.asarray(query_embedding, dtype=np.float32)
+        centroid_scores = np.dot(self.centroids, query_embedding)
+        nprobe = min(self.nprobe, self.n_lists)
+        probe = np.argpartition(centroid_scores, -nprobe)[-nprobe:]
+        
+        # Puntuar cada lista sobre su bloque contiguo (sin copiar filas)
+        rows = []
+        scores = []
+        for list_id in probe:
+            start, end = self.offsets[list_id], self.offsets[list_id + 1]
+            if start == end:
+                continue
+            rows.append(np.arange(start, end))
+            scores.append(np.dot(self.vectors[start:end], query_embedding))
+        if not rows:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32)
+        
+        rows = np.concatenate(rows)
+        order, top_scores = select_top_k(np.concatenate(scores), top_k, threshold)
+        return self.ids[rows[order]], top_scores
+    
+    def search_top_k_batch(self, query_embeddings: np.ndarray, top_k: int = 5,
+                           threshold: float = 0.3) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Versión por lotes de search_top_k() (misma interfaz que SimilaritySearch)"""
+        return [self.search_top_k(q, top_k, threshold) for q in np.atleast_2d(query_embeddings)]
+    
+    def search(self, query_embedding: np.ndarray, top_k: int = 5, threshold: float = 0.3) -> List[Tuple[dict, float]]:
+        """
+        Busca documentos más similares a la consulta
+        
+        Args:
+            query_embedding: Embedding de la consulta
+            top_k: Número de resultados a retornar
+            threshold: Umbral mínimo de similitud (0-1)
+        
+        Returns:
+            Lista de tuplas (documento, score) ordenadas por similitud
+        """
+        indices, scores = self.search_top_k(query_embedding, top_k, threshold)
+        return [(self.documents[idx], float(score)) for idx, score in zip(indices, scores)]
+    
+    def search_batch(self, query_embeddings: np.ndarray, top_k: int = 5, threshold: float = 0.3) -> List[List[Tuple[dict, float]]]:
+        """Versión por lotes de search()"""
+        return [
+            [(self.documents[idx], float(score)) for idx, score in zip(indices, scores)]
+            for indices, scores in self.search_top_k_batch(query_embeddings, top_k, threshold)
+        ]
+    
+    def save(self, index_dir: str):
+        """
+        Guarda el índice IVF junto al índice plano (la metadata de chunks se comparte)
+        
+        Args:
+            index_dir: Directorio del índice local (el mismo de save_index)
+        """
+        if self.centroids is None:
+            raise ValueError("El índice IVF está vacío")
+        index_path = Path(index_dir)
+        index_path.mkdir(parents=True, exist_ok=True)
+        
+        vectors_tmp = index_path / f"{IVF_VECTORS_FILE}.tmp"
+        ivf_tmp = index_path / f"{IVF_FILE}.tmp"
+        with open(vectors_tmp, 'wb') as f:
+            np.save(f, self.vectors)
+        with open(ivf_tmp, 'wb') as f:
+            np.savez(f, centroids=self.centroids, offsets=self.offsets, ids=self.ids)
+        os.replace(vectors_tmp, index_path / IVF_VECTORS_FILE)
+        os.replace(ivf_tmp, index_path / IVF_FILE)
+        print(f"✓ Índice IVF guardado en {index_path}")
+    
+    def load(self, index_dir: str, mmap: bool = True) -> bool:
+        """
+        Carga un índice IVF guardado con save()
+        
+        Args:
+            index_dir: Directorio del índice local
+            mmap: Si True, los vectores se mapean en memoria en lugar de copiarse
+        
+        Returns:
+            True si se cargó, False si no existe o es más antiguo que el índice plano
+        """
+        index_path = Path(index_dir)
+        ivf_file = index_path / IVF_FILE
+        vectors_file = index_path / IVF_VECTORS_FILE
+        flat_file = index_path / EMBEDDINGS_FILE
+        
+        if not ivf_file.exists() or not vectors_file.exists():
+            return False
+        if flat_file.exists() and flat_file.stat().st_mtime > ivf_file.stat().st_mtime:
+            print("⚠ El índice IVF es anterior al índice local, hay que reconstruirlo")
+            return False
+        
+        with np.load(ivf_file) as data:
+            self.centroids = data['centroids']
+            self.offsets = data['offsets']
+            self.ids = data['ids']
+        self.vectors = np.load(vectors_file, mmap_mode='r' if mmap else None)
+        self.documents = load_documents(index_path)
+        self.n_lists = len(self.centroids)
+        
+        if len(self.ids) != len(self.documents):
+            print(f"⚠ Índice IVF inconsistente: {len(self.ids)} vectores vs {len(self.documents)} chunks")
+            self.centroids = None
+            return False
+        
+        print(f"✓ Índice IVF cargado: {len(self.ids)} documentos en {self.n_lists} listas (nprobe={self.nprobe})")
+        return True
+
+
+if __name__ == "__main__":
+    # Test: recall del IVF contra búsqueda exacta en un corpus sintético
+    from similitud import SimilaritySearch
+    
+    rng = np.random.default_rng(0)
+    topics = rng.standard_normal((50, 64)).astype(np.float32)
+    corpus = topics[rng.integers(0, 50, 20000)] + 0.8 * rng.standard_normal((20000, 64)).astype(np.float32)
+    corpus /= np.linalg.norm(corpus, axis=1, keepdims=True)
+    docs = [{'id': i} for i in range(len(corpus))]
+    
+    exact = SimilaritySearch()
+    exact.add_documents(corpus, docs)
+    ivf = IVFIndex(nprobe=8)
+    ivf.add_documents(corpus, docs)
+    
+    hits = 0
+    for q in corpus[:100]:
+        ref = set(exact.search_top_k(q, 5, -1.0)[0].tolist())
+        hits += len(ref & set(ivf.search_top_k(q, 5, -1.0)[0].tolist()))
+    print(f"Recall@5 (nprobe={ivf.nprobe}): {hits / 500:.3f}")
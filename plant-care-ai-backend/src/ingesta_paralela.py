@@ -0,0 +1,272 @@
+"""
+Módulo de Ingesta Paralela
+Pipeline de indexación por etapas para corpus grandes:
+
+    archivos → [pool de procesos: extracción + chunking]
+             → cola acotada → [hilo dedicado: embeddings + índice local]
+             → cola acotada → [pool de hilos: subida a Supabase]
+
+Las colas acotadas dan contrapresión: si una etapa se atrasa, las anteriores
+se bloquean en lugar de acumular datos en memoria.
+"""
+import os
+import time
+import queue
+import threading
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Optional, Tuple
+
+from extraccion import DataExtractor
+from chunking import TextChunker, embedding_text
+from manifiesto import content_hash
+
+_DONE = object()
+
+
+def extract_and_chunk(filepath: str, chunker: TextChunker) -> Tuple[str, Optional[str], List[dict]]:
+    """
+    Lee y segmenta un archivo (se ejecuta en un proceso del pool)
+    
+    Returns:
+        Tupla (nombre de archivo, hash del contenido o None si está vacío, chunks)
+    """
+    path = Path(filepath)
+    content = DataExtractor(str(path.parent)).extract_from_file(filepath)
+    if not content:
+        return path.name, None, []
+    document = {'filename': path.name, 'filepath': str(path), 'content': content}
+    return path.name, content_hash(content), chunker.chunk_document(document)
+
+
+class StageStats:
+    """Contadores de una etapa: elementos procesados y tiempo ocupado"""
+    
+    def __init__(self, name: str, unit: str):
+        self.name = name
+        self.unit = unit
+        self.items = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+    
+    def add(self, items: int, seconds: float):
+        with self._lock:
+            self.items += items
+            self.busy_seconds += seconds
+    
+    def report(self, wall_seconds: float) -> str:
+        rate = self.items / wall_seconds if wall_seconds else 0.0
+        return (f"  {self.name:<22} {self.items:>8} {self.unit:<10} "
+                f"{rate:>9.1f} {self.unit}/s  (ocupado {self.busy_seconds:.1f}s)")
+
+
+class ParallelIngestionPipeline:
+    """Driver de ingesta con extracción/chunking, embeddings y subida en paralelo"""
+    
+    def __init__(self, data_dir: str = "data/plantas", chunker: Optional[TextChunker] = None,
+                 extract_workers: Optional[int] = None, embed_batch_size: int = 256,
+                 upload_workers: int = 4, queue_size: int = 8,
+                 generator=None, index_writer=None, vector_db=None, manifest=None):
+        """
+        Args:
+            data_dir: Directorio con los documentos (.md/.txt)
+            chunker: TextChunker que se envía a cada proceso (None = 400 caracteres, overlap 50)
+            extract_workers: Procesos para extracción + chunking (None = núcleos del equipo)
+            embed_batch_size: Chunks por llamada al modelo de embeddings
+            upload_workers: Hilos que suben lotes a Supabase
+            queue_size: Capacidad (en lotes) de cada cola entre etapas
+            generator: EmbeddingGenerator usado por la etapa de embeddings
+            index_writer: IndexWriter del índice local (opcional)
+            vector_db: SupabaseVectorDB para la subida (opcional)
+            manifest: IndexManifest donde registrar cada archivo segmentado (opcional)
+        """
+        self.data_dir = Path(data_dir)
+        self.chunker = chunker or TextChunker(chunk_size=400, overlap=50)
+        self.extract_workers = extract_workers or os.cpu_count() or 1
+        self.embed_batch_size = embed_batch_size
+        self.upload_workers = upload_workers
+        self.queue_size = queue_size
+        self.generator = generator
+        self.index_writer = index_writer
+        self.vector_db = vector_db
+        self.manifest = manifest
+        
+        self.stats = {
+            'chunking': StageStats('Extracción + chunking', 'archivos'),
+            'embedding': StageStats('Embeddings', 'chunks'),
+            'upload': StageStats('Subida a Supabase', 'chunks'),
+        }
+        self._error = None
+        self._failed = threading.Event()
+        self._upload_disabled = threading.Event()
+        self._upload_threads = []
+    
+    def _list_files(self) -> List[str]:
+        files = []
+        for ext in ['*.txt', '*.md']:
+            files.extend(str(p) for p in self.data_dir.rglob(ext))
+        return files
+    
+    def _put(self, target: queue.Queue, item):
+        """put bloqueante que se interrumpe si otra etapa falló"""
+        while not self._failed.is_set():
+            try:
+                target.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+        raise RuntimeError("Pipeline detenido por un error en otra etapa")
+    
+    @staticmethod
+    def _put_done(target: queue.Queue, consumers: List[threading.Thread]):
+        """
+        Entrega un centinela _DONE esperando lo que haga falta mientras algún consumidor
+        siga vivo (si todos terminaron, nadie lo va a leer)
+        """
+        while any(thread.is_alive() for thread in consumers):
+            try:
+                target.put(_DONE, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+    
+    def _fail(self, error: BaseException):
+        if self._error is None:
+            self._error = error
+        self._failed.set()
+    
+    def _embed_stage(self, chunk_queue: queue.Queue, upload_queue: Optional[queue.Queue]):
+        """Etapa de embeddings: un solo hilo con el modelo, agrupa chunks en lotes fijos"""
+        try:
+            pending = []
+            
+            def flush(batch):
+                start = time.perf_counter()
+                embeddings = self.generator.generate_embeddings_batch(
+                    [embedding_text(chunk) for chunk in batch], show_progress_bar=False)
+                if self.index_writer is not None:
+                    self.index_writer.append(embeddings, batch)
+                self.stats['embedding'].add(len(batch), time.perf_counter() - start)
+                if upload_queue is not None:
+                    self._put(upload_queue, (batch, embeddings))
+            
+            while True:
+                item = chunk_queue.get()
+                if item is _DONE or self._failed.is_set():
+                    break
+                pending.extend(item)
+                while len(pending) >= self.embed_batch_size:
+                    flush(pending[:self.embed_batch_size])
+                    pending = pending[self.embed_batch_size:]
+            if pending and not self._failed.is_set():
+                flush(pending)
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            # Un centinela por hilo de subida, aunque la subida vaya lenta (reintentos)
+            if upload_queue is not None:
+                for _ in range(self.upload_workers):
+                    self._put_done(upload_queue, self._upload_threads)
+    
+    def _upload_stage(self, upload_queue: queue.Queue):
+        """Etapa de subida: cada hilo toma lotes de la cola y los inserta"""
+        try:
+            while True:
+                item = upload_queue.get()
+                if item is _DONE or self._failed.is_set():
+                    break
+                if self._upload_disabled.is_set():
+                    continue
+                batch, embeddings = item
+                start = time.perf_counter()
+                try:
+                    self.vector_db.insert_chunks(batch, embeddings)
+                except Exception as e:
+                    # Igual que el pipeline secuencial: se sigue solo con el índice local
+                    if not self._upload_disabled.is_set():
+                        self._upload_disabled.set()
+                        print(f"⚠ Error indexando en Supabase: {e}")
+                        print(f"  Se continúa solo con el índice local")
+                    continue
+                self.stats['upload'].add(len(batch), time.perf_counter() - start)
+        except BaseException as e:
+            self._fail(e)
+    
+    def run(self) -> dict:
+        """
+        Ejecuta el pipeline completo
+        
+        Returns:
+            Diccionario con archivos, chunks y segundos totales
+        """
+        files = self._list_files()
+        print(f"📄 {len(files)} archivos | {self.extract_workers} procesos de chunking | "
+              f"lotes de {self.embed_batch_size} chunks | {self.upload_workers} hilos de subida")
+        
+        chunk_queue = queue.Queue(maxsize=self.queue_size)
+        upload_queue = queue.Queue(maxsize=self.queue_size) if self.vector_db is not None else None
+        
+        embed_thread = threading.Thread(target=self._embed_stage, args=(chunk_queue, upload_queue), daemon=True)
+        # Todos los hilos existen antes de arrancar: la etapa de embeddings los necesita para sus centinelas
+        self._upload_threads = [
+            threading.Thread(target=self._upload_stage, args=(upload_queue,), daemon=True)
+            for _ in range(self.upload_workers if upload_queue is not None else 0)
+        ]
+        for thread in [embed_thread] + self._upload_threads:
+            thread.start()
+        
+        wall_start = time.perf_counter()
+        try:
+            # Extracción + chunking en procesos, con como mucho 2 archivos en vuelo por proceso
+            with ProcessPoolExecutor(max_workers=self.extract_workers) as pool:
+                remaining = iter(files)
+                in_flight = {}
+                while not self._failed.is_set():
+                    while len(in_flight) < self.extract_workers * 2:
+                        filepath = next(remaining, None)
+                        if filepath is None:
+                            break
+                        future = pool.submit(extract_and_chunk, filepath, self.chunker)
+                        in_flight[future] = (time.perf_counter(), filepath)
+                    if not in_flight:
+                        break
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        started, filepath = in_flight.pop(future)
+                        filename, file_hash, chunks = future.result()
+                        self.stats['chunking'].add(1, time.perf_counter() - started)
+                        if self.manifest is not None and file_hash is not None:
+                            self.manifest.record_file(filepath, file_hash, chunks)
+                        if chunks:
+                            print(f"  ✓ {filename}: {len(chunks)} chunks")
+                            self._put(chunk_queue, chunks)
+                if self._failed.is_set():
+                    for future in in_flight:
+                        future.cancel()
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            # La cola de chunks suele estar llena (los embeddings son el cuello de botella):
+            # se espera al hilo de embeddings en lugar de rendirse tras un timeout
+            self._put_done(chunk_queue, [embed_thread])
+        
+        embed_thread.join()
+        for thread in self._upload_threads:
+            thread.join()
+        
+        if self._error is not None:
+            raise self._error
+        
+        wall_seconds = time.perf_counter() - wall_start
+        print(f"\n📊 Rendimiento por etapa ({wall_seconds:.1f}s en total):")
+        for stats in self.stats.values():
+            if stats.items:
+                print(stats.report(wall_seconds))
+        
+        return {
+            'files': self.stats['chunking'].items,
+            'chunks': self.stats['embedding'].items,
+            'seconds': wall_seconds,
+            # Todos los lotes llegaron a Supabase
+            'uploaded': self.vector_db is not None and not self._upload_disabled.is_set()
+        }
@@ -4,9 +4,11 @@ Usa Ollama u otros LLMs locales para generar respuestas sin depender de APIs ext
 """
 import os
 import requests
-from typing import Optional, Dict, List
+from typing import AsyncIterator, Optional, Dict, List
 import json
 
+from concurrencia import get_http_client, upstream
+
 
 class LocalLLM:
     """Wrapper para LLMs locales (Ollama, Hugging Face, etc.)"""
@@ -107,11 +109,89 @@ class LocalLLM:
             else:
                 print(f"[ERROR] Error de Ollama: {response.status_code} - {response.text}")
                 return None
-                
+        
+        except Exception as e:
+            print(f"[ERROR] Error generando con Ollama: {e}")
+            return None
+    
+    async def agenerate(self, prompt: str, max_tokens: int = 512, temperature: float = 0.7) -> Optional[str]:
+        """
+        Versión asíncrona de generate (no bloquea el event loop de FastAPI)
+        
+        Args:
+            prompt: Prompt para el LLM
+            max_tokens: Máximo de tokens a generar
+            temperature: Temperatura para la generación (0.0-1.0)
+            
+        Returns:
+            Respuesta generada o None si hay error
+        """
+        if not self.available or self.provider != "ollama":
+            return None
+        
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": False,
+            "options": {
+                "temperature": temperature,
+                "num_predict": max_tokens,
+            }
+        }
+        
+        try:
+            async with upstream('ollama'):
+                response = await get_http_client().post(f"{self.base_url}/api/generate", json=payload, timeout=30)
+            
+            if response.status_code == 200:
+                return response.json().get("response", "").strip()
+            print(f"[ERROR] Error de Ollama: {response.status_code} - {response.text}")
+            return None
         except Exception as e:
             print(f"[ERROR] Error generando con Ollama: {e}")
             return None
     
+    async def astream(self, prompt: str, max_tokens: int = 512, temperature: float = 0.7) -> AsyncIterator[str]:
+        """
+        Genera la respuesta en streaming: Ollama envía una línea JSON por token
+        
+        Args:
+            prompt: Prompt para el LLM
+            max_tokens: Máximo de tokens a generar
+            temperature: Temperatura para la generación (0.0-1.0)
+            
+        Yields:
+            Trozos de texto según los genera el modelo (los errores de conexión se propagan)
+        """
+        if not self.available or self.provider != "ollama":
+            return
+        
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": True,
+            "options": {
+                "temperature": temperature,
+                "num_predict": max_tokens,
+            }
+        }
+        
+        # El timeout de 30s del cliente se aplica entre trozos, no a la respuesta completa
+        async with upstream('ollama'):
+            async with get_http_client().stream("POST", f"{self.base_url}/api/generate", json=payload) as response:
+                if response.status_code != 200:
+                    body = await response.aread()
+                    print(f"[ERROR] Error de Ollama: {response.status_code} - {body.decode(errors='replace')}")
+                    return
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    if data.get("response"):
+                        yield data["response"]
+                    if data.get("done"):
+                        break
+    
     def _generate_huggingface(self, prompt: str, max_tokens: int, temperature: float) -> Optional[str]:
         """Genera respuesta usando Hugging Face (implementación futura)"""
         # TODO: Implementar usando transformers
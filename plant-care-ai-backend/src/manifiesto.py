@@ -0,0 +1,89 @@
+"""
+Módulo de Manifiesto de Indexación
+Registra qué archivos y chunks están indexados para reindexar de forma incremental
+"""
+import os
+import json
+import hashlib
+from pathlib import Path
+from typing import Dict, List
+
+from chunking import embedding_text
+
+DEFAULT_MANIFEST_FILE = "manifest.json"
+
+
+def content_hash(text: str) -> str:
+    """Hash SHA-1 (hex) de un texto"""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def chunk_hash(chunk: dict) -> str:
+    """Hash de lo que se vectoriza de un chunk (texto y ruta de sección)"""
+    return content_hash(embedding_text(chunk))
+
+
+class IndexManifest:
+    """
+    Manifiesto del índice: hash de cada archivo y de cada uno de sus chunks
+    
+    Formato (JSON):
+        {
+          "config": {"model_name": ..., "chunk_size": ..., "overlap": ..., "chunker_version": ..., "chunking_mode": ...},
+          "files": {
+            "<filepath>": {"hash": "<sha1 contenido>", "chunks": {"<chunk_id>": "<sha1 texto vectorizado>"}}
+          }
+        }
+    """
+    
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.config = {}
+        self.files = {}
+        if self.path.exists():
+            data = json.loads(self.path.read_text(encoding='utf-8'))
+            self.config = data.get('config', {})
+            self.files = data.get('files', {})
+    
+    def is_compatible(self, config: Dict) -> bool:
+        """True si el índice se generó con el mismo modelo y parámetros de chunking"""
+        return bool(self.files) and self.config == config
+    
+    def changed_files(self, documents: List[dict]) -> List[dict]:
+        """Documentos nuevos o cuyo contenido cambió desde la última indexación"""
+        return [
+            doc for doc in documents
+            if self.files.get(doc['filepath'], {}).get('hash') != content_hash(doc['content'])
+        ]
+    
+    def removed_files(self, documents: List[dict]) -> List[str]:
+        """Rutas indexadas que ya no existen en el directorio de datos"""
+        current = {doc['filepath'] for doc in documents}
+        return [filepath for filepath in self.files if filepath not in current]
+    
+    def chunk_hashes(self, filepath: str) -> Dict[str, str]:
+        """chunk_id -> hash del texto para los chunks indexados de un archivo"""
+        return self.files.get(filepath, {}).get('chunks', {})
+    
+    def update_file(self, document: dict, chunks: List[dict]):
+        """Registra el estado indexado de un archivo"""
+        self.record_file(document['filepath'], content_hash(document['content']), chunks)
+    
+    def record_file(self, filepath: str, file_hash: str, chunks: List[dict]):
+        """Como update_file, con el hash del contenido ya calculado (ingesta paralela)"""
+        self.files[filepath] = {
+            'hash': file_hash,
+            'chunks': {chunk['chunk_id']: chunk_hash(chunk) for chunk in chunks}
+        }
+    
+    def remove_file(self, filepath: str):
+        self.files.pop(filepath, None)
+    
+    def save(self, config: Dict):
+        """Guarda el manifiesto de forma atómica"""
+        self.config = config
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix('.tmp')
+        tmp.write_text(json.dumps({'config': self.config, 'files': self.files}, ensure_ascii=False, indent=1),
+                       encoding='utf-8')
+        os.replace(tmp, self.path)
@@ -0,0 +1,339 @@
+"""
+Módulo Sanitizador de Respuestas
+Limpia la respuesta del LLM antes de enviarla al chat: markdown, puntos suspensivos,
+frases genéricas ("Según los documentos...") y títulos o fragmentos copiados de los
+documentos de la base de conocimiento.
+
+Las listas de frases se combinan al importar el módulo en unas pocas alternancias
+precompiladas y el texto se recorre en dos pasadas lineales: una por líneas (filtros y
+sustituciones) y otra por párrafos (bloques copiados de documentos).
+"""
+import os
+import re
+from typing import List, Optional
+
+# Títulos de sección de los documentos: una línea corta que los contiene es un título
+# copiado y abre un bloque técnico (lista de pasos, ventajas...) que también se descarta
+DOCUMENT_TITLES = [
+    'Descripción General', 'Propagación por Semillas', 'Ventajas', 'Desventajas',
+    'Método Básico', 'Problemas Comunes', 'Trasplante Frecuencia', 'Procedimiento',
+    'Cuidado de Suculentas', 'Cuidado de Cactus', 'Plantas de Interior Comunes'
+]
+
+# Frases de relleno que el LLM antepone a la respuesta
+GENERIC_PHRASES = [
+    'Basándome en la información disponible', 'Según los documentos', 'Según la información',
+    'De acuerdo a', 'Basándome en', 'De acuerdo con', 'Con base en'
+]
+
+# Fragmentos literales de los documentos que el LLM suele pegar tal cual
+COPIED_FRAGMENTS = [
+    r'Corte limpio horizontal ambos \d+',
+    r'Hojas blandas y amarillas desde la base',
+    r'Quemaduras solares: Manchas marrones',
+]
+
+# Comienzos de frase que delatan un paso técnico copiado
+FRAGMENT_STARTS = ['Corte limpio', 'horizontal ambos', 'Sacar de maceta']
+
+# Temas de los documentos: una línea corta que solo los nombra es un fragmento suelto
+FRAGMENT_TOPICS = ['Corte limpio', 'horizontal ambos', 'Quemaduras solares', 'Cochinillas', 'Hojas blandas']
+
+# Un párrafo que nombra más de uno de estos temas está copiado de un documento
+PARAGRAPH_INDICATORS = DOCUMENT_TITLES + ['Hojas blandas y amarillas', 'Quemaduras solares', 'Cochinillas y áfidos']
+
+# En streaming, una línea empieza a emitirse cuando su parte estable (limpia) supera
+# STREAM_MIN_LINE caracteres; las últimas STREAM_HOLDBACK se retienen porque pueden ser
+# el principio de una frase a borrar (la más larga tiene ~40 caracteres)
+STREAM_MIN_LINE = 50
+STREAM_HOLDBACK = 48
+
+
+def _escaped(phrases: List[str]) -> List[str]:
+    """Frases escapadas, las más largas primero ('Desventajas' antes que 'Ventajas')"""
+    return [re.escape(p) for p in sorted(phrases, key=len, reverse=True)]
+
+
+def _alternation(phrases: List[str]) -> str:
+    return '|'.join(_escaped(phrases))
+
+
+def _noise_pattern() -> str:
+    """
+    Alternancia plana de todo lo que se borra dentro de una línea
+    
+    Cada rama empieza por un carácter literal (sin grupos anidados ni IGNORECASE): así
+    el motor de re descarta con un único conjunto de caracteres las posiciones donde
+    no puede empezar ninguna frase, en lugar de probar cada rama en cada carácter.
+    Las frases se buscan con mayúscula inicial, como aparecen en los documentos y al
+    principio de frase; en minúscula ("muchas ventajas") son texto normal.
+    """
+    branches = [r'##*[ \t]*', r'\.\.\.+', r'Cuidado de [A-ZÁÉÍÓÚÑ][a-záéíóúñ ]+?Descripción General[: \t]*']
+    branches += [rf'{title}[: \t]*(?:-[ \t]*|\d+\.[ \t]*)?' for title in _escaped(DOCUMENT_TITLES)]
+    branches += [rf'{phrase}[,: \t]*' for phrase in _escaped(GENERIC_PHRASES)]
+    branches += COPIED_FRAGMENTS
+    return '|'.join(branches)
+
+
+_MARKDOWN_HEADING = re.compile(r'#{1,6}\s+')
+_TITLE = re.compile(_alternation(DOCUMENT_TITLES))
+_INLINE_NOISE = re.compile(_noise_pattern())
+_MARKERS_ONLY = re.compile(r'^[\d.\-•*]+$')
+_NUMBERED = re.compile(r'^\d+\.\s+')
+_FRAGMENT_TOPIC = re.compile(_alternation(FRAGMENT_TOPICS))
+_FRAGMENT_START = re.compile(_alternation(FRAGMENT_STARTS))
+# Frase (hasta el siguiente . ! ?) que empieza por un paso técnico copiado
+_FRAGMENT_SENTENCE = re.compile(rf'(?:^|(?<=[.!?] ))(?:{_alternation(FRAGMENT_STARTS)})[^.!?]*[.!?]?[ \t]*')
+_PARAGRAPH_INDICATOR = re.compile(_alternation(PARAGRAPH_INDICATORS))
+# Dentro de un bloque técnico: "1. Paso", "- Texto", "Título: Texto"...
+_TECHNICAL_LINE = re.compile(r'^(?:[\d.\-•*]+\s+[A-Z]|[A-ZÁÉÍÓÚÑ][a-záéíóúñ\s]+:\s*[A-Z]|\d+\.\s+.{0,40}$)')
+_TECHNICAL_ITEM = re.compile(r'^[ \t]*[-•]\s+[A-Z]', re.MULTILINE)
+
+
+def has_markdown(text: str) -> bool:
+    """True si el texto tiene encabezados markdown (# Título)"""
+    return _MARKDOWN_HEADING.search(text) is not None
+
+
+class ResponseSanitizer:
+    """
+    Sanitizador incremental para respuestas que llegan por trozos (streaming)
+    
+    feed() recibe el texto según lo genera el LLM y devuelve la parte limpia que ya es
+    definitiva; finish() entrega lo pendiente. Cada línea sale en cuanto se completa, o
+    antes, por partes, si ya es tan larga que ninguna regla de línea puede descartarla.
+    Un párrafo solo se retiene hasta su final a partir de la primera línea que parece
+    copiada de un documento. Lo ya emitido no se retira nunca.
+    """
+    
+    def __init__(self):
+        self._in_technical_block = False  # Tras un título copiado, hasta una línea normal
+        self._buffer = ''                 # Línea en curso, aún sin salto de línea
+        self._line_out = ''               # Parte de la línea en curso ya emitida
+        self._paragraph = []              # Líneas limpias del párrafo en curso
+        self._held_from = None            # Índice desde el que el párrafo se retiene
+        self._paragraph_emitted = False
+        self._separator = ''              # Lo que precede a la próxima línea emitida
+        self._last_char = ''
+    
+    def feed(self, chunk: str) -> str:
+        """
+        Añade un trozo de la respuesta
+        
+        Returns:
+            Texto limpio que ya puede mostrarse (puede ser '')
+        """
+        lines = (self._buffer + chunk).split('\n')
+        self._buffer = lines.pop()
+        out = [self._end_line(line) for line in lines]
+        out.append(self._partial_line())
+        return ''.join(out)
+    
+    def finish(self) -> str:
+        """Cierra la respuesta: última línea, último párrafo y punto final si quedó cortada"""
+        out = []
+        if self._buffer:
+            out.append(self._end_line(self._buffer))
+            self._buffer = ''
+        out.append(self._end_paragraph())
+        # Respuesta cortada a mitad de frase
+        if self._last_char.isalnum():
+            out.append('.')
+            self._last_char = '.'
+        return ''.join(out)
+    
+    def clean_line(self, line: str) -> Optional[str]:
+        """
+        Limpia una línea completa
+        
+        Returns:
+            La línea limpia, '' si es una línea en blanco (separa párrafos) o None si se descarta
+        """
+        stripped = line.strip()
+        if not stripped:
+            self._in_technical_block = False
+            return ''
+        
+        # Título de documento sin contenido propio
+        if len(stripped) < 50 and _TITLE.search(stripped):
+            self._in_technical_block = True
+            return None
+        
+        stripped = _clean_text(stripped)
+        
+        if self._in_technical_block:
+            if _TECHNICAL_LINE.match(stripped) or ('- ' in stripped and len(stripped) < 80):
+                return None
+            self._in_technical_block = False
+        
+        # Solo números o viñetas, o demasiado corta
+        if len(stripped) < 4 or _MARKERS_ONLY.match(stripped):
+            return None
+        # Títulos técnicos en mayúsculas
+        if stripped.isupper() and len(stripped) < 50 and len(stripped.split()) < 5:
+            return None
+        # Pasos numerados sin contenido sustancial
+        numbered = _NUMBERED.match(stripped)
+        if numbered and len(stripped) - numbered.end() <= 15:
+            return None
+        # Fragmento técnico aislado
+        if len(stripped) < 30 and _FRAGMENT_TOPIC.search(stripped):
+            return None
+        
+        return stripped
+    
+    @staticmethod
+    def clean_paragraph(lines: List[str]) -> Optional[str]:
+        """Une las líneas de un párrafo; None si el párrafo parece copiado de un documento"""
+        if not lines:
+            return None
+        paragraph = '\n'.join(lines)
+        
+        if len(set(_PARAGRAPH_INDICATOR.findall(paragraph))) > 1:
+            print("⚠️ Detectado párrafo copiado de documento")
+            return None
+        
+        # Lista técnica copiada: varias líneas con viñeta que empiezan en mayúscula
+        if len(lines) > 2 and paragraph.count('- ') > 3 and len(_TECHNICAL_ITEM.findall(paragraph)) > 2:
+            print("⚠️ Detectado párrafo con estructura técnica copiada")
+            return None
+        
+        return paragraph
+    
+    def _emit(self, text: str) -> str:
+        if not text:
+            return ''
+        out = self._separator + text
+        self._separator = ''
+        self._paragraph_emitted = True
+        self._last_char = text[-1]
+        return out
+    
+    def _end_line(self, line: str) -> str:
+        emitted, self._line_out = self._line_out, ''
+        cleaned = self.clean_line(line)
+        
+        if emitted:
+            # La línea ya salió en parte: completar lo que falta
+            if cleaned is None or not cleaned.startswith(emitted):
+                cleaned = emitted + (cleaned or '')[len(os.path.commonprefix([emitted, cleaned or ''])):]
+            self._paragraph.append(cleaned)
+            if self._held_from is None and _PARAGRAPH_INDICATOR.search(cleaned):
+                self._held_from = len(self._paragraph)
+            self._separator = '\n'
+            self._last_char = cleaned[-1]
+            return cleaned[len(emitted):]
+        
+        if cleaned is None:
+            return ''
+        if not cleaned:
+            return self._end_paragraph()
+        
+        self._paragraph.append(cleaned)
+        if self._held_from is None and (_PARAGRAPH_INDICATOR.search(cleaned) or _TECHNICAL_ITEM.match(cleaned)):
+            self._held_from = len(self._paragraph) - 1
+        if self._held_from is not None:
+            return ''
+        out = self._emit(cleaned)
+        self._separator = '\n'
+        return out
+    
+    def _end_paragraph(self) -> str:
+        out = ''
+        if self._held_from is not None and self.clean_paragraph(self._paragraph):
+            held = self._paragraph[self._held_from:]
+            if held:
+                out = self._emit('\n'.join(held))
+        if self._paragraph_emitted:
+            self._separator = '\n\n'
+        self._paragraph = []
+        self._held_from = None
+        self._paragraph_emitted = False
+        return out
+    
+    def _partial_line(self) -> str:
+        """Emite el principio de una línea larga que ya no puede descartarse ni cambiar"""
+        if self._in_technical_block or self._held_from is not None:
+            return ''
+        stripped = self._buffer.strip()
+        # "Cuidado de X ... Descripción General" puede cerrarse mucho más adelante
+        if len(stripped) < STREAM_MIN_LINE + STREAM_HOLDBACK or 'Cuidado de ' in stripped:
+            return ''
+        
+        cleaned = _clean_text(stripped)
+        if _PARAGRAPH_INDICATOR.search(cleaned) or _TECHNICAL_ITEM.match(cleaned):
+            return ''
+        # Las últimas STREAM_HOLDBACK letras pueden ser el principio de una frase a borrar
+        stable = cleaned.rfind(' ', 0, len(cleaned) - STREAM_HOLDBACK)
+        if stable < STREAM_MIN_LINE or stable <= len(self._line_out):
+            return ''
+        
+        piece = cleaned[len(self._line_out):stable]
+        if not self._line_out:
+            piece = self._emit(piece)
+        else:
+            self._last_char = piece[-1]
+        self._line_out = cleaned[:stable]
+        return piece
+
+
+def _clean_text(stripped: str) -> str:
+    """Sustituciones dentro de una línea ya sin espacios en los extremos"""
+    if _FRAGMENT_START.search(stripped):
+        stripped = _FRAGMENT_SENTENCE.sub('', stripped)
+    capitalized = stripped[:1].isupper()
+    stripped = ' '.join(_INLINE_NOISE.sub('', stripped).split())
+    # "Según los documentos, el helecho..." -> "El helecho..."
+    if capitalized and stripped[:1].islower():
+        stripped = stripped[0].upper() + stripped[1:]
+    return stripped
+
+
+def sanitize_response(text: str) -> str:
+    """
+    Limpia la respuesta completa del LLM
+    
+    Args:
+        text: Respuesta tal como la devuelve el LLM
+        
+    Returns:
+        Texto limpio: párrafos separados por una línea en blanco y punto final
+    """
+    sanitizer = ResponseSanitizer()
+    return sanitizer.feed(text) + sanitizer.finish()
+
+
+if __name__ == "__main__":
+    import time
+    
+    # Respuesta típica de ~2 KB con los defectos que corrige el sanitizador
+    sample = """## Cuidado de tu suculenta
+
+Basándome en la información disponible, las suculentas son plantas muy resistentes que almacenan agua en sus hojas y tallos.
+
+### Riego
+Riega solo cuando el sustrato esté completamente seco. En verano suele bastar con una vez por semana y en invierno cada dos o tres semanas...
+
+Ventajas:
+- Fácil de cuidar
+- Tolera la sequía
+
+• **Luz:** necesitan varias horas de luz brillante al día, idealmente junto a una ventana orientada al sur o al este.
+• **Suelo:** usa una mezcla con buen drenaje, por ejemplo sustrato para cactus con un poco de arena gruesa o perlita.
+• **Maceta:** elige macetas con agujeros de drenaje para que el agua no se acumule en las raíces.
+
+Problemas Comunes
+1. Exceso de riego
+2. Falta de luz
+
+Si las hojas se vuelven blandas y transparentes es señal de exceso de agua: deja secar la tierra por completo y revisa las raíces antes de volver a regar.
+
+Según los documentos, también puedes propagarlas fácilmente a partir de hojas sanas dejando que formen callo durante unos días antes de plantarlas.
+""" * 2
+
+    iterations = 2000
+    start = time.perf_counter()
+    for _ in range(iterations):
+        sanitize_response(sample)
+    elapsed = (time.perf_counter() - start) / iterations
+    print(f"✓ {len(sample)} caracteres -> {len(sanitize_response(sample))} en {elapsed * 1e6:.0f} µs por respuesta")
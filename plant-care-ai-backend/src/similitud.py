@@ -2,17 +2,221 @@
 Módulo de Similitud
 Implementa búsqueda por similitud del coseno
 """
+import os
+import json
 import numpy as np
-from typing import List, Tuple
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+# Índice local persistido por process_documents.py (usado cuando no hay Supabase)
+DEFAULT_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", "data/indice")
+EMBEDDINGS_FILE = "embeddings.npy"
+METADATA_FILE = "chunks.jsonl"
+
+
+def save_index(index_dir: str, embeddings: np.ndarray, documents: List[dict]):
+    """
+    Guarda embeddings y metadata de chunks en disco para cargarlos al arrancar
+
+    Args:
+        index_dir: Directorio destino del índice
+        embeddings: Array de embeddings (n_docs x embedding_dim)
+        documents: Lista de chunks correspondientes (misma longitud)
+    """
+    if len(embeddings) != len(documents):
+        raise ValueError(f"Embeddings ({len(embeddings)}) y documentos ({len(documents)}) no coinciden")
+
+    index_path = Path(index_dir)
+    index_path.mkdir(parents=True, exist_ok=True)
+
+    # Escribir a archivos temporales y reemplazar al final, para que un servidor
+    # que arranque a mitad de la escritura nunca vea un índice a medias
+    emb_tmp = index_path / f"{EMBEDDINGS_FILE}.tmp"
+    meta_tmp = index_path / f"{METADATA_FILE}.tmp"
+
+    with open(emb_tmp, 'wb') as f:
+        np.save(f, np.ascontiguousarray(embeddings, dtype=np.float32))
+
+    with open(meta_tmp, 'w', encoding='utf-8') as f:
+        for doc in documents:
+            f.write(json.dumps(doc, ensure_ascii=False) + "\n")
+
+    os.replace(emb_tmp, index_path / EMBEDDINGS_FILE)
+    os.replace(meta_tmp, index_path / METADATA_FILE)
+    print(f"✓ Índice local guardado en {index_path} ({len(documents)} chunks)")
+
+
+def select_top_k(similarities: np.ndarray, top_k: int, threshold: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Selecciona los top_k scores que superan el umbral sin ordenar todo el corpus
+    
+    Primero descarta los scores bajo el umbral, luego hace una selección parcial
+    (argpartition, O(N)) y solo ordena los k candidatos finales (O(k log k)).
+    
+    Args:
+        similarities: Vector de scores (n_docs,)
+        top_k: Número máximo de resultados
+        threshold: Umbral mínimo de similitud
+        
+    Returns:
+        Tupla (índices, scores) como arrays numpy, ordenados de mayor a menor score
+    """
+    candidates = np.flatnonzero(similarities >= threshold)
+    if top_k <= 0 or candidates.size == 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32)
+    
+    scores = similarities[candidates]
+    if candidates.size > top_k:
+        partition = np.argpartition(scores, -top_k)[-top_k:]
+        candidates = candidates[partition]
+        scores = scores[partition]
+    
+    order = np.argsort(-scores, kind='stable')
+    return candidates[order], scores[order]
+
+
+def quantize_int8(embeddings: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Cuantiza embeddings a int8 con una escala por vector (simétrica)
+    
+    Args:
+        embeddings: Array float (n_docs x embedding_dim)
+        
+    Returns:
+        Tupla (códigos int8, escalas float32) tal que embeddings ≈ códigos * escala
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    scales = np.abs(embeddings).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.round(embeddings / scales[:, np.newaxis]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class IndexWriter:
+    """
+    Escribe el índice local por lotes, sin tener todos los embeddings en memoria
+    
+    Los embeddings se anexan a un archivo float32 en bruto y la metadata a un
+    JSONL temporal; close() convierte el bruto a .npy por bloques y reemplaza
+    el índice anterior de forma atómica (mismo formato que save_index).
+    """
+    
+    CONVERT_BLOCK_ROWS = 65536
+    
+    def __init__(self, index_dir: str = DEFAULT_INDEX_DIR, dimension: Optional[int] = None):
+        """
+        Args:
+            index_dir: Directorio del índice
+            dimension: Dimensión de los embeddings (necesaria para publicar un índice vacío;
+                       si no se indica, se toma del primer lote)
+        """
+        self.index_path = Path(index_dir)
+        self.index_path.mkdir(parents=True, exist_ok=True)
+        self.raw_tmp = self.index_path / f"{EMBEDDINGS_FILE}.raw.tmp"
+        self.emb_tmp = self.index_path / f"{EMBEDDINGS_FILE}.tmp"
+        self.meta_tmp = self.index_path / f"{METADATA_FILE}.tmp"
+        self._raw = open(self.raw_tmp, 'wb')
+        self._meta = open(self.meta_tmp, 'w', encoding='utf-8')
+        self.count = 0
+        self.dimension = dimension
+    
+    def append(self, embeddings: np.ndarray, documents: List[dict]):
+        """Anexa un lote de embeddings y sus chunks"""
+        if len(embeddings) != len(documents):
+            raise ValueError(f"Embeddings ({len(embeddings)}) y documentos ({len(documents)}) no coinciden")
+        if len(embeddings) == 0:
+            return
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if self.dimension is None:
+            self.dimension = embeddings.shape[1]
+        elif embeddings.shape[1] != self.dimension:
+            raise ValueError(f"Dimensión {embeddings.shape[1]} distinta de {self.dimension}")
+        
+        self._raw.write(embeddings.tobytes())
+        for doc in documents:
+            self._meta.write(json.dumps(doc, ensure_ascii=False) + "\n")
+        self.count += len(documents)
+    
+    def close(self):
+        """Finaliza el índice y lo publica en index_dir"""
+        self._raw.close()
+        self._meta.close()
+        
+        if self.count:
+            shape = (self.count, self.dimension)
+            raw = np.memmap(self.raw_tmp, dtype=np.float32, mode='r', shape=shape)
+            out = np.lib.format.open_memmap(self.emb_tmp, mode='w+', dtype=np.float32, shape=shape)
+            for start in range(0, self.count, self.CONVERT_BLOCK_ROWS):
+                out[start:start + self.CONVERT_BLOCK_ROWS] = raw[start:start + self.CONVERT_BLOCK_ROWS]
+            out.flush()
+            del out, raw
+        else:
+            if self.dimension is None:
+                self.abort()
+                raise ValueError("Índice vacío sin dimensión conocida: indica dimension en IndexWriter")
+            with open(self.emb_tmp, 'wb') as f:
+                np.save(f, np.empty((0, self.dimension), dtype=np.float32))
+        
+        os.replace(self.emb_tmp, self.index_path / EMBEDDINGS_FILE)
+        os.replace(self.meta_tmp, self.index_path / METADATA_FILE)
+        self.raw_tmp.unlink(missing_ok=True)
+        print(f"✓ Índice local guardado en {self.index_path} ({self.count} chunks)")
+    
+    def abort(self):
+        """Descarta lo escrito sin tocar el índice publicado"""
+        self._raw.close()
+        self._meta.close()
+        for tmp in (self.raw_tmp, self.emb_tmp, self.meta_tmp):
+            tmp.unlink(missing_ok=True)
+
+
+def load_documents(index_dir: str) -> List[dict]:
+    """Lee la metadata de chunks guardada por save_index (una línea JSON por chunk)"""
+    with open(Path(index_dir) / METADATA_FILE, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
 
 
 class SimilaritySearch:
     """Búsqueda de documentos similares usando similitud del coseno"""
     
-    def __init__(self):
-        self.embeddings = None
+    STORAGE_MODES = ('float32', 'float16', 'int8')
+    
+    # Filas del corpus que se decuantizan a float32 por bloque al puntuar
+    SCORE_BLOCK_ROWS = 8192
+    
+    # Margen bajo el umbral al preseleccionar candidatos con scores aproximados
+    RERANK_THRESHOLD_SLACK = 0.02
+    
+    def __init__(self, storage: str = 'float32', rerank_factor: int = 0):
+        """
+        Args:
+            storage: Formato de la matriz de búsqueda: 'float32' (exacto),
+                     'float16' (2x menos memoria) o 'int8' con escala por vector (~4x menos)
+            rerank_factor: Si > 0 y storage no es float32, se preseleccionan
+                           top_k * rerank_factor candidatos con scores cuantizados y se
+                           re-puntúan con los embeddings float32 originales. Los originales
+                           solo se conservan en este caso (idealmente mapeados desde disco)
+        """
+        if storage not in self.STORAGE_MODES:
+            raise ValueError(f"storage debe ser uno de {self.STORAGE_MODES}")
+        self.storage = storage
+        self.rerank_factor = rerank_factor
+        self.embeddings = None   # Embeddings float32 exactos (None si no se conservan)
+        self.codes = None        # Matriz usada para puntuar (float32, float16 o int8)
+        self.scales = None       # Escala por vector (solo int8)
         self.documents = None
     
+    @property
+    def dimension(self) -> int:
+        """Dimensión de los embeddings indexados (0 si está vacío)"""
+        return self.codes.shape[1] if self.codes is not None else 0
+    
+    def memory_bytes(self) -> int:
+        """Bytes ocupados por la matriz de búsqueda (y escalas)"""
+        if self.codes is None:
+            return 0
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+    
     def add_documents(self, embeddings: np.ndarray, documents: List[dict]):
         """
         Agrega documentos y sus embeddings para búsqueda
@@ -21,13 +225,108 @@ class SimilaritySearch:
             embeddings: Array de embeddings (n_docs x embedding_dim)
             documents: Lista de documentos correspondientes
         """
-        self.embeddings = embeddings
+        if self.storage == 'float32':
+            self.codes = embeddings
+        elif self.storage == 'float16':
+            self.codes = np.asarray(embeddings, dtype=np.float16)
+        else:
+            self.codes, self.scales = quantize_int8(embeddings)
+        
+        keep_exact = self.storage == 'float32' or self.rerank_factor > 0
+        self.embeddings = embeddings if keep_exact else None
         self.documents = documents
-        print(f"✓ Indexados {len(documents)} documentos para búsqueda")
+        
+        if self.storage == 'float32':
+            print(f"✓ Indexados {len(documents)} documentos para búsqueda")
+        else:
+            print(f"✓ Indexados {len(documents)} documentos para búsqueda "
+                  f"({self.storage}, {self.memory_bytes() / 1e6:.1f} MB)")
     
-    def search(self, query_embedding: np.ndarray, top_k: int = 5, threshold: float = 0.3) -> List[Tuple[dict, float]]:
+    def save(self, index_dir: str = DEFAULT_INDEX_DIR):
+        """Persiste el índice actual en disco (ver save_index)"""
+        if self.embeddings is None:
+            raise ValueError("No hay embeddings float32 indexados para guardar")
+        save_index(index_dir, self.embeddings, self.documents)
+    
+    def load(self, index_dir: str = DEFAULT_INDEX_DIR, mmap: bool = True) -> bool:
         """
-        Busca documentos más similares a la consulta
+        Carga un índice persistido por save_index
+        
+        Args:
+            index_dir: Directorio del índice
+            mmap: Si True, la matriz de embeddings se mapea en memoria (solo lectura)
+                  en lugar de copiarse; el SO carga las páginas bajo demanda
+            
+        Returns:
+            True si se cargó el índice, False si no existe o está incompleto
+        """
+        index_path = Path(index_dir)
+        emb_file = index_path / EMBEDDINGS_FILE
+        meta_file = index_path / METADATA_FILE
+        
+        if not emb_file.exists() or not meta_file.exists():
+            print(f"⚠ No se encontró índice local en {index_path}")
+            return False
+        
+        embeddings = np.load(emb_file, mmap_mode='r' if mmap else None)
+        documents = load_documents(index_path)
+        
+        if len(embeddings) != len(documents):
+            print(f"⚠ Índice local inconsistente: {len(embeddings)} embeddings vs {len(documents)} chunks")
+            return False
+        
+        self.add_documents(embeddings, documents)
+        return True
+    
+    def _similarities(self, query_embeddings: np.ndarray) -> np.ndarray:
+        """
+        Puntúa consultas contra todo el corpus con la matriz de búsqueda
+        
+        Para float16/int8 el corpus se decuantiza por bloques de SCORE_BLOCK_ROWS
+        filas, de modo que la memoria temporal no depende del tamaño del corpus.
+        La escala int8 se aplica sobre los scores (n_docs), no sobre la matriz.
+        
+        Args:
+            query_embeddings: Array (n_queries x embedding_dim)
+            
+        Returns:
+            Array de scores (n_queries x n_docs)
+        """
+        query_embeddings = np.asarray(query_embeddings, dtype=np.float32)
+        if self.storage == 'float32':
+            # Como los embeddings están normalizados, el producto punto = similitud coseno
+            return np.dot(query_embeddings, self.codes.T)
+        
+        n_docs = len(self.codes)
+        similarities = np.empty((len(query_embeddings), n_docs), dtype=np.float32)
+        for start in range(0, n_docs, self.SCORE_BLOCK_ROWS):
+            block = self.codes[start:start + self.SCORE_BLOCK_ROWS].astype(np.float32)
+            similarities[:, start:start + len(block)] = np.dot(query_embeddings, block.T)
+        if self.scales is not None:
+            similarities *= self.scales
+        return similarities
+    
+    def _select(self, similarities: np.ndarray, query_embedding: np.ndarray,
+                top_k: int, threshold: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Selecciona top_k, re-puntuando con float32 si el índice es compacto"""
+        if self.storage == 'float32' or self.rerank_factor <= 0:
+            return select_top_k(similarities, top_k, threshold)
+        
+        candidates, _ = select_top_k(similarities, top_k * self.rerank_factor,
+                                     threshold - self.RERANK_THRESHOLD_SLACK)
+        if candidates.size == 0:
+            return candidates, np.empty(0, dtype=np.float32)
+        
+        # Solo se leen las filas candidatas del float32 original (mmap: páginas bajo
+        # demanda); ordenarlas hace la lectura secuencial sobre el archivo
+        candidates = np.sort(candidates)
+        exact = np.dot(np.asarray(self.embeddings[candidates], dtype=np.float32), query_embedding)
+        order, scores = select_top_k(exact, top_k, threshold)
+        return candidates[order], scores
+    
+    def search_top_k(self, query_embedding: np.ndarray, top_k: int = 5, threshold: float = 0.3) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Busca los documentos más similares y retorna arrays numpy
         
         Args:
             query_embedding: Embedding de la consulta
@@ -35,26 +334,76 @@ class SimilaritySearch:
             threshold: Umbral mínimo de similitud (0-1)
             
         Returns:
-            Lista de tuplas (documento, score) ordenadas por similitud
+            Tupla (índices, scores) ordenados por similitud descendente
         """
-        if self.embeddings is None:
-            return []
+        if self.codes is None:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32)
         
-        # Calcular similitud del coseno con todos los documentos
-        # Como los embeddings están normalizados, el producto punto = similitud coseno
-        similarities = np.dot(self.embeddings, query_embedding)
+        query_embedding = np.asarray(query_embedding, dtype=np.float32)
+        similarities = self._similarities(query_embedding[np.newaxis, :])[0]
+        return self._select(similarities, query_embedding, top_k, threshold)
+    
+    def search_top_k_batch(self, query_embeddings: np.ndarray, top_k: int = 5, threshold: float = 0.3,
+                           block_size: int = 256) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Busca los documentos más similares para varias consultas a la vez
         
-        # Obtener índices de los top_k más similares
-        top_indices = np.argsort(similarities)[::-1][:top_k]
+        Las consultas se puntúan con un único producto matriz-matriz por bloque
+        (block_size consultas x n_docs), lo que acota la memoria temporal.
         
-        # Filtrar por umbral y preparar resultados
-        results = []
-        for idx in top_indices:
-            score = similarities[idx]
-            if score >= threshold:
-                results.append((self.documents[idx], float(score)))
+        Args:
+            query_embeddings: Array de embeddings de consultas (n_queries x embedding_dim)
+            top_k: Número de resultados por consulta
+            threshold: Umbral mínimo de similitud (0-1)
+            block_size: Consultas puntuadas por cada producto matricial
+            
+        Returns:
+            Lista (una entrada por consulta) de tuplas (índices, scores)
+        """
+        query_embeddings = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        if self.codes is None:
+            empty = (np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32))
+            return [empty for _ in range(len(query_embeddings))]
         
+        results = []
+        for start in range(0, len(query_embeddings), block_size):
+            block = query_embeddings[start:start + block_size]
+            similarities = self._similarities(block)  # (bloque x n_docs)
+            for query_embedding, row in zip(block, similarities):
+                results.append(self._select(row, query_embedding, top_k, threshold))
         return results
+    
+    def search_batch(self, query_embeddings: np.ndarray, top_k: int = 5, threshold: float = 0.3) -> List[List[Tuple[dict, float]]]:
+        """
+        Versión por lotes de search()
+        
+        Args:
+            query_embeddings: Array de embeddings de consultas (n_queries x embedding_dim)
+            top_k: Número de resultados por consulta
+            threshold: Umbral mínimo de similitud (0-1)
+            
+        Returns:
+            Lista (una entrada por consulta) de listas de tuplas (documento, score)
+        """
+        return [
+            [(self.documents[idx], float(score)) for idx, score in zip(indices, scores)]
+            for indices, scores in self.search_top_k_batch(query_embeddings, top_k, threshold)
+        ]
+    
+    def search(self, query_embedding: np.ndarray, top_k: int = 5, threshold: float = 0.3) -> List[Tuple[dict, float]]:
+        """
+        Busca documentos más similares a la consulta
+        
+        Args:
+            query_embedding: Embedding de la consulta
+            top_k: Número de resultados a retornar
+            threshold: Umbral mínimo de similitud (0-1)
+            
+        Returns:
+            Lista de tuplas (documento, score) ordenadas por similitud
+        """
+        indices, scores = self.search_top_k(query_embedding, top_k, threshold)
+        return [(self.documents[idx], float(score)) for idx, score in zip(indices, scores)]
 
 
 if __name__ == "__main__":
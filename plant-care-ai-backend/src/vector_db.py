@@ -3,13 +3,48 @@ Módulo de Base de Datos Vectorial
 Integración con Supabase usando pgvector
 """
 import os
-from typing import List, Tuple, Optional
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple, Optional, Iterator
 import numpy as np
 from supabase import create_client, Client
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Parámetros de carga masiva (insert/upsert por lotes)
+BULK_MAX_BATCH_BYTES = int(os.getenv("SUPABASE_BATCH_BYTES", str(2 * 1024 * 1024)))
+BULK_MAX_BATCH_ROWS = int(os.getenv("SUPABASE_BATCH_ROWS", "500"))
+BULK_WORKERS = int(os.getenv("SUPABASE_UPLOAD_WORKERS", "4"))
+BULK_MAX_RETRIES = 3
+# Bytes JSON fijos por registro además del texto y los valores (claves, comillas, chunk_index)
+RECORD_OVERHEAD_BYTES = 96
+
+
+def record_size(record: dict) -> int:
+    """
+    Tamaño aproximado en bytes del registro serializado en JSON, sin serializarlo
+    
+    El literal del embedding es ASCII; el texto se cuenta en UTF-8 con un margen para
+    los escapes (comillas, saltos de línea). Basta para acotar el tamaño del lote.
+    """
+    text = record['text']
+    escapes = text.count('\n') + text.count('"') + text.count('\\')
+    return (len(text.encode('utf-8')) + escapes + len(record['embedding']) + len(record['chunk_id'])
+            + len(record['source_file'].encode('utf-8')) + RECORD_OVERHEAD_BYTES)
+
+
+def vector_literal(embedding: np.ndarray, precision: int = 6) -> str:
+    """
+    Serializa un embedding como literal de texto de pgvector: '[0.1,0.2,...]'
+    
+    Con 6 cifras significativas ocupa cerca de la mitad que la lista JSON de
+    floats (que usa 17 cifras) y pgvector lo almacena igual en float32.
+    """
+    return '[' + ','.join(f'{x:.{precision}g}' for x in np.asarray(embedding, dtype=np.float32).tolist()) + ']'
+
 
 class SupabaseVectorDB:
     """Base de datos vectorial usando Supabase con pgvector"""
@@ -52,6 +87,100 @@ class SupabaseVectorDB:
         print("⚠ Ejecuta el SQL de creación de tabla en el SQL Editor de Supabase")
         print("Ver comentarios en el código para el SQL necesario")
     
+    def _build_record(self, chunk: dict, embedding: np.ndarray) -> dict:
+        """Construye el registro de plant_documents para un chunk"""
+        return {
+            'chunk_id': chunk['chunk_id'],
+            'source_file': chunk['source_file'],
+            'chunk_index': chunk['chunk_index'],
+            'text': chunk['text'],
+            'embedding': vector_literal(embedding)
+        }
+    
+    def _iter_batches(self, chunks: List[dict], embeddings: np.ndarray) -> Iterator[Tuple[List[dict], int]]:
+        """
+        Agrupa registros en lotes acotados por tamaño en bytes y por número de filas
+        
+        Los registros se construyen a medida que se consumen los lotes, así en memoria
+        solo viven los lotes en vuelo y no la carga completa serializada.
+        """
+        batch = []
+        batch_bytes = 0
+        for chunk, embedding in zip(chunks, embeddings):
+            record = self._build_record(chunk, embedding)
+            record_bytes = record_size(record)
+            if batch and (batch_bytes + record_bytes > BULK_MAX_BATCH_BYTES or len(batch) >= BULK_MAX_BATCH_ROWS):
+                yield batch, batch_bytes
+                batch = []
+                batch_bytes = 0
+            batch.append(record)
+            batch_bytes += record_bytes
+        if batch:
+            yield batch, batch_bytes
+    
+    def _write_batch(self, records: List[dict], upsert: bool):
+        """Envía un lote con reintentos (backoff exponencial con jitter)"""
+        for attempt in range(BULK_MAX_RETRIES + 1):
+            try:
+                table = self.client.table('plant_documents')
+                if upsert:
+                    return table.upsert(records, on_conflict='chunk_id').execute()
+                return table.insert(records).execute()
+            except Exception as e:
+                if attempt == BULK_MAX_RETRIES:
+                    raise
+                delay = (2 ** attempt) * 0.5 + random.uniform(0, 0.25)
+                print(f"⚠ Error enviando lote de {len(records)} chunks ({e}), reintentando en {delay:.1f}s...")
+                time.sleep(delay)
+    
+    def _bulk_write(self, chunks: List[dict], embeddings: np.ndarray, upsert: bool = False) -> int:
+        """
+        Carga masiva: lotes por tamaño, enviados en paralelo con un pool de hilos acotado
+        
+        Returns:
+            Número de filas escritas
+        """
+        if len(chunks) != len(embeddings):
+            raise ValueError(f"Chunks ({len(chunks)}) y embeddings ({len(embeddings)}) no coinciden")
+        
+        start = time.perf_counter()
+        rows_written = 0
+        bytes_written = 0
+        # Como mucho 2 lotes por hilo en vuelo: memoria acotada aunque el corpus sea enorme
+        in_flight = threading.BoundedSemaphore(BULK_WORKERS * 2)
+        futures = []
+        
+        def send(records, n_bytes):
+            try:
+                self._write_batch(records, upsert)
+                return len(records), n_bytes
+            finally:
+                in_flight.release()
+        
+        with ThreadPoolExecutor(max_workers=BULK_WORKERS) as pool:
+            for records, n_bytes in self._iter_batches(chunks, embeddings):
+                in_flight.acquire()
+                futures.append(pool.submit(send, records, n_bytes))
+                # Recoger los lotes terminados para no acumular futuros con resultados
+                pending = []
+                for future in futures:
+                    if future.done():
+                        rows, n = future.result()
+                        rows_written += rows
+                        bytes_written += n
+                    else:
+                        pending.append(future)
+                futures = pending
+            for future in futures:
+                rows, n = future.result()
+                rows_written += rows
+                bytes_written += n
+        
+        elapsed = max(time.perf_counter() - start, 1e-9)
+        print(f"  Carga masiva: {rows_written} filas, {bytes_written / 1e6:.1f} MB en {elapsed:.1f}s "
+              f"({rows_written / elapsed:.0f} filas/s, {bytes_written / 1e6 / elapsed:.2f} MB/s)")
+        return rows_written
+    
     def insert_chunks(self, chunks: List[dict], embeddings: np.ndarray):
         """
         Inserta chunks con sus embeddings en Supabase
@@ -60,21 +189,54 @@ class SupabaseVectorDB:
             chunks: Lista de chunks con metadata
             embeddings: Array de embeddings correspondientes
         """
-        records = []
-        for chunk, embedding in zip(chunks, embeddings):
-            record = {
-                'chunk_id': chunk['chunk_id'],
-                'source_file': chunk['source_file'],
-                'chunk_index': chunk['chunk_index'],
-                'text': chunk['text'],
-                'embedding': embedding.tolist()  # Convertir a lista para JSON
-            }
-            records.append(record)
-        
-        # Insertar en batch
-        result = self.client.table('plant_documents').insert(records).execute()
-        print(f"✓ Insertados {len(records)} chunks en Supabase")
-        return result
+        rows = self._bulk_write(chunks, embeddings)
+        print(f"✓ Insertados {rows} chunks en Supabase")
+        return rows
+    
+    def upsert_chunks(self, chunks: List[dict], embeddings: np.ndarray):
+        """
+        Inserta o actualiza chunks por chunk_id (reindexación incremental)
+        
+        Args:
+            chunks: Lista de chunks con metadata
+            embeddings: Array de embeddings correspondientes
+        """
+        if not chunks:
+            return 0
+        rows = self._bulk_write(chunks, embeddings, upsert=True)
+        print(f"✓ Actualizados {rows} chunks en Supabase")
+        return rows
+    
+    def list_chunk_ids(self, page_size: int = 1000) -> List[str]:
+        """
+        chunk_id de todas las filas de la tabla (paginado)
+        
+        Args:
+            page_size: Filas por petición
+        """
+        chunk_ids = []
+        start = 0
+        while True:
+            rows = self.client.table('plant_documents').select('chunk_id') \
+                .range(start, start + page_size - 1).execute().data
+            chunk_ids.extend(row['chunk_id'] for row in rows if row.get('chunk_id'))
+            if len(rows) < page_size:
+                return chunk_ids
+            start += page_size
+    
+    def delete_chunks(self, chunk_ids: List[str], batch_size: int = 200):
+        """
+        Borra chunks por chunk_id (en lotes para no exceder el largo de la URL)
+        
+        Args:
+            chunk_ids: IDs de los chunks a borrar
+            batch_size: IDs por petición
+        """
+        for start in range(0, len(chunk_ids), batch_size):
+            batch = chunk_ids[start:start + batch_size]
+            self.client.table('plant_documents').delete().in_('chunk_id', batch).execute()
+        if chunk_ids:
+            print(f"✓ Borrados {len(chunk_ids)} chunks huérfanos de Supabase")
     
     def search_similar(self, query_embedding: np.ndarray, top_k: int = 5, threshold: float = 0.3) -> List[Tuple[dict, float]]:
         """
@@ -29,6 +29,10 @@ comment on column plant_documents.embedding is 'Embedding de 384 dimensiones (al
 -- ================================================
 -- PASO 3: Crear índice vectorial para búsqueda rápida
 -- ================================================
+-- lists debe crecer con el corpus (pgvector recomienda ~filas/1000 hasta 1M
+-- filas y ~sqrt(filas) por encima). Con pocas filas, 100 listas dejan la
+-- mayoría casi vacías: crea el índice después de cargar los datos y ajusta
+-- las listas exploradas por consulta con: set ivfflat.probes = 10;
 create index on plant_documents 
 using ivfflat (embedding vector_cosine_ops)
 with (lists = 100);
@@ -0,0 +1,92 @@
+"""
+Pruebas de salida esperada (golden) del sanitizador de respuestas del chat
+Cada caso es una respuesta típica del LLM y el texto exacto que debe llegar al usuario
+"""
+import sys
+sys.path.append('src')
+
+from sanitizador import ResponseSanitizer, sanitize_response, has_markdown
+
+GOLDEN_CASES = [
+    # Respuesta limpia: se conserva tal cual, con sus párrafos
+    ('Las suculentas necesitan poca agua. Riega solo cuando el sustrato esté seco por completo.\n\nColócalas cerca de una ventana luminosa. ¿Tienen agujeros de drenaje tus macetas?',
+     'Las suculentas necesitan poca agua. Riega solo cuando el sustrato esté seco por completo.\n\nColócalas cerca de una ventana luminosa. ¿Tienen agujeros de drenaje tus macetas?'),
+    # Encabezados markdown
+    ('## Riego\nRiega una vez por semana en verano y cada dos semanas en invierno.\n\n### Luz\nNecesita luz brillante indirecta durante al menos seis horas al día.',
+     'Riego\nRiega una vez por semana en verano y cada dos semanas en invierno.\n\nNecesita luz brillante indirecta durante al menos seis horas al día.'),
+    # Frases genéricas al principio de la línea
+    ('Basándome en la información disponible, el helecho prefiere la humedad alta y la sombra parcial.\nSegún los documentos: conviene pulverizar sus hojas a diario en verano.',
+     'El helecho prefiere la humedad alta y la sombra parcial.\nConviene pulverizar sus hojas a diario en verano.'),
+    # Las mismas palabras en minúscula son texto normal
+    ('Riega de acuerdo a la estación: el riego profundo y espaciado tiene muchas ventajas para las raíces.',
+     'Riega de acuerdo a la estación: el riego profundo y espaciado tiene muchas ventajas para las raíces.'),
+    # Título de documento y el bloque técnico que abre
+    ('Cuidado de Suculentas Descripción General las suculentas almacenan agua\nVentajas:\n- Fácil de cuidar\n- Tolera la sequía\n\nLa clave es no regar en exceso y darle mucha luz directa por la mañana.',
+     'Las suculentas almacenan agua\n\nLa clave es no regar en exceso y darle mucha luz directa por la mañana.'),
+    # Pasos numerados sin contenido sustancial
+    ('Para trasplantar tu cactus sigue estos pasos:\n1. Usa guantes gruesos o papel de periódico doblado.\n2. Riega.\n3. Coloca la planta en una maceta algo más grande con sustrato para cactus.',
+     'Para trasplantar tu cactus sigue estos pasos:\n1. Usa guantes gruesos o papel de periódico doblado.\n3. Coloca la planta en una maceta algo más grande con sustrato para cactus.'),
+    # Puntos suspensivos y respuesta cortada
+    ('El bonsái necesita riego frecuente pero sin encharcar el sustrato...\nPoda las ramas nuevas en primavera para mantener la forma',
+     'El bonsái necesita riego frecuente pero sin encharcar el sustrato\nPoda las ramas nuevas en primavera para mantener la forma.'),
+    # Fragmentos técnicos copiados de los documentos
+    ('Corte limpio horizontal ambos 2 extremos.\nQuemaduras solares\nSi ves manchas marrones en las hojas, aleja la planta del sol directo de la tarde. Sacar de maceta con cuidado.',
+     'Si ves manchas marrones en las hojas, aleja la planta del sol directo de la tarde.'),
+    # Párrafo con varios temas de documentos
+    ('Problemas Comunes\n- Exceso de riego\n- Falta de luz\n\nHojas blandas y amarillas aparecen con Quemaduras solares también frecuentes.\n\nMantén la tierra apenas húmeda.',
+     'Mantén la tierra apenas húmeda.'),
+    # Títulos en mayúsculas y saltos de línea de más
+    ('RIEGO\nRiega por la mañana para que las hojas se sequen antes de la noche.\n\n\n\nEvita mojar las flores de la orquídea.',
+     'Riega por la mañana para que las hojas se sequen antes de la noche.\n\nEvita mojar las flores de la orquídea.'),
+    # Línea larga (en streaming se emite por partes antes de completarse)
+    ('Basándome en la información disponible, las suculentas son plantas muy resistentes que almacenan agua en sus hojas y tallos, por eso toleran bien la sequía y los descuidos ocasionales.\n\n## Riego\nRiega poco y solo con la tierra seca',
+     'Las suculentas son plantas muy resistentes que almacenan agua en sus hojas y tallos, por eso toleran bien la sequía y los descuidos ocasionales.\n\nRiego\nRiega poco y solo con la tierra seca.'),
+    # No se añade punto tras un emoji
+    ('¡Claro! Tu potus crecerá bien con luz indirecta y riego moderado 🌱',
+     '¡Claro! Tu potus crecerá bien con luz indirecta y riego moderado 🌱'),
+]
+
+
+def test_golden_outputs():
+    """Cada respuesta de ejemplo produce exactamente el texto esperado"""
+    for i, (raw, expected) in enumerate(GOLDEN_CASES, 1):
+        result = sanitize_response(raw)
+        assert result == expected, f"Caso {i}:\n  esperado: {expected!r}\n  obtenido: {result!r}"
+        print(f"✅ Caso {i}")
+
+
+def test_streaming_matches_batch():
+    """La respuesta troceada (streaming) produce exactamente el mismo texto"""
+    for i, (raw, expected) in enumerate(GOLDEN_CASES, 1):
+        for size in (1, 7, 64):
+            sanitizer = ResponseSanitizer()
+            pieces = [sanitizer.feed(raw[start:start + size]) for start in range(0, len(raw), size)]
+            result = ''.join(pieces) + sanitizer.finish()
+            assert result == expected, f"Caso {i} en trozos de {size}:\n  esperado: {expected!r}\n  obtenido: {result!r}"
+    print("✅ Streaming igual que la respuesta completa")
+
+
+def test_has_markdown():
+    """Detección de encabezados markdown"""
+    assert has_markdown("## Riego\nRiega poco")
+    assert has_markdown("Texto\n### Luz")
+    assert not has_markdown("Maceta #3 con riego semanal")
+    print("✅ Detección de markdown")
+
+
+def test_empty_response():
+    """Respuestas vacías o solo con ruido no fallan"""
+    assert sanitize_response("") == ""
+    assert sanitize_response("## \n...\n- \n1.") == ""
+    print("✅ Respuestas vacías")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("🧪 PRUEBA: Sanitizador de respuestas del chat")
+    print("=" * 60)
+    test_golden_outputs()
+    test_streaming_matches_batch()
+    test_has_markdown()
+    test_empty_response()
+    print("\n✅ Todas las pruebas pasaron")
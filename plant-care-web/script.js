@@ -752,7 +752,41 @@ function showToast(message, type = 'info') {
     }, 3000);
 }
 
+// Burbuja del asistente vacía que se rellena mientras llega la respuesta
+// (el mensaje se añade a chatHistory al terminar)
+function addStreamingAssistantMessage() {
+    const chatContainer = document.getElementById('chatContainer');
+    const welcomeMessage = chatContainer.querySelector('.welcome-message');
+    
+    if (welcomeMessage) {
+        welcomeMessage.remove();
+    }
+    
+    const messageDiv = document.createElement('div');
+    messageDiv.className = 'chat-message message-assistant';
+    const messageBubble = document.createElement('div');
+    messageBubble.className = 'message-bubble';
+    messageDiv.appendChild(messageBubble);
+    chatContainer.appendChild(messageDiv);
+    return messageBubble;
+}
+
+// Convierte un bloque "event: x\ndata: {...}" en { type, data }
+function parseSseEvent(block) {
+    let type = 'message';
+    const dataLines = [];
+    for (const line of block.split('\n')) {
+        if (line.startsWith('event:')) {
+            type = line.slice(6).trim();
+        } else if (line.startsWith('data:')) {
+            dataLines.push(line.slice(5).trim());
+        }
+    }
+    return { type, data: dataLines.length ? JSON.parse(dataLines.join('\n')) : {} };
+}
+
 // Chat with Agent (Text-based RAG)
+// La respuesta llega por server-sent events y se va pintando según se genera
 async function chatWithAgent(message) {
     addLoadingMessage();
     
@@ -763,7 +797,7 @@ async function chatWithAgent(message) {
             content: msg.content
         }));
         
-        const response = await fetch(`${API_BASE_URL}/api/chat`, {
+        const response = await fetch(`${API_BASE_URL}/api/chat/stream`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -778,13 +812,47 @@ async function chatWithAgent(message) {
             throw new Error(`Error: ${response.status}`);
         }
         
-        const result = await response.json();
-        removeLoadingMessage();
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let text = '';
+        let bubble = null;
         
-        if (result.success) {
-            addAssistantMessage(result.response);
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) {
+                break;
+            }
+            buffer += decoder.decode(value, { stream: true });
+            
+            // Los eventos SSE terminan en una línea en blanco
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const event = parseSseEvent(buffer.slice(0, boundary));
+                buffer = buffer.slice(boundary + 2);
+                
+                if (event.type === 'token') {
+                    text += event.data.text;
+                    if (!bubble) {
+                        removeLoadingMessage();
+                        bubble = addStreamingAssistantMessage();
+                    }
+                    bubble.innerHTML = formatMessage(text);
+                    scrollChatToBottom();
+                } else if (event.type === 'done') {
+                    text = event.data.response;
+                } else if (event.type === 'error') {
+                    throw new Error(event.data.message || 'Error en la respuesta');
+                }
+            }
+        }
+        
+        if (bubble) {
+            bubble.innerHTML = formatMessage(text);
+            chatHistory.push({ role: 'assistant', content: text, image: null });
         } else {
-            throw new Error(result.error || 'Error en la respuesta');
+            removeLoadingMessage();
+            addAssistantMessage(text);
         }
         
     } catch (error) {